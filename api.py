@@ -1,66 +1,480 @@
-from fastapi import FastAPI
+import asyncio
+import json
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Callable, List, Optional, Tuple
+
+import httpx
+from fastapi import FastAPI, HTTPException, Query, Response
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from praw.exceptions import PRAWException
+from prawcore.exceptions import PrawcoreException
 
 from src.aws_blog_source import AwsBlogSource
-from src.hn_source import HackerNewsSource
+from src.cache import create_cache_from_env
+from src.dedup import Deduplicator
+from src.feeds import feed_cache
+from src.hn_source import HackerNewsSource, item_cache
+from src.metrics import CallbackMetric, registry, track_fetch
 from src.medium_source import MediumSource
+from src.models import Result, Source, results_to_ndjson
+from src.poller import FeedPoller, PolledFeed, SharedSnapshots
 from src.reddit_source import RedditSource
+from src.single_flight import SingleFlight
+from src.specs import create_source_from_spec
+from src.store import SEARCH_ORDERS, ArticleStore
+from src.timeline import DEFAULT_TIMELINE_SIZE, RANKINGS, top_k
+from src.upstream import CircuitOpenError, upstreams
+
+cache = create_cache_from_env()
+single_flight = SingleFlight()
+
+# Errors of the upstreams themselves, which fall back to the expired cache:
+# open circuits, httpx's errors and those of praw, which Reddit goes through
+UPSTREAM_ERRORS = (CircuitOpenError, httpx.HTTPError, PrawcoreException,
+                   PRAWException)
+
+
+def create_store_from_env() -> Optional[ArticleStore]:
+    """
+    Article store at FUSE_STORE_PATH, which every fetch is recorded in and
+    /search queries. Workers, and CLI runs given the same path, share it.
+    """
+    path = os.environ.get('FUSE_STORE_PATH')
+    return ArticleStore(path) if path else None
 
-app = FastAPI()
 
+# Opened on startup rather than on import: gunicorn imports a preloaded app
+# before forking the workers, which must not share a SQLite connection
+store: Optional[ArticleStore] = None
 
-def get_results_dict(source):
+
+def get_results_dict(results: List[Result], detailed: bool = False):
+    if detailed:
+        return {
+            'posts': [result.to_dict() for result in results]
+        }
     return {
         'posts': {
-            result.title: result.url for result in source.results
+            result.title: result.url for result in results
         }
     }
 
 
+def log_indexing_error(future: asyncio.Future) -> None:
+    if not future.cancelled() and future.exception() is not None:
+        logging.error("indexing fetched results failed: %r",
+                      future.exception())
+
+
+def index_results(results: List[Result]) -> None:
+    """
+    Records freshly fetched results in the article store, on a worker thread
+    so that requests don't wait on SQLite
+    """
+    if store is None or not results:
+        return
+    future = asyncio.get_running_loop().run_in_executor(None, store.record,
+                                                        list(results))
+    future.add_done_callback(log_indexing_error)
+
+
+def set_age_header(response: Response, age: float) -> None:
+    """
+    Reports how old the served results are, in seconds
+    """
+    response.headers['Age'] = str(int(age))
+
+
+async def fetch_cached(source_type: str, params: Tuple[str, ...],
+                       limit: int,
+                       create_source: Callable[[], Source]) -> \
+        Tuple[List[Result], float]:
+    """
+    Returns the results and their age in seconds.
+    Polled feeds are served from their latest snapshot however old it is,
+    the poller keeps revalidating them in the background. Otherwise cached
+    results are returned when possible, or fetched from the source and
+    cached. Concurrent identical fetches share a single upstream call.
+    While the upstream's circuit is open we fail fast, serving expired
+    cached results if there are any, as we do when the upstream fails.
+    """
+    snapshot = await poller.get_async(source_type, params, limit)
+    if snapshot is not None:
+        return snapshot.results[:max(limit, 0)], snapshot.age
+
+    results = await cache.get_async(source_type, params, limit)
+    if results is not None:
+        return results, cache.age(source_type, params)
+
+    async def fetch_and_cache() -> List[Result]:
+        source = create_source()
+        with track_fetch(source):
+            await source.fetch_async()
+        if source.results:
+            await cache.set_async(source_type, params, limit,
+                                  source.results)
+            index_results(source.results)
+        return source.results
+
+    try:
+        results = await single_flight.do((source_type, params, limit),
+                                         fetch_and_cache)
+    except UPSTREAM_ERRORS as e:
+        results = cache.get_stale(source_type, params, limit)
+        if results is None:
+            status = 503 if isinstance(e, CircuitOpenError) else 502
+            raise HTTPException(status_code=status, detail=str(e) or repr(e))
+        return results, cache.age(source_type, params)
+    return results, 0.0
+
+
+def create_poller_from_env() -> FeedPoller:
+    """
+    Creates the poller of the feeds listed in FUSE_POLL_FEEDS, a comma
+    separated list of `<source spec>@<interval seconds>` such as
+    `hn:top@60,medium:python@300`. Feeds are polled with FUSE_POLL_LIMIT
+    results. Setting FUSE_SNAPSHOTS_PATH to a file path shares the polled
+    snapshots between all processes using that path, so that each feed is
+    polled by one of them at a time.
+    """
+    limit = int(os.environ.get('FUSE_POLL_LIMIT', 30))
+    feeds = []
+    for item in os.environ.get('FUSE_POLL_FEEDS', '').split(','):
+        if not item.strip():
+            continue
+        spec, _, interval = item.strip().partition('@')
+        source_type, params, factory = create_source_from_spec(spec, limit)
+        feeds.append(PolledFeed(source_type, params, limit,
+                                float(interval or 60), factory))
+    path = os.environ.get('FUSE_SNAPSHOTS_PATH')
+    return FeedPoller(feeds, on_refresh=index_results,
+                      shared=SharedSnapshots(path) if path else None)
+
+
+poller = create_poller_from_env()
+
+
+def register_cache_metrics() -> None:
+    """
+    Exposes the counters the caches keep anyway, read when /metrics is
+    scraped rather than updated on the hot path
+    """
+    def cache_lookups():
+        return {
+            ('results', 'hit'): cache.hits,
+            ('results', 'miss'): cache.misses,
+            ('feeds', 'hit'): feed_cache.hits,
+            ('feeds', 'miss'): feed_cache.misses,
+            ('hackernews_items', 'hit'): item_cache.hits,
+            ('hackernews_items', 'miss'): item_cache.misses,
+        }
+
+    def single_flight_calls():
+        stats = single_flight.stats()
+        return {('executed',): stats['executions'],
+                ('collapsed',): stats['collapsed']}
+
+    def circuits_open():
+        return {(host,): int(stats['circuit'] != 'closed')
+                for host, stats in upstreams.to_dict().items()}
+
+    registry.register(CallbackMetric(
+        'fuse_cache_lookups_total', "Cache lookups by cache and outcome",
+        ('cache', 'result'), cache_lookups, 'counter'))
+    registry.register(CallbackMetric(
+        'fuse_cache_bytes', "Estimated size of the results cache", (),
+        lambda: {(): cache.size}))
+    registry.register(CallbackMetric(
+        'fuse_single_flight_calls_total',
+        "Fetches executed, and fetches collapsed into one already running",
+        ('outcome',), single_flight_calls, 'counter'))
+    registry.register(CallbackMetric(
+        'fuse_upstream_circuit_open', "Whether the host's circuit is open",
+        ('host',), circuits_open))
+    registry.register(CallbackMetric(
+        'fuse_poller_snapshots', "Feeds with a polled snapshot", (),
+        lambda: {(): len(poller.snapshots)}))
+
+
+register_cache_metrics()
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    global store
+    if store is None:
+        store = create_store_from_env()
+    poller.start()
+    yield
+    await poller.stop()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
 @app.get('/')
-def root():
+async def root():
     return {}
 
 
+@app.get('/stats')
+async def get_stats():
+    return {
+        'cache': {
+            'hits': cache.hits,
+            'misses': cache.misses,
+            'entries': len(cache.entries),
+            'bytes': cache.size,
+        },
+        'single_flight': single_flight.stats(),
+        'feeds': feed_cache.stats(),
+        'poller': poller.stats(),
+        'upstreams': upstreams.to_dict(),
+    }
+
+
+@app.get('/metrics', response_class=PlainTextResponse)
+async def get_metrics():
+    return PlainTextResponse(registry.render(),
+                             media_type='text/plain; version=0.0.4')
+
+
+@app.get('/search')
+async def search_posts(q: str, limit: int = 20, source: Optional[str] = None,
+                       order: str = 'relevance'):
+    """
+    Searches the titles, URLs and authors of every post fetched so far,
+    without calling upstream. `order` is relevance or recent, `source`
+    restricts the search to one source (hackernews, reddit, medium, aws).
+    """
+    if store is None:
+        raise HTTPException(status_code=503,
+                            detail="search is disabled, set FUSE_STORE_PATH")
+    if order not in SEARCH_ORDERS:
+        raise HTTPException(status_code=400,
+                            detail=f"order should be one of {SEARCH_ORDERS}")
+
+    start = time.perf_counter()
+    results = await asyncio.get_running_loop().run_in_executor(
+        None, store.search, q, limit, source, order)
+    return {
+        'elapsed_ms': round((time.perf_counter() - start) * 1000, 1),
+        'posts': [result.to_dict() for result in results],
+    }
+
+
 @app.get('/reddit/{subreddit}/{metric}')
-def get_reddit_posts(subreddit: str, metric: str, limit: int = 10):
-    reddit = RedditSource(
-        subreddit=subreddit,
-        metric=metric,
-        limit=limit
-    )
-    reddit.fetch()
+async def get_reddit_posts(subreddit: str, metric: str, response: Response,
+                           limit: int = 10, detailed: bool = False):
+    results, age = await fetch_cached(
+        'reddit', (subreddit, metric), limit,
+        lambda: RedditSource(
+            subreddit=subreddit,
+            metric=metric,
+            limit=limit
+        ))
 
-    return get_results_dict(reddit)
+    set_age_header(response, age)
+    return get_results_dict(results, detailed)
 
 
 @app.get('/medium/{tag}')
-def get_medium_posts(tag: str, limit: int = 10):
-    medium = MediumSource(
-        tag=tag,
-        limit=limit
-    )
-    medium.fetch()
+async def get_medium_posts(tag: str, response: Response, limit: int = 10,
+                           detailed: bool = False):
+    results, age = await fetch_cached(
+        'medium', (tag,), limit,
+        lambda: MediumSource(
+            tag=tag,
+            limit=limit
+        ))
 
-    return get_results_dict(medium)
+    set_age_header(response, age)
+    return get_results_dict(results, detailed)
 
 
 @app.get('/hackernews/{metric}')
-def get_hackernews_posts(metric: str, limit: int = 10):
-    hackernews = HackerNewsSource(
-        metric=metric,
-        limit=limit
-    )
-    hackernews.fetch()
+async def get_hackernews_posts(metric: str, response: Response,
+                               limit: int = 10, detailed: bool = False):
+    results, age = await fetch_cached(
+        'hackernews', (metric,), limit,
+        lambda: HackerNewsSource(
+            metric=metric,
+            limit=limit,
+            incremental=True
+        ))
 
-    return get_results_dict(hackernews)
+    set_age_header(response, age)
+    return get_results_dict(results, detailed)
 
 
 @app.get('/aws/{category}')
-def get_aws_posts(category: str, limit: int = 10):
-    aws = AwsBlogSource(
-        category=category,
-        limit=limit
-    )
-    aws.fetch()
-
-    return get_results_dict(aws)
+async def get_aws_posts(category: str, response: Response, limit: int = 10,
+                        detailed: bool = False):
+    results, age = await fetch_cached(
+        'aws', (category,), limit,
+        lambda: AwsBlogSource(
+            category=category,
+            limit=limit
+        ))
+
+    set_age_header(response, age)
+    return get_results_dict(results, detailed)
+
+
+@app.get('/aggregate')
+async def get_aggregated_posts(sources: List[str] = Query(...),
+                               limit: int = 10, budget: float = 5.0,
+                               dedup: bool = False, detailed: bool = False):
+    """
+    Fetches every source spec concurrently within a `budget` of seconds.
+    Sources that fail or don't make it in time are reported with their
+    status, the others are returned as usual. With `dedup`, posts already
+    returned by an earlier source are left out.
+    """
+    try:
+        parsed = [create_source_from_spec(spec, limit) for spec in sources]
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    start = time.perf_counter()
+    timings = [budget] * len(parsed)
+
+    async def fetch_timed(index, source_type, params, factory):
+        source_start = time.perf_counter()
+        try:
+            return await fetch_cached(source_type, params, limit, factory)
+        finally:
+            timings[index] = time.perf_counter() - source_start
+
+    tasks = [asyncio.ensure_future(fetch_timed(index, *source))
+             for index, source in enumerate(parsed)]
+    await asyncio.wait(tasks, timeout=max(budget, 0.0))
+
+    deduplicator = Deduplicator() if dedup else None
+    response = []
+    for index, (spec, task) in enumerate(zip(sources, tasks)):
+        entry = {'source': spec}
+        if not task.done():
+            # The upstream call is shared through single_flight, cancelling
+            # our wait lets it finish and populate the cache for next time.
+            task.cancel()
+            entry['status'] = 'timeout'
+        elif task.exception() is not None:
+            entry['status'] = 'error'
+            entry['error'] = repr(task.exception())
+        else:
+            results, age = task.result()
+            if deduplicator is not None:
+                results = list(deduplicator.filter(results))
+            entry['status'] = 'ok'
+            entry['age'] = round(age, 1)
+            entry.update(get_results_dict(results, detailed))
+        entry['elapsed_ms'] = round(timings[index] * 1000, 1)
+        response.append(entry)
+
+    return {
+        'elapsed_ms': round((time.perf_counter() - start) * 1000, 1),
+        'sources': response,
+    }
+
+
+@app.get('/timeline')
+async def get_timeline(sources: List[str] = Query(...), limit: int = 30,
+                       k: int = DEFAULT_TIMELINE_SIZE, rank: str = 'decayed',
+                       budget: float = 5.0, dedup: bool = True):
+    """
+    Merges the posts of every source spec into a single front page of the
+    `k` best ones by `rank` (decayed, recent or score). Each source
+    contributes up to `limit` candidates; sources that fail or miss the
+    `budget` are listed under `missing` and left out.
+    """
+    if rank not in RANKINGS:
+        raise HTTPException(status_code=400,
+                            detail=f"rank should be one of {sorted(RANKINGS)}")
+    try:
+        parsed = [create_source_from_spec(spec, limit) for spec in sources]
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    start = time.perf_counter()
+    tasks = [asyncio.ensure_future(fetch_cached(source_type, params, limit,
+                                                factory))
+             for source_type, params, factory in parsed]
+    await asyncio.wait(tasks, timeout=max(budget, 0.0))
+
+    streams = []
+    missing = []
+    for spec, task in zip(sources, tasks):
+        if not task.done():
+            task.cancel()
+            missing.append({'source': spec, 'status': 'timeout'})
+        elif task.exception() is not None:
+            missing.append({'source': spec, 'status': 'error',
+                            'error': repr(task.exception())})
+        else:
+            streams.append(task.result()[0])
+
+    posts = top_k(streams, k, RANKINGS[rank],
+                  Deduplicator() if dedup else None)
+    return {
+        'elapsed_ms': round((time.perf_counter() - start) * 1000, 1),
+        'posts': [post.to_dict() for post in posts],
+        'missing': missing,
+    }
+
+
+@app.get('/stream')
+async def stream_posts(sources: List[str] = Query(...), limit: int = 10,
+                       budget: float = 5.0, dedup: bool = False):
+    """
+    Same fan-out as /aggregate, but streamed as NDJSON: the posts of each
+    source are written as soon as that source is done, one post per line.
+    Sources that fail or miss the budget get a `{"source", "status"}` line.
+    """
+    try:
+        parsed = [create_source_from_spec(spec, limit) for spec in sources]
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def lines():
+        loop = asyncio.get_running_loop()
+        end_time = loop.time() + max(budget, 0.0)
+        deduplicator = Deduplicator() if dedup else None
+        tasks = {}
+        for spec, (source_type, params, factory) in zip(sources, parsed):
+            task = asyncio.ensure_future(
+                fetch_cached(source_type, params, limit, factory))
+            tasks[task] = spec
+        pending = set(tasks)
+
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, timeout=max(0.0, end_time - loop.time()),
+                    return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    break
+                for task in done:
+                    if task.exception() is not None:
+                        yield json.dumps({
+                            'source': tasks[task],
+                            'status': 'error',
+                            'error': repr(task.exception()),
+                        }) + '\n'
+                        continue
+                    results, _ = task.result()
+                    if deduplicator is not None:
+                        results = deduplicator.filter(results)
+                    yield ''.join(results_to_ndjson(results))
+        finally:
+            for task in pending:
+                task.cancel()
+
+        for task in pending:
+            yield json.dumps({'source': tasks[task],
+                              'status': 'timeout'}) + '\n'
+
+    return StreamingResponse(lines(), media_type='application/x-ndjson')
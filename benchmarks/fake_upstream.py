@@ -0,0 +1,262 @@
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+
+"""
+Local fake of the upstream services, replaying recorded responses with
+configurable latency and error injection.
+Fixtures are keyed by URL path, which is unique across the upstreams Fuse
+calls (`/v0/...` for HackerNews, `/feed/tag/...` for Medium, `/blogs/...` for
+AWS, `/r/...` and `/api/v1/access_token` for Reddit).
+"""
+
+# path -> (status, headers, body)
+Fixture = Tuple[int, Dict[str, str], bytes]
+
+HN_METRICS = ['top', 'best', 'new']
+MEDIUM_TAGS = ['python']
+AWS_CATEGORIES = ['security']
+REDDIT_LISTINGS = [('python', 'hot'), ('python', 'top')]
+
+RSS_HEADER = '<?xml version="1.0" encoding="UTF-8"?>' \
+             '<rss version="2.0" ' \
+             'xmlns:dc="http://purl.org/dc/elements/1.1/"><channel>' \
+             '<title>{title}</title>'
+
+
+def json_fixture(data) -> Fixture:
+    return 200, {'Content-Type': 'application/json'}, \
+        json.dumps(data).encode()
+
+
+def rss_fixture(title: str, items: int, base_url: str) -> Fixture:
+    body = RSS_HEADER.format(title=title) + ''.join(
+        f"<item><title>{title} post {i}</title>"
+        f"<link>{base_url}/{i}</link><guid>{base_url}/{i}</guid>"
+        f"<dc:creator>author {i % 20}</dc:creator>"
+        f"<pubDate>Mon, 04 Jan 2021 10:{i % 60:02d}:00 GMT</pubDate>"
+        f"<description><![CDATA[<p>{'Some text of the post. ' * 20}</p>]]>"
+        f"</description></item>"
+        for i in range(items)) + '</channel></rss>'
+    return 200, {'Content-Type': 'application/rss+xml', 'ETag': '"v1"'}, \
+        body.encode()
+
+
+def synthetic_fixtures(stories: int = 500, feed_items: int = 50,
+                       posts: int = 100) -> Dict[str, Fixture]:
+    """
+    Fixtures shaped like the real upstream responses, for running the
+    benchmarks without recording first
+    """
+    fixtures = {}
+
+    story_ids = list(range(1000, 1000 + stories))
+    for metric in HN_METRICS:
+        fixtures[f"/v0/{metric}stories.json"] = json_fixture(story_ids)
+    fixtures['/v0/maxitem.json'] = json_fixture(story_ids[-1])
+    fixtures['/v0/updates.json'] = json_fixture(
+        {'items': story_ids[:5], 'profiles': []})
+    for story_id in story_ids:
+        fixtures[f"/v0/item/{story_id}.json"] = json_fixture({
+            'id': story_id, 'type': 'story', 'by': f"user{story_id % 50}",
+            'time': 1600000000 + story_id, 'score': story_id % 300,
+            'descendants': story_id % 40, 'title': f"Story {story_id}",
+            'url': f"https://example.com/stories/{story_id}",
+        })
+
+    for tag in MEDIUM_TAGS:
+        fixtures[f"/feed/tag/{tag}"] = rss_fixture(
+            f"medium {tag}", feed_items, f"https://medium.com/p/{tag}")
+    for category in AWS_CATEGORIES:
+        fixtures[f"/blogs/{category}/feed"] = rss_fixture(
+            f"aws {category}", feed_items,
+            f"https://aws.amazon.com/blogs/{category}")
+
+    fixtures['/api/v1/access_token'] = json_fixture({
+        'access_token': 'benchmark', 'token_type': 'bearer',
+        'expires_in': 3600, 'scope': '*',
+    })
+    for subreddit, metric in REDDIT_LISTINGS:
+        fixtures[f"/r/{subreddit}/{metric}"] = json_fixture({
+            'kind': 'Listing',
+            'data': {'after': None, 'before': None, 'children': [{
+                'kind': 't3',
+                'data': {
+                    'id': f"{metric}{i}", 'name': f"t3_{metric}{i}",
+                    'title': f"{subreddit} {metric} post {i}",
+                    'url': f"https://example.com/{subreddit}/{metric}/{i}",
+                    'subreddit': subreddit, 'author': f"user{i % 30}",
+                    'created_utc': 1600000000.0 + i, 'score': i,
+                    'num_comments': i % 50,
+                },
+            } for i in range(posts)]},
+        })
+
+    return fixtures
+
+
+def save_fixtures(fixtures: Dict[str, Fixture], path: str) -> None:
+    with open(path, 'w') as fixtures_file:
+        json.dump({key: [status, headers, body.decode()]
+                   for key, (status, headers, body) in fixtures.items()},
+                  fixtures_file)
+
+
+def load_fixtures(path: str) -> Dict[str, Fixture]:
+    with open(path) as fixtures_file:
+        return {key: (status, headers, body.encode())
+                for key, (status, headers, body)
+                in json.load(fixtures_file).items()}
+
+
+class FakeUpstream:
+    """
+    HTTP server on localhost answering every request from `fixtures`, after
+    `latency` seconds (plus up to `jitter` more). A share `error_rate` of the
+    requests gets a 503 instead, and unknown paths get a 404.
+    """
+
+    def __init__(self, fixtures: Dict[str, Fixture], latency: float = 0.0,
+                 jitter: float = 0.0, error_rate: float = 0.0,
+                 seed: Optional[int] = None) -> None:
+        self.fixtures = fixtures
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.requests = 0
+        self.errors = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def respond(self, path: str) -> Fixture:
+        """
+        The response to a request of `path`, waiting out the latency first
+        """
+        with self._lock:
+            self.requests += 1
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            failed = self._random.random() < self.error_rate
+            if failed:
+                self.errors += 1
+        if delay:
+            time.sleep(delay)
+
+        if failed:
+            return 503, {'Retry-After': '0'}, b''
+        return self.fixtures.get(urlsplit(path).path,
+                                 (404, {}, b'not found'))
+
+    def start(self) -> "FakeUpstream":
+        upstream = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self) -> None:
+                status, headers, body = upstream.respond(self.path)
+                etag = headers.get('ETag')
+                if status == 200 and etag and \
+                        self.headers.get('If-None-Match') == etag:
+                    status, body = 304, b''
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self) -> None:
+                self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                self.do_GET()
+
+            def log_message(self, *args) -> None:
+                pass
+
+        class Server(ThreadingHTTPServer):
+            # The default backlog of 5 drops connections under the bursts
+            # the sources make
+            request_queue_size = 128
+            daemon_threads = True
+
+        self._server = Server(('127.0.0.1', 0), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self) -> "FakeUpstream":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+
+class RedirectTransport(httpx.AsyncBaseTransport):
+    """
+    Sends every request to the fake upstream at `base_url` instead of the
+    host in its URL, keeping the path and query
+    """
+
+    def __init__(self, base_url: str) -> None:
+        base = urlsplit(base_url)
+        self.host = base.hostname
+        self.port = base.port
+        self.transport = httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self,
+                                   request: httpx.Request) -> httpx.Response:
+        request.url = request.url.copy_with(scheme='http', host=self.host,
+                                            port=self.port)
+        return await self.transport.handle_async_request(request)
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+class RecordingTransport(httpx.AsyncBaseTransport):
+    """
+    Passes requests through to the real upstreams and keeps the successful
+    responses as fixtures
+    """
+
+    def __init__(self) -> None:
+        self.transport = httpx.AsyncHTTPTransport()
+        self.fixtures: Dict[str, Fixture] = {}
+
+    async def handle_async_request(self,
+                                   request: httpx.Request) -> httpx.Response:
+        response = await self.transport.handle_async_request(request)
+        body = await response.aread()
+        if response.status_code == 200:
+            keep = ('Content-Type', 'ETag', 'Last-Modified')
+            headers = {name: response.headers[name] for name in keep
+                       if name in response.headers}
+            self.fixtures[request.url.path] = (200, headers, body)
+        # The body is decoded already
+        headers = [(name, value) for name, value in response.headers.items()
+                   if name not in ('content-encoding', 'content-length',
+                                   'transfer-encoding')]
+        return httpx.Response(response.status_code, headers=headers,
+                              content=body, extensions=response.extensions)
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
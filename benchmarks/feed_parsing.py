@@ -0,0 +1,231 @@
+import argparse
+import asyncio
+import glob
+import gzip
+import os
+import random
+import time
+from typing import AsyncIterator, Callable, Dict, List, Optional
+
+import feedparser
+import httpx
+
+from benchmarks.fake_upstream import load_fixtures
+from src.feeds import MAX_FEED_BYTES, read_feed_entries
+
+"""
+Compares feedparser with the incremental feed parser, as the sources run
+it on streamed responses, on large saved feeds, reading them whole and
+stopping at the first entries.
+Feeds are read from benchmarks/fixtures/feeds/ (RSS 2.0 shaped like Medium's
+and the AWS blogs', Atom and RSS 1.0), from the given files, or from the
+feeds of a fixtures file recorded with `python -m benchmarks.harness
+--record PATH`.
+Run with `python -m benchmarks.feed_parsing --help`.
+"""
+
+CHUNK_SIZE = 16 * 1024
+FEEDS_DIR = os.path.join(os.path.dirname(__file__), 'fixtures', 'feeds')
+
+WORDS = ('python', 'release', 'performance', 'the', 'of', 'and', 'cloud',
+         'security', 'data', 'model', 'async', 'server', 'request', 'a',
+         'to', 'in', 'with', 'team', 'service', 'latency', 'cache', 'build')
+
+
+def text(rng: random.Random, words: int) -> str:
+    return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+
+def paragraphs(rng: random.Random, count: int) -> str:
+    return ''.join(f'<p>{text(rng, 60)}</p>' for _ in range(count))
+
+
+def medium_rss(rng: random.Random, count: int) -> str:
+    items = ''.join(
+        f"<item><title><![CDATA[{text(rng, 8)}]]></title>"
+        f"<link>https://medium.com/@author{i % 50}/post-{i}</link>"
+        f"<guid isPermaLink=\"false\">https://medium.com/p/{i:012x}</guid>"
+        f"<category><![CDATA[python]]></category>"
+        f"<dc:creator><![CDATA[Author {i % 50}]]></dc:creator>"
+        f"<pubDate>Mon, 04 Jan 2021 10:{i % 60:02d}:00 GMT</pubDate>"
+        f"<atom:updated>2021-01-04T10:{i % 60:02d}:00.000Z</atom:updated>"
+        f"<content:encoded><![CDATA[{paragraphs(rng, 12)}]]>"
+        f"</content:encoded></item>"
+        for i in range(count))
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<rss xmlns:dc="http://purl.org/dc/elements/1.1/" '
+        'xmlns:content="http://purl.org/rss/1.0/modules/content/" '
+        'xmlns:atom="http://www.w3.org/2005/Atom" version="2.0">'
+        f'<channel><title>Python on Medium</title>{items}</channel></rss>')
+
+
+def aws_rss(rng: random.Random, count: int) -> str:
+    items = ''.join(
+        f"<item><title>{text(rng, 9)}</title>"
+        f"<link>https://aws.amazon.com/blogs/security/post-{i}/</link>"
+        f"<dc:creator>Author {i % 30}</dc:creator>"
+        f"<pubDate>Tue, 05 Jan 2021 0{i % 10}:00:00 +0000</pubDate>"
+        f"<category>Security</category>"
+        f"<guid isPermaLink=\"false\">{i:08x}-aws</guid>"
+        f"<description>{text(rng, 70)}</description></item>"
+        for i in range(count))
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<rss version="2.0" xmlns:dc="http://purl.org/dc/elements/1.1/">'
+        f'<channel><title>AWS Security Blog</title>{items}</channel></rss>')
+
+
+def atom(rng: random.Random, count: int) -> str:
+    entries = ''.join(
+        f"<entry><title>{text(rng, 8)}</title><id>urn:post:{i}</id>"
+        f"<link rel=\"alternate\" href=\"https://example.com/posts/{i}\"/>"
+        f"<author><name>Author {i % 40}</name></author>"
+        f"<published>2021-03-04T05:{i % 60:02d}:07Z</published>"
+        f"<updated>2021-03-04T06:{i % 60:02d}:07Z</updated>"
+        f"<content type=\"html\">&lt;p&gt;{text(rng, 300)}&lt;/p&gt;"
+        f"</content></entry>"
+        for i in range(count))
+    return ('<?xml version="1.0" encoding="utf-8"?>'
+            '<feed xmlns="http://www.w3.org/2005/Atom">'
+            f'<title>Atom feed</title>{entries}</feed>')
+
+
+def rss1(rng: random.Random, count: int) -> str:
+    items = ''.join(
+        f"<item rdf:about=\"https://example.org/{i}\">"
+        f"<title>{text(rng, 8)}</title><link>https://example.org/{i}</link>"
+        f"<dc:creator>Author {i % 40}</dc:creator>"
+        f"<dc:date>2021-02-0{i % 9 + 1}T12:00:00Z</dc:date>"
+        f"<description>{text(rng, 120)}</description></item>"
+        for i in range(count))
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#" '
+        'xmlns="http://purl.org/rss/1.0/" '
+        'xmlns:dc="http://purl.org/dc/elements/1.1/">'
+        '<channel rdf:about="https://example.org/"><title>RSS 1.0 feed'
+        f'</title></channel>{items}</rdf:RDF>')
+
+
+SAVED_FEEDS = {
+    'medium_python.xml.gz': medium_rss,
+    'aws_security.xml.gz': aws_rss,
+    'atom.xml.gz': atom,
+    'rss1.xml.gz': rss1,
+}
+
+
+def save_feeds(directory: str, count: int) -> None:
+    """
+    Writes the saved feeds of FEEDS_DIR again, `count` entries each
+    """
+    os.makedirs(directory, exist_ok=True)
+    for name, make in SAVED_FEEDS.items():
+        body = make(random.Random(name), count).encode()
+        # mtime=0 keeps the files identical from one run to the next
+        with open(os.path.join(directory, name), 'wb') as feed_file:
+            with gzip.GzipFile(fileobj=feed_file, mode='wb',
+                               mtime=0) as compressed:
+                compressed.write(body)
+        print(f"wrote {name}, {len(body) / 1024:.0f} KiB")
+
+
+def read_feed(path: str) -> bytes:
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rb') as feed_file:
+        return feed_file.read()
+
+
+def load_feeds(args: argparse.Namespace) -> Dict[str, bytes]:
+    if args.fixtures:
+        return {path: body
+                for path, (_, headers, body)
+                in load_fixtures(args.fixtures).items()
+                if 'xml' in headers.get('Content-Type', '')}
+    paths = args.feeds or sorted(glob.glob(os.path.join(FEEDS_DIR, '*')))
+    return {os.path.basename(path): read_feed(path) for path in paths}
+
+
+async def chunked(data: bytes) -> AsyncIterator[bytes]:
+    for start in range(0, len(data), CHUNK_SIZE):
+        yield data[start:start + CHUNK_SIZE]
+
+
+def read_entries(loop: asyncio.AbstractEventLoop, feed: bytes,
+                 limit: Optional[int] = None) -> list:
+    """
+    Entries of a response streaming `feed` in CHUNK_SIZE chunks
+    """
+    response = httpx.Response(200, content=chunked(feed),
+                              request=httpx.Request('GET', 'https://feed'))
+    entries, _ = loop.run_until_complete(
+        read_feed_entries(response, limit, MAX_FEED_BYTES))
+    return entries
+
+
+def measure(parse: Callable[[], list], rounds: int) -> float:
+    """
+    Best time of `rounds` runs of `parse`, in milliseconds
+    """
+    best = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        parse()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000
+
+
+def compare(loop: asyncio.AbstractEventLoop, name: str, feed: bytes,
+            limit: int, rounds: int) -> None:
+    entries = len(feedparser.parse(feed).entries)
+    found = len(read_entries(loop, feed))
+    print(f"{name}: {entries} entries, {len(feed) / 1024:.0f} KiB")
+    if found != entries:
+        print(f"  incremental parser found {found} entries")
+
+    full_feedparser = measure(lambda: feedparser.parse(feed).entries, rounds)
+    full_stream = measure(lambda: read_entries(loop, feed), rounds)
+    limited_stream = measure(lambda: read_entries(loop, feed, limit), rounds)
+
+    print(f"  feedparser, whole feed:          {full_feedparser:8.1f}ms")
+    print(f"  incremental, whole feed:         {full_stream:8.1f}ms")
+    print(f"  incremental, first {limit:<4} items:  {limited_stream:8.1f}ms")
+
+
+def add_parser_args(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument('feeds', nargs='*',
+                        help="feed files (.xml or .xml.gz), the saved feeds "
+                             "by default")
+    parser.add_argument('--fixtures', help="fixtures file recorded with "
+                                           "benchmarks.harness --record")
+    parser.add_argument('--limit', type=int, default=10)
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--save', type=int, metavar='ENTRIES',
+                        help="write the saved feeds again with this many "
+                             "entries each, then exit")
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Compares feedparser with the incremental feed parser")
+    add_parser_args(parser)
+    args = parser.parse_args(argv)
+
+    if args.save is not None:
+        save_feeds(FEEDS_DIR, args.save)
+        return
+
+    loop = asyncio.new_event_loop()
+    try:
+        for name, feed in load_feeds(args).items():
+            compare(loop, name, feed, args.limit, args.rounds)
+    finally:
+        # Limited reads leave the response streams unfinished
+        loop.run_until_complete(loop.shutdown_asyncgens())
+        loop.close()
+
+
+if __name__ == '__main__':
+    main()
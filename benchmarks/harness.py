@@ -0,0 +1,414 @@
+import argparse
+import asyncio
+import glob
+import json
+import math
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional
+
+import httpx
+import praw
+
+from benchmarks.fake_upstream import FakeUpstream, RecordingTransport, \
+    RedirectTransport, load_fixtures, save_fixtures, synthetic_fixtures
+from src import http_client, reddit_source
+from src.feeds import feed_cache
+from src.hn_source import item_cache
+from src.specs import create_source_from_spec
+from src.upstream import DEFAULT_RATES, upstreams
+
+"""
+Benchmark harness running every source and the API endpoints against a local
+fake upstream, reporting throughput, latency percentiles and memory.
+Results are saved under benchmarks/results/ and compared with the previous
+run to spot regressions between commits.
+Run with `python -m benchmarks.harness --help`.
+"""
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+REDDIT_CREDENTIALS = ('benchmark', 'benchmark')
+
+SOURCE_SCENARIOS = ['hn:top', 'reddit:python:hot', 'medium:python',
+                    'aws:security']
+API_SCENARIOS = ['/hackernews/top', '/reddit/python/hot', '/medium/python',
+                 '/aws/security',
+                 '/aggregate?sources=hn:top&sources=medium:python'
+                 '&sources=aws:security&sources=reddit:python:hot']
+
+# A scenario makes one operation and returns the number of items it got
+Operation = Callable[[], Awaitable[int]]
+
+
+def reset_caches() -> None:
+    """
+    Forgets everything fetched so far, so that the next operation goes all
+    the way to the (fake) upstream
+    """
+    item_cache.items.clear()
+    item_cache.story_lists.clear()
+    feed_cache.states.clear()
+    if 'api' in sys.modules:
+        sys.modules['api'].cache.clear()
+
+
+def source_operation(spec: str, limit: int) -> Operation:
+    """
+    Fetch of a freshly created source from its spec, as in the API.
+    HackerNews sources fetch every story, the item cache is what the warm
+    runs measure.
+    """
+    _, _, factory = create_source_from_spec(spec, limit, incremental=False)
+
+    async def operation() -> int:
+        return len(await factory().fetch_async())
+
+    return operation
+
+
+def api_operation(client: httpx.AsyncClient, path: str,
+                  limit: int) -> Operation:
+    """
+    Request of an API endpoint, in process through the ASGI interface
+    """
+    separator = '&' if '?' in path else '?'
+    url = f"{path}{separator}limit={limit}"
+
+    async def operation() -> int:
+        response = await client.get(url)
+        response.raise_for_status()
+        body = response.json()
+        if 'sources' in body:
+            return sum(len(source.get('posts', ()))
+                       for source in body['sources'])
+        return len(body['posts'])
+
+    return operation
+
+
+def percentile(sorted_values: List[float], share: float) -> float:
+    """
+    Nearest-rank percentile of already sorted values
+    """
+    if not sorted_values:
+        return 0.0
+    index = max(0, math.ceil(share * len(sorted_values)) - 1)
+    return sorted_values[min(index, len(sorted_values) - 1)]
+
+
+async def run_scenario(operation: Operation, iterations: int,
+                       concurrency: int, warm: bool) -> Dict[str, Any]:
+    """
+    Runs `operation` `iterations` times, `concurrency` at a time, then once
+    more under tracemalloc for its peak memory
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    latencies = []
+    items = 0
+    errors = 0
+
+    async def timed() -> None:
+        nonlocal items, errors
+        async with semaphore:
+            if not warm:
+                reset_caches()
+            start = time.perf_counter()
+            try:
+                count = await operation()
+            except Exception:
+                count = 0
+                errors += 1
+            items += count
+            latencies.append(time.perf_counter() - start)
+
+    if warm:
+        await operation()
+
+    start = time.perf_counter()
+    await asyncio.gather(*[timed() for _ in range(iterations)])
+    elapsed = time.perf_counter() - start
+
+    if not warm:
+        reset_caches()
+    tracemalloc.start()
+    try:
+        await operation()
+    except Exception:
+        pass
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    latencies.sort()
+    return {
+        'iterations': iterations,
+        'errors': errors,
+        'items': items,
+        'throughput': round(iterations / elapsed, 2) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'peak_kib': round(peak / 1024, 1),
+    }
+
+
+def install_fake_reddit(base_url: str) -> None:
+    """
+    Registers Reddit clients pointed at the fake upstream under the
+    credentials of the environment, which the sources use
+    """
+    clients = reddit_source.RedditClients(
+        lambda: praw.Reddit(
+            client_id=REDDIT_CREDENTIALS[0],
+            client_secret=REDDIT_CREDENTIALS[1],
+            user_agent='fuse-benchmark/1.0', check_for_updates=False,
+            oauth_url=base_url, reddit_url=base_url))
+    reddit_source._clients[(os.environ.get('REDDIT_CLIENT_ID'),
+                            os.environ.get('REDDIT_CLIENT_SECRET'))] = clients
+
+
+def lift_rate_limits() -> None:
+    """
+    The rate limits protect the real upstreams, against the fake one they
+    would only measure themselves
+    """
+    upstreams.rates = {host: (1e9, 1e9) for host in DEFAULT_RATES}
+    upstreams.reset()
+
+
+@contextmanager
+def client_transport(transport: httpx.AsyncBaseTransport) -> Iterator[None]:
+    """
+    Makes the HTTP clients created within the block use `transport`, then
+    restores the client options
+    """
+    options = dict(http_client.client_options)
+    http_client.client_options['transport'] = transport
+    try:
+        yield
+    finally:
+        http_client.client_options.clear()
+        http_client.client_options.update(options)
+
+
+@contextmanager
+def redirected_upstreams(base_url: str) -> Iterator[None]:
+    """
+    Sends every upstream request made within the block to the fake upstream
+    at `base_url`, without rate limits, then restores the HTTP clients,
+    Reddit clients, and the rate limits, circuits and counters of the hosts
+    """
+    reddit_clients = dict(reddit_source._clients)
+    rates = upstreams.rates
+    state = [(states, dict(states)) for states in
+             (upstreams.buckets, upstreams.breakers, upstreams.stats)]
+    try:
+        with client_transport(RedirectTransport(base_url)):
+            install_fake_reddit(base_url)
+            lift_rate_limits()
+            yield
+    finally:
+        reddit_source._clients.clear()
+        reddit_source._clients.update(reddit_clients)
+        upstreams.rates = rates
+        for states, saved in state:
+            states.clear()
+            states.update(saved)
+
+
+async def run_all(scenarios: List[str], args: argparse.Namespace) -> \
+        Dict[str, Dict[str, Any]]:
+    results = {}
+    api_client = None
+    try:
+        for scenario in scenarios:
+            if scenario.startswith('/'):
+                if api_client is None:
+                    import api
+                    api_client = httpx.AsyncClient(
+                        transport=httpx.ASGITransport(app=api.app),
+                        base_url='http://fuse')
+                operation = api_operation(api_client, scenario, args.limit)
+            else:
+                operation = source_operation(scenario, args.limit)
+
+            # Circuits opened by injected errors would fail the next
+            # scenario fast
+            upstreams.reset()
+            results[scenario] = await run_scenario(
+                operation, args.iterations, args.concurrency, args.warm)
+            print_row(scenario, results[scenario])
+    finally:
+        if api_client is not None:
+            await api_client.aclose()
+        await http_client.close_async_client()
+    return results
+
+
+async def record(path: str, limit: int) -> None:
+    """
+    Fetches the feed sources from the real upstreams and saves what they
+    got as fixtures. Reddit goes through praw rather than httpx, its
+    fixtures stay synthetic.
+    """
+    transport = RecordingTransport()
+    with client_transport(transport):
+        try:
+            for spec in SOURCE_SCENARIOS:
+                if not spec.startswith('reddit:'):
+                    await source_operation(spec, limit)()
+        finally:
+            await http_client.close_async_client()
+    save_fixtures(transport.fixtures, path)
+    print(f"recorded {len(transport.fixtures)} responses to {path}")
+
+
+def print_row(name: str, result: Dict[str, Any]) -> None:
+    print(f"{name[:48]:<48} {result['throughput']:>9.1f}/s "
+          f"p50 {result['p50_ms']:>8.1f}ms p95 {result['p95_ms']:>8.1f}ms "
+          f"p99 {result['p99_ms']:>8.1f}ms peak {result['peak_kib']:>8.0f}KiB"
+          f" errors {result['errors']}")
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                              capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def save_results(report: Dict[str, Any], output_dir: str) -> str:
+    os.makedirs(output_dir, exist_ok=True)
+    name = time.strftime('%Y%m%d-%H%M%S', time.gmtime(report['created']))
+    path = os.path.join(output_dir,
+                        f"{name}-{report['commit'] or 'unknown'}.json")
+    with open(path, 'w') as results_file:
+        json.dump(report, results_file, indent=2)
+    return path
+
+
+def latest_results(output_dir: str) -> Optional[str]:
+    paths = sorted(glob.glob(os.path.join(output_dir, '*.json')))
+    return paths[-1] if paths else None
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any],
+            threshold: float) -> List[str]:
+    """
+    Prints how every scenario changed since `baseline`, returns the
+    scenarios whose p95 latency or throughput regressed by more than
+    `threshold` (a share, e.g. 0.1 for 10%)
+    """
+    print(f"\ncompared with {baseline.get('commit')} "
+          f"({time.ctime(baseline['created'])})")
+    regressions = []
+    for name, result in report['scenarios'].items():
+        before = baseline['scenarios'].get(name)
+        if before is None:
+            continue
+
+        def change(key: str) -> float:
+            return (result[key] - before[key]) / before[key] \
+                if before[key] else 0.0
+
+        p95, throughput = change('p95_ms'), change('throughput')
+        regressed = p95 > threshold or throughput < -threshold
+        if regressed:
+            regressions.append(name)
+        print(f"{name[:48]:<48} throughput {throughput:+7.1%} "
+              f"p50 {change('p50_ms'):+7.1%} p95 {p95:+7.1%} "
+              f"peak {change('peak_kib'):+7.1%}"
+              f"{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+def add_parser_args(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument('scenarios', nargs='*',
+                        help="source specs (e.g. hn:top) and API paths "
+                             "(e.g. /medium/python), all by default")
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--limit', type=int, default=30,
+                        help="results asked of every source")
+    parser.add_argument('--latency', type=float, default=0.02,
+                        help="seconds the fake upstream takes to answer")
+    parser.add_argument('--jitter', type=float, default=0.01,
+                        help="up to that many more seconds, at random")
+    parser.add_argument('--error_rate', type=float, default=0.0,
+                        help="share of upstream requests answered with 503")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--warm', action='store_true',
+                        help="keep caches between iterations")
+    parser.add_argument('--fixtures',
+                        help="recorded fixtures, replacing the synthetic "
+                             "ones they cover")
+    parser.add_argument('--record', metavar='PATH',
+                        help="record fixtures from the real upstreams "
+                             "instead of benchmarking")
+    parser.add_argument('--output_dir', default=RESULTS_DIR)
+    parser.add_argument('--no_save', action='store_true')
+    parser.add_argument('--compare', metavar='PATH',
+                        help="results to compare with, the latest saved "
+                             "ones by default")
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help="regression threshold, as a share")
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Benchmarks the sources and the API against a fake "
+                    "upstream")
+    add_parser_args(parser)
+    args = parser.parse_args(argv)
+
+    if args.record:
+        asyncio.run(record(args.record, args.limit))
+        return 0
+
+    fixtures = synthetic_fixtures()
+    if args.fixtures:
+        fixtures.update(load_fixtures(args.fixtures))
+    scenarios = args.scenarios or SOURCE_SCENARIOS + API_SCENARIOS
+
+    baseline_path = args.compare or latest_results(args.output_dir)
+
+    with FakeUpstream(fixtures, args.latency, args.jitter, args.error_rate,
+                      args.seed) as upstream, \
+            redirected_upstreams(upstream.url):
+        created = time.time()
+        results = asyncio.run(run_all(scenarios, args))
+        print(f"{upstream.requests} upstream requests, "
+              f"{upstream.errors} injected errors")
+
+    report = {
+        'created': created,
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'max_rss_kib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'settings': {key: value for key, value in vars(args).items()
+                     if key not in ('output_dir', 'no_save', 'compare',
+                                    'record')},
+        'scenarios': results,
+    }
+
+    if not args.no_save:
+        print(f"saved to {save_results(report, args.output_dir)}")
+
+    if baseline_path:
+        with open(baseline_path) as baseline_file:
+            baseline = json.load(baseline_file)
+        if compare(report, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,222 @@
+import argparse
+import asyncio
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Tuple
+
+from benchmarks.fake_upstream import FakeUpstream, synthetic_fixtures
+from benchmarks.harness import percentile
+
+"""
+Load test of the gunicorn deployment (gunicorn.conf.py) against the fake
+upstream: the API is served with 1, 2, 4... workers up to the cores
+available and loaded with keep-alive connections, reporting the throughput
+and latency at each worker count, and how many upstream requests the
+workers made between them.
+Run with `python -m benchmarks.load --help`.
+"""
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+POLL_FEEDS = 'hn:top@30,medium:python@30,aws:security@30,' \
+             'reddit:python:hot@30'
+PATHS = [
+    '/hackernews/top?limit=30&detailed=true',
+    '/medium/python?limit=30&detailed=true',
+    '/timeline?sources=hn:top&sources=medium:python&sources=aws:security'
+    '&sources=reddit:python:hot&k=50',
+]
+
+
+def free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def default_worker_counts() -> List[int]:
+    try:
+        cores = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cores = os.cpu_count() or 1
+    counts = [1]
+    while counts[-1] * 2 <= cores:
+        counts.append(counts[-1] * 2)
+    if counts[-1] != cores:
+        counts.append(cores)
+    return counts
+
+
+def start_server(workers: int, port: int, upstream_url: str,
+                 share: bool) -> subprocess.Popen:
+    env = dict(os.environ, FUSE_FAKE_UPSTREAM=upstream_url,
+               FUSE_POLL_FEEDS=POLL_FEEDS, WEB_CONCURRENCY=str(workers),
+               BIND=f'127.0.0.1:{port}', REDDIT_CLIENT_ID='benchmark',
+               REDDIT_CLIENT_SECRET='benchmark')
+    for name in ('FUSE_CACHE_PATH', 'FUSE_SNAPSHOTS_PATH', 'FUSE_STORE_PATH'):
+        env.pop(name, None)
+    if not share:
+        # Empty paths turn the shared cache and snapshots off
+        env.update(FUSE_CACHE_PATH='', FUSE_SNAPSHOTS_PATH='')
+    return subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py',
+         'benchmarks.load_app:app'],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL)
+
+
+def wait_until_ready(port: int, paths: List[str],
+                     timeout: float = 60.0) -> None:
+    """
+    Waits for the server to answer every path, which also lets the polled
+    feeds be fetched before measuring
+    """
+    end = time.monotonic() + timeout
+    pending = list(paths)
+    while pending:
+        if time.monotonic() > end:
+            raise TimeoutError(f"server not ready, still waiting on "
+                               f"{pending[0]}")
+        try:
+            status, _ = asyncio.run(request_once(port, pending[0]))
+        except OSError:
+            status = None
+        if status == 200:
+            pending.pop(0)
+        else:
+            time.sleep(0.2)
+
+
+async def read_response(reader: asyncio.StreamReader) -> Tuple[int, bytes]:
+    head = await reader.readuntil(b'\r\n\r\n')
+    status = int(head.split(b' ', 2)[1])
+    length = 0
+    for line in head.split(b'\r\n')[1:]:
+        name, _, value = line.partition(b':')
+        if name.lower() == b'content-length':
+            length = int(value)
+    return status, await reader.readexactly(length)
+
+
+def request_bytes(path: str) -> bytes:
+    return f'GET {path} HTTP/1.1\r\nHost: fuse\r\n\r\n'.encode()
+
+
+async def request_once(port: int, path: str) -> Tuple[int, bytes]:
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    try:
+        writer.write(request_bytes(path))
+        return await read_response(reader)
+    finally:
+        writer.close()
+
+
+async def load(port: int, paths: List[str], connections: int,
+               duration: float) -> Tuple[int, int, List[float]]:
+    """
+    Keeps `connections` keep-alive connections busy for `duration` seconds,
+    a minimal HTTP/1.1 client so that the load generator isn't what limits
+    the throughput
+    """
+    requests = [request_bytes(path) for path in paths]
+    latencies = []
+    errors = 0
+    end = time.perf_counter() + duration
+
+    async def connection(offset: int) -> None:
+        nonlocal errors
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        index = offset
+        try:
+            while time.perf_counter() < end:
+                start = time.perf_counter()
+                writer.write(requests[index % len(requests)])
+                status, _ = await read_response(reader)
+                latencies.append(time.perf_counter() - start)
+                if status != 200:
+                    errors += 1
+                index += 1
+        finally:
+            writer.close()
+
+    outcomes = await asyncio.gather(*[connection(offset)
+                                      for offset in range(connections)],
+                                    return_exceptions=True)
+    errors += sum(isinstance(outcome, Exception) for outcome in outcomes)
+    return len(latencies), errors, latencies
+
+
+def run_client(port: int, paths: List[str], connections: int,
+               duration: float) -> Tuple[int, int, List[float]]:
+    return asyncio.run(load(port, paths, connections, duration))
+
+
+def measure(workers: int, args: argparse.Namespace,
+            upstream: FakeUpstream) -> Dict[str, Any]:
+    port = free_port()
+    requests_before = upstream.requests
+    server = start_server(workers, port, upstream.url, not args.no_share)
+    try:
+        wait_until_ready(port, PATHS)
+        per_client = max(1, args.connections // args.clients)
+        with multiprocessing.Pool(args.clients) as pool:
+            outcomes = pool.starmap(
+                run_client, [(port, PATHS, per_client, args.duration)] *
+                args.clients)
+    finally:
+        server.terminate()
+        server.wait(30)
+
+    latencies = sorted(latency for _, _, client in outcomes
+                       for latency in client)
+    count = sum(requests for requests, _, _ in outcomes)
+    return {
+        'workers': workers,
+        'throughput': round(count / args.duration, 1),
+        'errors': sum(errors for _, errors, _ in outcomes),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'upstream_requests': upstream.requests - requests_before,
+    }
+
+
+def add_parser_args(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument('--workers', type=int, nargs='+',
+                        help="worker counts to measure, 1, 2, 4... up to "
+                             "the cores available by default")
+    parser.add_argument('--duration', type=float, default=10.0,
+                        help="seconds of load per worker count")
+    parser.add_argument('--connections', type=int, default=64,
+                        help="keep-alive connections, in total")
+    parser.add_argument('--clients', type=int, default=2,
+                        help="load generating processes")
+    parser.add_argument('--latency', type=float, default=0.02,
+                        help="seconds the fake upstream takes to answer")
+    parser.add_argument('--no_share', action='store_true',
+                        help="turn off the cache and snapshots shared by "
+                             "the workers")
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Load test of the API served by gunicorn")
+    add_parser_args(parser)
+    args = parser.parse_args(argv)
+
+    print(f"{'workers':>7} {'req/s':>9} {'p50':>9} {'p99':>9} "
+          f"{'errors':>6} {'upstream requests':>17}")
+    with FakeUpstream(synthetic_fixtures(),
+                      latency=args.latency) as upstream:
+        for workers in args.workers or default_worker_counts():
+            result = measure(workers, args, upstream)
+            print(f"{workers:>7} {result['throughput']:>9.1f} "
+                  f"{result['p50_ms']:>7.1f}ms {result['p99_ms']:>7.1f}ms "
+                  f"{result['errors']:>6} {result['upstream_requests']:>17}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,19 @@
+import os
+
+from benchmarks.fake_upstream import RedirectTransport
+from benchmarks.harness import install_fake_reddit, lift_rate_limits
+from src import http_client
+
+"""
+The API with every source pointed at the fake upstream listening at
+FUSE_FAKE_UPSTREAM, for benchmarks.load to serve with gunicorn:
+`gunicorn -c gunicorn.conf.py benchmarks.load_app:app`.
+"""
+
+upstream_url = os.environ['FUSE_FAKE_UPSTREAM']
+http_client.client_options['transport'] = RedirectTransport(upstream_url)
+install_fake_reddit(upstream_url)
+lift_rate_limits()
+
+# Imported once the sources are redirected
+from api import app  # noqa: E402,F401
@@ -0,0 +1,85 @@
+import json
+import sys
+import time
+import tracemalloc
+from typing import Callable
+
+from src.models import Result, results_to_json, results_to_ndjson
+
+"""
+Measures the memory per Result and the bulk serialization speed.
+Run with `python -m benchmarks.result_memory [count]`.
+"""
+
+
+class LegacyResult:
+    """
+    The Result class as it was before __slots__: a plain object holding only
+    the title and url in its __dict__.
+    """
+    def __init__(self, title: str, url: str) -> None:
+        self.title = title
+        self.url = url
+
+
+def measure_bytes_per_item(factory: Callable[[int], object],
+                           count: int) -> float:
+    """
+    Average bytes allocated per object created by `factory`, excluding the
+    strings it holds, which both classes share.
+    """
+    titles = [f"Article number {i}" for i in range(count)]
+    urls = [f"https://example.com/articles/{i}" for i in range(count)]
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    items = [factory(i, titles, urls) for i in range(count)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    allocated = sum(stat.size_diff for stat in
+                    after.compare_to(before, 'filename'))
+    del items
+    return (allocated - sys.getsizeof([None] * count)) / count
+
+
+def main(count: int = 200000) -> None:
+    legacy = measure_bytes_per_item(
+        lambda i, titles, urls: LegacyResult(titles[i], urls[i]), count)
+    slotted = measure_bytes_per_item(
+        lambda i, titles, urls: Result(titles[i], urls[i]), count)
+    detailed = measure_bytes_per_item(
+        lambda i, titles, urls: Result(titles[i], urls[i],
+                                       source='hackernews', id=str(i),
+                                       published=1700000000.0, score=i,
+                                       comments=i), count)
+
+    print(f"bytes per item ({count} items, strings excluded)")
+    print(f"  legacy Result (title, url):      {legacy:8.1f}")
+    print(f"  slotted Result (title, url):     {slotted:8.1f}")
+    print(f"  slotted Result (with metadata):  {detailed:8.1f}")
+
+    results = [Result(f"Article number {i}", f"https://example.com/{i}",
+                      source='hackernews', id=str(i), score=i)
+               for i in range(count)]
+
+    start = time.perf_counter()
+    results_to_json(results)
+    json_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    ''.join(results_to_ndjson(results))
+    ndjson_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    json.dumps([{'title': r.title, 'url': r.url} for r in results])
+    baseline_elapsed = time.perf_counter() - start
+
+    print(f"serialization of {count} items")
+    print(f"  results_to_json:                 {json_elapsed:8.3f}s")
+    print(f"  results_to_ndjson:               {ndjson_elapsed:8.3f}s")
+    print(f"  json.dumps of title/url dicts:   {baseline_elapsed:8.3f}s")
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
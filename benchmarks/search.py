@@ -0,0 +1,77 @@
+import itertools
+import os
+import random
+import sys
+import tempfile
+import time
+
+from src.models import Result
+from src.store import ArticleStore
+
+"""
+Times full-text searches over an article store of millions of articles,
+filled in fetch-sized batches the way runs and the API record them.
+Run with `python -m benchmarks.search [articles] [batch size]`.
+"""
+
+SOURCES = ('hackernews', 'reddit', 'medium', 'aws')
+
+QUERIES = (
+    'kubernetes',          # common word
+    'word4000',            # rare word
+    'rust async',          # two words
+    'pyth',                # prefix
+    'nothingmatchesthis',  # no match
+)
+
+
+def make_vocabulary(size: int = 5000) -> list:
+    words = ['python', 'rust', 'kubernetes', 'async', 'database', 'security',
+             'release', 'performance', 'cloud', 'compiler']
+    return words + [f'word{i}' for i in range(size - len(words))]
+
+
+def make_batch(rng: random.Random, vocabulary: list, start: int,
+               size: int) -> list:
+    # Word frequencies fall off like natural language (Zipf)
+    weights = list(itertools.accumulate(1 / (rank + 1)
+                                        for rank in range(len(vocabulary))))
+    titles = [rng.choices(vocabulary, cum_weights=weights,
+                          k=rng.randint(4, 10))
+              for _ in range(size)]
+    return [Result(' '.join(words), f"https://example.com/{words[0]}/{i}",
+                   source=SOURCES[i % len(SOURCES)], id=str(i),
+                   author=f"author{i % 1000}")
+            for i, words in enumerate(titles, start)]
+
+
+def main(articles: int = 1000000, batch: int = 10000,
+         rounds: int = 5) -> None:
+    rng = random.Random(0)
+    vocabulary = make_vocabulary()
+    with tempfile.TemporaryDirectory() as directory:
+        store = ArticleStore(os.path.join(directory, 'articles.sqlite'))
+        start = time.perf_counter()
+        for first in range(0, articles, batch):
+            store.record(make_batch(rng, vocabulary, first,
+                                    min(batch, articles - first)))
+        elapsed = time.perf_counter() - start
+        print(f"recorded {articles} articles in {elapsed:.1f}s "
+              f"({articles / elapsed:.0f}/s)")
+
+        for query in QUERIES:
+            timings = []
+            for order in ('relevance', 'recent'):
+                best = float('inf')
+                for _ in range(rounds):
+                    start = time.perf_counter()
+                    found = store.search(query, 20, order=order)
+                    best = min(best, time.perf_counter() - start)
+                timings.append(f"{order} {best * 1000:7.2f}ms")
+            print(f"  {query:<20} {len(found):>3} results   "
+                  f"{'   '.join(timings)}")
+        store.close()
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
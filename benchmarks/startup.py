@@ -0,0 +1,91 @@
+import argparse
+import os
+import re
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+"""
+Measures the import cost of a CLI run with `python -X importtime`, creating
+the sources of the given flags without fetching them.
+Run with `python -m benchmarks.startup [--budget MS] [CLI flags]`, e.g.
+`python -m benchmarks.startup --hn --hn_metric top`; it exits with status 1
+when a run takes longer than the budget to import.
+"""
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCRIPT = """
+import sys
+from src.main import create_config, create_sources_from_args
+create_sources_from_args(create_config(sys.argv[1:]))
+"""
+
+# Generous, to stay clear of noisy machines: a HackerNews run imports in
+# well under 100ms, loading every source takes about twice as long
+IMPORT_BUDGET_MS = 250.0
+
+IMPORT_LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+# module -> (self microseconds, cumulative microseconds)
+ImportTimes = Dict[str, Tuple[int, int]]
+
+
+def import_times(argv: List[str]) -> ImportTimes:
+    """
+    Import time of every module a fresh interpreter loads to create the
+    sources of `argv`
+    """
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', SCRIPT] + argv,
+        cwd=ROOT, capture_output=True, text=True, check=True,
+        env=dict(os.environ, REDDIT_CLIENT_ID='startup',
+                 REDDIT_CLIENT_SECRET='startup'))
+
+    times = {}
+    for line in completed.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            times[match.group(4)] = (int(match.group(1)),
+                                     int(match.group(2)))
+    return times
+
+
+def total_import_time(times: ImportTimes) -> int:
+    """
+    Microseconds spent importing, the self time of every imported module
+    summed (cumulative times would count nested imports more than once)
+    """
+    return sum(own for own, _ in times.values())
+
+
+def main(argv: List[str]) -> None:
+    parser = argparse.ArgumentParser(
+        description="Measures the import cost of CLI runs",
+        epilog="Other arguments are the CLI flags of the run to measure.")
+    parser.add_argument('--budget', type=float, default=IMPORT_BUDGET_MS,
+                        help="import time allowed per run, in milliseconds")
+    args, flags = parser.parse_known_args(argv)
+
+    over_budget = False
+    runs = [flags] if flags else [['--hn', '--hn_metric', 'top'],
+                                  ['--medium', '--tag', 'python'],
+                                  ['--aws', '--aws_category', 'security'],
+                                  ['--reddit', '--sub', 'python',
+                                   '--metric', 'hot']]
+    for run in runs:
+        times = import_times(run)
+        total = total_import_time(times) / 1000
+        heaviest = sorted(times.items(), key=lambda item: -item[1][0])[:5]
+        print(f"{' '.join(run)}: {len(times)} modules, {total:.1f}ms"
+              f"{' OVER BUDGET' if total > args.budget else ''}")
+        for module, (own, _) in heaviest:
+            print(f"  {module:<40} {own / 1000:6.1f}ms")
+        over_budget = over_budget or total > args.budget
+
+    if over_budget:
+        sys.exit(f"import time over the {args.budget:.0f}ms budget")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,58 @@
+import random
+import sys
+import time
+
+from src.models import Result
+from src.timeline import RANKINGS, top_k
+
+"""
+Times the selection of a merged timeline out of tens of thousands of
+candidates, against ranking and sorting their whole union.
+Run with `python -m benchmarks.timeline [sources] [per source] [k]`.
+"""
+
+
+def make_streams(sources: int, per_source: int, now: float) -> list:
+    rng = random.Random(0)
+    streams = []
+    for source in range(sources):
+        # Sources list their results newest or best first
+        published = sorted((now - rng.uniform(0, 7 * 86400)
+                            for _ in range(per_source)), reverse=True)
+        streams.append([
+            Result(f"Article {source}-{i}",
+                   f"https://example.com/{source}/{i}",
+                   source=f"source{source}", published=published[i],
+                   score=rng.randint(0, 5000) if source % 2 else None)
+            for i in range(per_source)])
+    return streams
+
+
+def main(sources: int = 20, per_source: int = 2000, k: int = 50,
+         rounds: int = 5) -> None:
+    now = time.time()
+    streams = make_streams(sources, per_source, now)
+    print(f"top {k} of {sources * per_source} candidates "
+          f"from {sources} sources")
+
+    for name, ranking in RANKINGS.items():
+        best = float('inf')
+        for _ in range(rounds):
+            start = time.perf_counter()
+            top_k(streams, k, ranking, now=now)
+            best = min(best, time.perf_counter() - start)
+
+        baseline = float('inf')
+        for _ in range(rounds):
+            start = time.perf_counter()
+            keyed = [(key, result) for stream in streams
+                     for key, result in zip(ranking(stream, now), stream)]
+            keyed.sort(key=lambda pair: pair[0], reverse=True)
+            baseline = min(baseline, time.perf_counter() - start)
+
+        print(f"  {name:<8} merge {best * 1000:7.2f}ms   "
+              f"sorted union {baseline * 1000:7.2f}ms")
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,57 @@
+import os
+import shutil
+import tempfile
+
+"""
+Gunicorn settings of the API, picked up by `gunicorn api:app` run from this
+directory (see the Procfile).
+
+One uvicorn worker per core: each worker is a single event loop, sharing its
+HTTP connection pool and Reddit clients between all of its requests. The app
+is preloaded, so the workers fork with every module already imported instead
+of each importing them. The workers share the results cache and the polled
+snapshots through SQLite files in a directory on /dev/shm (shared memory)
+created for this server, so that a feed fetched by one of them is served by
+all of them.
+
+WEB_CONCURRENCY overrides the number of workers, FUSE_CACHE_PATH and
+FUSE_SNAPSHOTS_PATH where the shared state is kept.
+"""
+
+
+def available_cores() -> int:
+    """
+    Cores this process may run on, which in a container can be fewer than
+    the machine has
+    """
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def create_shared_dir() -> str:
+    """
+    Directory of the state shared by the workers, in memory where possible
+    """
+    parent = '/dev/shm' if os.path.isdir('/dev/shm') else None
+    return tempfile.mkdtemp(prefix='fuse-', dir=parent)
+
+
+bind = os.environ.get('BIND', f"0.0.0.0:{os.environ.get('PORT', 8000)}")
+workers = int(os.environ.get('WEB_CONCURRENCY', available_cores()))
+worker_class = 'uvicorn.workers.UvicornWorker'
+preload_app = True
+keepalive = 5
+graceful_timeout = 10
+
+shared_dir = create_shared_dir()
+# Set before the app is preloaded, which reads them on import
+os.environ.setdefault('FUSE_CACHE_PATH',
+                      os.path.join(shared_dir, 'cache.sqlite'))
+os.environ.setdefault('FUSE_SNAPSHOTS_PATH',
+                      os.path.join(shared_dir, 'snapshots.sqlite'))
+
+
+def on_exit(server) -> None:
+    shutil.rmtree(shared_dir, ignore_errors=True)
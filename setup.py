@@ -33,7 +33,10 @@ setup(
         'colorama==0.4.4',
         'pytest',
         'pytest-mock==3.7.0',
-        'requests'
+        'requests',
+        'httpx',
+        'PyYAML',
+        'tomli; python_version < "3.11"'
     ],
     classifiers=[
         "License :: OSI Approved :: MIT License",
@@ -1,11 +1,11 @@
 from typing import List
 
-import feedparser
 from colorama import Fore, Style
-from src.models import Result
+from src.feeds import entry_published, fetch_feed_entries
+from src.models import Source, Result
 
 
-class AwsBlogSource:
+class AwsBlogSource(Source):
 
     def __init__(self, category: str, limit: int = 10):
         self.category = category
@@ -16,21 +16,27 @@ class AwsBlogSource:
     def connect(self):
         pass
 
-    def fetch(self):
+    async def fetch_async(self) -> List[Result]:
         feed_url = f"{self.base_url}/{self.category}/feed"
 
-        raw_results = feedparser.parse(feed_url).entries[:self.limit]
+        entries = await fetch_feed_entries(feed_url, self.limit)
+        raw_results = entries[:self.limit]
 
         results = []
         for result in raw_results:
             results.append(
                 Result(
                     title=result.get("title"),
-                    url=result.get('links')[0].get('href')
+                    url=result.get('links')[0].get('href'),
+                    source='aws',
+                    id=result.get('id'),
+                    published=entry_published(result),
+                    author=result.get('author')
                 )
             )
 
         self.results = results
+        return self.results
 
     def __repr__(self) -> str:
         """
@@ -38,6 +44,4 @@ class AwsBlogSource:
         """
         output = f"{Fore.GREEN}AWS Blog Source Results " \
                  f"[Category: {self.category}]{Style.RESET_ALL} \n"
-        for result in self.results:
-            output += f"{result} \n"
-        return output
+        return output + ''.join(f"{result} \n" for result in self.results)
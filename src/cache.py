@@ -0,0 +1,325 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from src.models import Result, results_to_json
+
+"""
+Cache module, holds fetched results keyed by source type and parameters.
+"""
+
+DEFAULT_TTLS = {
+    'hackernews': 60,
+    'reddit': 120,
+    'medium': 300,
+    'aws': 600,
+}
+DEFAULT_TTL = 60
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+CacheKey = Tuple[str, Tuple[str, ...]]
+
+
+def make_key(source_type: str, params: Tuple[str, ...]) -> CacheKey:
+    """
+    Builds a cache key, the limit is intentionally not part of the key so
+    that an entry fetched with a large limit can serve smaller ones.
+    """
+    return source_type, tuple(str(param) for param in params)
+
+
+def estimate_size(results: List[Result]) -> int:
+    """
+    Rough memory footprint of a list of results, in bytes
+    """
+    size = sys.getsizeof(results)
+    for result in results:
+        size += sys.getsizeof(result)
+        for field in Result.__slots__:
+            value = getattr(result, field)
+            if value is not None:
+                size += sys.getsizeof(value)
+    return size
+
+
+class CacheEntry:
+    """
+    Results fetched with `limit`, valid until `expires_at` (epoch seconds).
+    """
+    __slots__ = ('limit', 'results', 'expires_at', 'size')
+
+    def __init__(self, limit: int, results: List[Result],
+                 expires_at: float) -> None:
+        self.limit = limit
+        self.results = results
+        self.expires_at = expires_at
+        self.size = estimate_size(results)
+
+    def serves(self, limit: int) -> bool:
+        """
+        Whether this entry holds enough results for a request of `limit`.
+        An entry with fewer results than it asked for has the whole feed.
+        """
+        return limit <= self.limit or len(self.results) < self.limit
+
+
+class SqliteCacheBackend:
+    """
+    Cache storage on a local SQLite file, shared by every process (e.g. the
+    gunicorn workers) that points at the same path.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._local = threading.local()
+        # Not kept open: an app preloaded by gunicorn is created before the
+        # workers fork, and SQLite connections must not cross a fork
+        connection = sqlite3.connect(path, timeout=5, isolation_level=None)
+        try:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "  key TEXT PRIMARY KEY,"
+                "  item_limit INTEGER NOT NULL,"
+                "  expires_at REAL NOT NULL,"
+                "  payload TEXT NOT NULL"
+                ")"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS cache_expires_at "
+                "ON cache (expires_at)"
+            )
+        finally:
+            connection.close()
+
+    def _connection(self) -> sqlite3.Connection:
+        """
+        One connection per thread, the async callers use executor threads
+        """
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5,
+                                         isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    @staticmethod
+    def _encode_key(key: CacheKey) -> str:
+        return json.dumps(key)
+
+    def get(self, key: CacheKey) -> Optional[CacheEntry]:
+        row = self._connection().execute(
+            "SELECT item_limit, expires_at, payload FROM cache WHERE key = ?",
+            (self._encode_key(key),)
+        ).fetchone()
+        if row is None:
+            return None
+
+        limit, expires_at, payload = row
+        results = [Result.from_dict(item) for item in json.loads(payload)]
+        return CacheEntry(limit, results, expires_at)
+
+    def set(self, key: CacheKey, entry: CacheEntry) -> None:
+        payload = results_to_json(entry.results)
+        connection = self._connection()
+        connection.execute(
+            "INSERT OR REPLACE INTO cache "
+            "(key, item_limit, expires_at, payload) VALUES (?, ?, ?, ?)",
+            (self._encode_key(key), entry.limit, entry.expires_at, payload)
+        )
+        connection.execute("DELETE FROM cache WHERE expires_at < ?",
+                           (time.time(),))
+
+
+class ResultCache:
+    """
+    In-memory LRU cache of fetched results with per source type TTLs,
+    bounded by an estimate of the memory the results take.
+    An optional shared backend is consulted on local misses and written to
+    on every store. Its calls may wait on other processes' locks, the
+    `get_async` / `set_async` variants make them on an executor thread so
+    that the event loop doesn't.
+    """
+
+    def __init__(self, ttls: Dict[str, float] = None,
+                 max_bytes: int = DEFAULT_MAX_BYTES,
+                 backend: SqliteCacheBackend = None) -> None:
+        self.ttls = dict(DEFAULT_TTLS if ttls is None else ttls)
+        self.max_bytes = max_bytes
+        self.backend = backend
+        self.entries: "OrderedDict[CacheKey, CacheEntry]" = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, source_type: str, params: Tuple[str, ...],
+            limit: int) -> Optional[List[Result]]:
+        """
+        Returns up to `limit` cached results, or None on a miss.
+        """
+        key = make_key(source_type, params)
+        entry = self._local_entry(key)
+        if entry is None and self.backend is not None:
+            entry = self._adopt(key, self._backend_get(key))
+        return self._serve(entry, limit)
+
+    async def get_async(self, source_type: str, params: Tuple[str, ...],
+                        limit: int) -> Optional[List[Result]]:
+        """
+        Like `get`, reading the shared backend on an executor thread
+        """
+        key = make_key(source_type, params)
+        entry = self._local_entry(key)
+        if entry is None and self.backend is not None:
+            entry = self._adopt(key, await asyncio.get_running_loop()
+                                .run_in_executor(None, self._backend_get,
+                                                 key))
+        return self._serve(entry, limit)
+
+    def _local_entry(self, key: CacheKey) -> Optional[CacheEntry]:
+        with self._lock:
+            entry = self.entries.get(key)
+            # Expired entries are kept around for `get_stale`, the memory
+            # bound still evicts them
+            if entry is None or entry.expires_at <= time.time():
+                return None
+            self.entries.move_to_end(key)
+            return entry
+
+    def _backend_get(self, key: CacheKey) -> Optional[CacheEntry]:
+        try:
+            return self.backend.get(key)
+        except sqlite3.Error as e:
+            logging.error("shared cache read failed: %r", e)
+            return None
+
+    def _adopt(self, key: CacheKey,
+               entry: Optional[CacheEntry]) -> Optional[CacheEntry]:
+        """
+        Keeps an entry read from the backend in memory, if still fresh
+        """
+        if entry is None or entry.expires_at <= time.time():
+            return None
+        self._store(key, entry)
+        return entry
+
+    def _serve(self, entry: Optional[CacheEntry],
+               limit: int) -> Optional[List[Result]]:
+        with self._lock:
+            if entry is None or not entry.serves(limit):
+                self.misses += 1
+                return None
+            self.hits += 1
+        return entry.results[:max(limit, 0)]
+
+    def get_stale(self, source_type: str, params: Tuple[str, ...],
+                  limit: int) -> Optional[List[Result]]:
+        """
+        Like `get` but also serves expired in-memory entries, for when the
+        upstream can't be reached
+        """
+        with self._lock:
+            entry = self.entries.get(make_key(source_type, params))
+        if entry is None or not entry.serves(limit):
+            return None
+        return entry.results[:max(limit, 0)]
+
+    def age(self, source_type: str, params: Tuple[str, ...]) -> float:
+        """
+        Seconds since the in-memory entry was fetched, 0 when there is none
+        """
+        with self._lock:
+            entry = self.entries.get(make_key(source_type, params))
+        if entry is None:
+            return 0.0
+        ttl = self.ttls.get(source_type, DEFAULT_TTL)
+        return max(0.0, time.time() - (entry.expires_at - ttl))
+
+    def set(self, source_type: str, params: Tuple[str, ...], limit: int,
+            results: List[Result]) -> None:
+        """
+        Stores the results fetched with `limit` for the TTL of the source type.
+        """
+        key, entry = self._entry(source_type, params, limit, results)
+        if entry is not None and self.backend is not None:
+            self._backend_set(key, entry)
+
+    async def set_async(self, source_type: str, params: Tuple[str, ...],
+                        limit: int, results: List[Result]) -> None:
+        """
+        Like `set`, writing to the shared backend on an executor thread
+        """
+        key, entry = self._entry(source_type, params, limit, results)
+        if entry is not None and self.backend is not None:
+            await asyncio.get_running_loop().run_in_executor(
+                None, self._backend_set, key, entry)
+
+    def _entry(self, source_type: str, params: Tuple[str, ...], limit: int,
+               results: List[Result]) -> \
+            Tuple[CacheKey, Optional[CacheEntry]]:
+        """
+        Stores a new entry in memory and returns it, None when the current
+        entry is kept
+        """
+        key = make_key(source_type, params)
+        ttl = self.ttls.get(source_type, DEFAULT_TTL)
+        entry = CacheEntry(limit, list(results), time.time() + ttl)
+
+        with self._lock:
+            current = self.entries.get(key)
+            if current is not None and current.limit > limit and \
+                    current.expires_at > time.time():
+                # Keep the entry that can serve more requests
+                return key, None
+
+        self._store(key, entry)
+        return key, entry
+
+    def _backend_set(self, key: CacheKey, entry: CacheEntry) -> None:
+        try:
+            self.backend.set(key, entry)
+        except sqlite3.Error as e:
+            logging.error("shared cache write failed: %r", e)
+
+    def clear(self) -> None:
+        """
+        Drops every in-memory entry
+        """
+        with self._lock:
+            self.entries.clear()
+            self.size = 0
+
+    def _store(self, key: CacheKey, entry: CacheEntry) -> None:
+        with self._lock:
+            if key in self.entries:
+                self._evict(key)
+            if entry.size > self.max_bytes:
+                return
+            self.entries[key] = entry
+            self.size += entry.size
+            while self.size > self.max_bytes:
+                self._evict(next(iter(self.entries)))
+
+    def _evict(self, key: CacheKey) -> None:
+        entry = self.entries.pop(key)
+        self.size -= entry.size
+
+
+def create_cache_from_env() -> ResultCache:
+    """
+    Creates the API cache. Setting FUSE_CACHE_PATH to a file path shares
+    cached results between all processes using that path.
+    """
+    path = os.environ.get('FUSE_CACHE_PATH')
+    backend = SqliteCacheBackend(path) if path else None
+    max_bytes = int(os.environ.get('FUSE_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES))
+    return ResultCache(max_bytes=max_bytes, backend=backend)
@@ -0,0 +1,201 @@
+import hashlib
+import json
+import re
+from collections import OrderedDict
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from src.models import Result
+
+"""
+Dedup module, drops results already seen from another source or run.
+"""
+
+# Only parameters known to be trackers: generic names such as `ref` or
+# `source` select the content on some sites
+TRACKING_PARAMS = {
+    'fbclid', 'gclid', 'dclid', 'msclkid', 'mc_cid', 'mc_eid', 'igshid',
+    'ref_src', 'cmpid', 'ncid', 'sr_share', 'at_medium', 'at_campaign',
+}
+TRACKING_PREFIXES = ('utm_', 'hmb_', 'pk_')
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+SIMHASH_BITS = 64
+# Titles within this many differing bits are near-duplicates. With the hash
+# split into SIMHASH_MAX_DISTANCE + 1 bands, two such titles are guaranteed
+# to agree on at least one whole band, so only titles sharing a band are
+# ever compared.
+SIMHASH_MAX_DISTANCE = 3
+SIMHASH_BANDS = SIMHASH_MAX_DISTANCE + 1
+SIMHASH_BAND_BITS = SIMHASH_BITS // SIMHASH_BANDS
+# Shorter titles ("Show HN", "Weekly thread") are too generic to compare
+SIMHASH_MIN_TOKENS = 4
+
+TOKEN_RE = re.compile(r"\w+")
+
+
+def canonicalize_url(url: str) -> str:
+    """
+    Normalizes a URL so that copies of the same article compare equal:
+    https scheme, lowercase host without `www.` and default port, tracking
+    parameters and fragment dropped, remaining parameters sorted and no
+    trailing slash. URLs too malformed to be split (bad port, unclosed IPv6
+    bracket) are only stripped of surrounding whitespace.
+    """
+    try:
+        parts = urlsplit(url.strip())
+        port = parts.port
+    except ValueError:
+        return url.strip()
+    scheme = parts.scheme.lower()
+    if scheme == 'http':
+        scheme = 'https'
+
+    host = (parts.hostname or '').lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    if port is not None and port not in DEFAULT_PORTS.values():
+        host = f"{host}:{port}"
+
+    query = sorted(
+        (key, value)
+        for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if key.lower() not in TRACKING_PARAMS and
+        not key.lower().startswith(TRACKING_PREFIXES)
+    )
+    path = parts.path.rstrip('/')
+
+    return urlunsplit((scheme, host, path, urlencode(query), ''))
+
+
+def simhash(title: str) -> Optional[int]:
+    """
+    64-bit SimHash of the words of a title, None for titles too short to be
+    told apart reliably
+    """
+    tokens = TOKEN_RE.findall(title.lower())
+    if len(tokens) < SIMHASH_MIN_TOKENS:
+        return None
+
+    weights = [0] * SIMHASH_BITS
+    for token in tokens:
+        digest = hashlib.blake2b(token.encode(), digest_size=8).digest()
+        value = int.from_bytes(digest, 'big')
+        for bit in range(SIMHASH_BITS):
+            if value >> bit & 1:
+                weights[bit] += 1
+            else:
+                weights[bit] -= 1
+
+    return sum(1 << bit for bit, weight in enumerate(weights) if weight > 0)
+
+
+def bands(fingerprint: int) -> List[Tuple[int, int]]:
+    """
+    Splits a SimHash into its (band index, band value) pairs
+    """
+    mask = (1 << SIMHASH_BAND_BITS) - 1
+    return [(band, fingerprint >> (band * SIMHASH_BAND_BITS) & mask)
+            for band in range(SIMHASH_BANDS)]
+
+
+class Deduplicator:
+    """
+    Streaming filter over results, drops the ones whose canonical URL or
+    near-identical title was seen before. Remembers the last `max_items`
+    items, across calls and, through `save` / `load`, across runs.
+    """
+
+    def __init__(self, max_items: int = 10000) -> None:
+        self.max_items = max_items
+        # canonical url -> title simhash, in least recently seen order
+        self.seen: "OrderedDict[str, Optional[int]]" = OrderedDict()
+        self.band_index: Dict[Tuple[int, int], Set[int]] = {}
+        self.fingerprints: Dict[int, int] = {}
+        self.duplicates = 0
+
+    def filter(self, results: Iterable[Result]) -> Iterator[Result]:
+        """
+        Yields the results not seen before, remembering them as it goes
+        """
+        for result in results:
+            if not result.url and not result.title:
+                continue
+            if self.is_duplicate(result):
+                self.duplicates += 1
+                continue
+            yield result
+
+    def is_duplicate(self, result: Result) -> bool:
+        """
+        Checks `result` against the remembered items, then remembers it
+        """
+        # Results without a URL are told apart by their exact title
+        url = canonicalize_url(result.url) if result.url else ''
+        key = url or f"title:{result.title}"
+        if key in self.seen:
+            self.seen.move_to_end(key)
+            return True
+
+        fingerprint = simhash(result.title) if result.title else None
+        if fingerprint is not None and self._near_duplicate(fingerprint):
+            return True
+
+        self._remember(key, fingerprint)
+        return False
+
+    def _near_duplicate(self, fingerprint: int) -> bool:
+        for band in bands(fingerprint):
+            for other in self.band_index.get(band, ()):
+                if bin(fingerprint ^ other).count('1') <= \
+                        SIMHASH_MAX_DISTANCE:
+                    return True
+        return False
+
+    def _remember(self, key: str, fingerprint: Optional[int]) -> None:
+        self.seen[key] = fingerprint
+        if fingerprint is not None:
+            self.fingerprints[fingerprint] = \
+                self.fingerprints.get(fingerprint, 0) + 1
+            for band in bands(fingerprint):
+                self.band_index.setdefault(band, set()).add(fingerprint)
+
+        while len(self.seen) > self.max_items:
+            _, evicted = self.seen.popitem(last=False)
+            self._forget(evicted)
+
+    def _forget(self, fingerprint: Optional[int]) -> None:
+        if fingerprint is None:
+            return
+        count = self.fingerprints[fingerprint] - 1
+        if count:
+            self.fingerprints[fingerprint] = count
+            return
+
+        del self.fingerprints[fingerprint]
+        for band in bands(fingerprint):
+            members = self.band_index[band]
+            members.discard(fingerprint)
+            if not members:
+                del self.band_index[band]
+
+    def save(self, path: str) -> None:
+        """
+        Writes the remembered items to `path`
+        """
+        with open(path, 'w') as state_file:
+            json.dump(list(self.seen.items()), state_file)
+
+    def load(self, path: str) -> None:
+        """
+        Remembers the items saved in `path`, if it exists
+        """
+        try:
+            with open(path) as state_file:
+                items = json.load(state_file)
+        except FileNotFoundError:
+            return
+
+        for key, fingerprint in items:
+            if key not in self.seen:
+                self._remember(key, fingerprint)
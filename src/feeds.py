@@ -0,0 +1,381 @@
+import asyncio
+import calendar
+import email.utils
+import logging
+import time
+import xml.etree.ElementTree as ElementTree
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import feedparser
+import httpx
+
+from src.upstream import upstreams
+
+"""
+Feeds module, responsible for fetching and parsing RSS feeds.
+"""
+
+FEED_TIMEOUT = httpx.Timeout(5.0, connect=3.0)
+MAX_FEED_BYTES = 5 * 1024 * 1024
+
+ATOM = '{http://www.w3.org/2005/Atom}'
+DC = '{http://purl.org/dc/elements/1.1/}'
+RDF = '{http://www.w3.org/1999/02/22-rdf-syntax-ns#}'
+RSS1 = '{http://purl.org/rss/1.0/}'
+ENTRY_TAGS = {'item', f'{RSS1}item', f'{ATOM}entry'}
+# Root elements of RSS 2.0, RSS 1.0 (RDF) and Atom, other formats are left
+# to feedparser
+FEED_ROOTS = {'rss', f'{RDF}RDF', f'{ATOM}feed'}
+
+
+class FeedState:
+    """
+    Validators sent by the server for a feed, with the entries parsed from it.
+    `complete` is False when parsing stopped after the entries we needed.
+    """
+    __slots__ = ('etag', 'last_modified', 'entries', 'complete')
+
+    def __init__(self, etag: Optional[str], last_modified: Optional[str],
+                 entries: List[feedparser.FeedParserDict],
+                 complete: bool = True) -> None:
+        self.etag = etag
+        self.last_modified = last_modified
+        self.entries = entries
+        self.complete = complete
+
+    def serves(self, limit: Optional[int]) -> bool:
+        """
+        Whether the saved entries are enough for a request of `limit`
+        """
+        return self.complete or \
+            (limit is not None and limit <= len(self.entries))
+
+
+class ConditionalFeedCache:
+    """
+    Remembers the ETag / Last-Modified of recently fetched feeds so that the
+    next request can be conditional, and the parsed entries so that a 304
+    answer can be served without downloading or parsing the feed again.
+    """
+
+    def __init__(self, max_feeds: int = 1024) -> None:
+        self.max_feeds = max_feeds
+        self.states: "OrderedDict[str, FeedState]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def request_headers(self, url: str,
+                        limit: Optional[int] = None) -> Dict[str, str]:
+        """
+        Conditional headers for the next request of `url`, none when the
+        saved entries wouldn't be enough for `limit` anyway
+        """
+        state = self.states.get(url)
+        if state is None or not state.serves(limit):
+            return {}
+
+        headers = {}
+        if state.etag:
+            headers['If-None-Match'] = state.etag
+        if state.last_modified:
+            headers['If-Modified-Since'] = state.last_modified
+        return headers
+
+    def not_modified(self, url: str,
+                     limit: Optional[int] = None) -> Optional[List]:
+        """
+        Entries to serve for a 304 answer, None if we don't have (enough of)
+        them anymore
+        """
+        state = self.states.get(url)
+        if state is None or not state.serves(limit):
+            return None
+
+        self.states.move_to_end(url)
+        self.hits += 1
+        return state.entries
+
+    def store(self, url: str, response: httpx.Response,
+              entries: List[feedparser.FeedParserDict],
+              complete: bool = True) -> None:
+        """
+        Saves the validators of a full response along with its entries
+        """
+        self.misses += 1
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if not etag and not last_modified:
+            self.states.pop(url, None)
+            return
+
+        self.states[url] = FeedState(etag, last_modified, entries, complete)
+        self.states.move_to_end(url)
+        while len(self.states) > self.max_feeds:
+            self.states.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Counters of not-modified hits and full downloads
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'feeds': len(self.states),
+        }
+
+
+feed_cache = ConditionalFeedCache()
+
+
+def entry_published(entry: feedparser.FeedParserDict) -> Optional[float]:
+    """
+    Publication (or last update) time of a feed entry in epoch seconds
+    """
+    parsed = entry.get('published_parsed') or entry.get('updated_parsed')
+    return float(calendar.timegm(parsed)) if parsed else None
+
+
+def parse_date(value: Optional[str]) -> Optional[time.struct_time]:
+    """
+    UTC struct_time of an RSS (RFC 822) or Atom (ISO 8601) date
+    """
+    if not value:
+        return None
+    value = value.strip()
+
+    parsed = email.utils.parsedate_tz(value)
+    if parsed is not None:
+        return time.gmtime(email.utils.mktime_tz(parsed))
+
+    try:
+        moment = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.utctimetuple()
+
+
+def element_to_entry(element: ElementTree.Element) -> \
+        feedparser.FeedParserDict:
+    """
+    Builds a feedparser-like entry out of an RSS 2.0 or 1.0 `item` or an
+    Atom `entry`
+    """
+    def text(*tags: str) -> Optional[str]:
+        for tag in tags:
+            child = element.find(tag)
+            if child is not None and child.text:
+                return child.text.strip()
+        return None
+
+    link = text('link', f'{RSS1}link')
+    if link is None:
+        for child in element.iter(f'{ATOM}link'):
+            if child.get('rel', 'alternate') == 'alternate':
+                link = child.get('href')
+                break
+
+    author = text(f'{DC}creator', 'author', f'{ATOM}author/{ATOM}name')
+    published = text('pubDate', f'{ATOM}published', f'{DC}date')
+    updated = text(f'{ATOM}updated')
+
+    return feedparser.FeedParserDict(
+        title=text('title', f'{RSS1}title', f'{ATOM}title'),
+        link=link,
+        links=[feedparser.FeedParserDict(href=link)] if link else [],
+        id=text('guid', f'{ATOM}id') or element.get(f'{RDF}about'),
+        author=author,
+        published_parsed=parse_date(published),
+        updated_parsed=parse_date(updated),
+    )
+
+
+class FeedStreamParser:
+    """
+    Incremental RSS / Atom parser. Chunks of the feed are fed as they arrive
+    and entries are built as soon as their closing tag is read, so parsing
+    can stop once `limit` entries are in.
+    `known_format` turns False once the root element shows the document
+    isn't RSS 2.0, RSS 1.0 or Atom.
+    """
+
+    def __init__(self, limit: Optional[int] = None) -> None:
+        self.limit = limit
+        self.entries: List[feedparser.FeedParserDict] = []
+        self.root: Optional[str] = None
+        self._parser = ElementTree.XMLPullParser(events=('start', 'end'))
+
+    @property
+    def done(self) -> bool:
+        return self.limit is not None and len(self.entries) >= self.limit
+
+    @property
+    def known_format(self) -> bool:
+        return self.root is None or self.root in FEED_ROOTS
+
+    def feed(self, chunk: bytes) -> None:
+        """
+        Parses `chunk`, raises ElementTree.ParseError on malformed XML
+        """
+        self._parser.feed(chunk)
+        for event, element in self._parser.read_events():
+            if event == 'start':
+                if self.root is None:
+                    self.root = element.tag
+                continue
+            if element.tag not in ENTRY_TAGS or self.done or \
+                    not self.known_format:
+                continue
+            self.entries.append(element_to_entry(element))
+            element.clear()
+
+
+def needs_feedparser(parser: FeedStreamParser, body: bytes) -> bool:
+    """
+    Whether a feed the incremental parser read whole should be handed to
+    feedparser instead: its format is unknown, or it has a body but no
+    entries were found in it
+    """
+    return not parser.known_format or \
+        (not parser.entries and bool(body.strip()))
+
+
+def parse_with_feedparser(body: bytes, limit: Optional[int]) -> \
+        Tuple[List[feedparser.FeedParserDict], bool]:
+    entries = feedparser.parse(body).entries
+    return (entries if limit is None else entries[:limit]), \
+        limit is None or len(entries) <= limit
+
+
+class FeedReader:
+    """
+    Reads a feed chunk by chunk with the incremental parser, keeping the
+    body in case it has to be handed to feedparser: when the XML parser
+    rejects it, when it is of another format or has no entry the incremental
+    parser recognizes, or when it is cut at `max_bytes`. Feedparser copes
+    with broken markup and every feed format.
+    """
+
+    def __init__(self, limit: Optional[int] = None,
+                 max_bytes: Optional[int] = None) -> None:
+        self.limit = limit
+        self.max_bytes = max_bytes
+        self.parser = FeedStreamParser(limit)
+        self.body = bytearray()
+        self.fallback = False
+        self.truncated = False
+
+    def feed(self, chunk: bytes) -> bool:
+        """
+        Reads the next chunk, returns whether no more chunks are needed
+        """
+        self.body.extend(chunk)
+        if self.max_bytes is not None and len(self.body) > self.max_bytes:
+            del self.body[self.max_bytes:]
+            self.truncated = True
+            return True
+
+        if not self.fallback:
+            try:
+                self.parser.feed(chunk)
+            except ElementTree.ParseError:
+                self.fallback = True
+            if self.parser.done:
+                return True
+            self.fallback = self.fallback or not self.parser.known_format
+        return False
+
+    def streamed_entries(self) -> \
+            Optional[Tuple[List[feedparser.FeedParserDict], bool]]:
+        """
+        The entries of the incremental parser and whether the whole feed
+        was read, once no more chunks are needed or there are none left.
+        None when the body has to be parsed by feedparser instead.
+        """
+        if self.parser.done:
+            return self.parser.entries, False
+        if self.fallback or self.truncated or \
+                needs_feedparser(self.parser, self.body):
+            return None
+        return self.parser.entries, True
+
+    def feedparser_entries(self) -> \
+            Tuple[List[feedparser.FeedParserDict], bool]:
+        return parse_with_feedparser(bytes(self.body), self.limit)
+
+
+def parse_feed_chunks(chunks: Iterable[bytes],
+                      limit: Optional[int] = None) -> \
+        List[feedparser.FeedParserDict]:
+    """
+    Parses up to `limit` entries out of the chunks of a feed, without reading
+    the chunks past the last entry needed, like `read_feed_entries` does for
+    a response
+    """
+    reader = FeedReader(limit)
+    for chunk in chunks:
+        if reader.feed(chunk):
+            break
+    return (reader.streamed_entries() or reader.feedparser_entries())[0]
+
+
+async def read_feed_entries(response: httpx.Response, limit: Optional[int],
+                            max_bytes: int) -> \
+        Tuple[List[feedparser.FeedParserDict], bool]:
+    """
+    Streams the body of `response` into a FeedReader until `limit` entries
+    are read or `max_bytes` were downloaded. Feeds left to feedparser are
+    parsed on an executor thread.
+    Returns the entries and whether the whole feed was read.
+    """
+    reader = FeedReader(limit, max_bytes)
+    async for chunk in response.aiter_bytes():
+        if reader.feed(chunk):
+            break
+    if reader.truncated:
+        logging.info("feed %s is over %d bytes, truncating", response.url,
+                     max_bytes)
+
+    streamed = reader.streamed_entries()
+    if streamed is not None:
+        return streamed
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, reader.feedparser_entries)
+
+
+async def fetch_feed_entries(url: str, limit: Optional[int] = None,
+                             max_bytes: int = MAX_FEED_BYTES) -> \
+        List[feedparser.FeedParserDict]:
+    """
+    Streams the feed over the pooled HTTP client with connect and read
+    timeouts and parses it as it arrives, stopping after `limit` entries.
+    The request is conditional when we have seen the feed before, and a 304
+    answer reuses the entries parsed last time.
+    Upstream errors are raised (httpx.HTTPError) rather than taken for an
+    empty feed, so that callers such as the poller can tell an outage apart.
+    """
+    headers = feed_cache.request_headers(url, limit)
+    response = await upstreams.get(url, stream=True, headers=headers,
+                                   follow_redirects=True,
+                                   timeout=FEED_TIMEOUT)
+    try:
+        if response.status_code == 304:
+            entries = feed_cache.not_modified(url, limit)
+            if entries is not None:
+                return entries if limit is None else entries[:limit]
+            # Evicted meanwhile, ask for the full feed
+            await response.aclose()
+            response = await upstreams.get(url, stream=True,
+                                           follow_redirects=True,
+                                           timeout=FEED_TIMEOUT)
+        response.raise_for_status()
+        entries, complete = await read_feed_entries(response, limit,
+                                                    max_bytes)
+    finally:
+        await response.aclose()
+
+    feed_cache.store(url, response, entries, complete)
+    return entries
@@ -1,10 +1,14 @@
 import asyncio
 import logging
 import os
-from typing import List
-import requests
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+
+import httpx
 from colorama import Fore, Style
 
+from src.upstream import upstreams
 from src.models import Source, Result
 
 
@@ -13,18 +17,73 @@ HackerNews module, responsible for querying hackernews API.
 """
 
 
+class HackerNewsItemCache:
+    """
+    Process-wide cache of HackerNews stories for incremental polling.
+    Stories are kept until HN's updates feed reports them changed, or for at
+    most `item_ttl` seconds in case a change happened between polls further
+    apart than the updates feed covers. Also remembers the stories list of
+    each metric along with the max item id it was fetched at.
+    """
+
+    def __init__(self, max_items: int = 10000,
+                 item_ttl: float = 300) -> None:
+        self.max_items = max_items
+        self.item_ttl = item_ttl
+        self.items: "OrderedDict[int, Tuple[Result, float]]" = OrderedDict()
+        self.story_lists: Dict[str, Tuple[int, List[int]]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, story_id: int) -> Optional[Result]:
+        """
+        The cached story, if it is still fresh
+        """
+        cached = self.items.get(story_id)
+        if cached is None or time.time() - cached[1] > self.item_ttl:
+            self.misses += 1
+            return None
+        self.items.move_to_end(story_id)
+        self.hits += 1
+        return cached[0]
+
+    def put(self, story_id: int, result: Result) -> None:
+        self.items[story_id] = (result, time.time())
+        self.items.move_to_end(story_id)
+        while len(self.items) > self.max_items:
+            self.items.popitem(last=False)
+
+    def invalidate(self, story_ids: Set[int]) -> None:
+        for story_id in story_ids:
+            self.items.pop(story_id, None)
+
+
+item_cache = HackerNewsItemCache()
+
+
 class HackerNewsSource(Source):
     """
     HackerNewsSource class accepts a metric from self.valid_metrics and a limit.
     Queries the HackerNews API with regarding to the specified metric and limit.
+    Stories are fetched concurrently over a pooled HTTP client, with at most
+    `max_concurrency` requests in flight and `item_timeout` seconds per story.
+    With `incremental`, stories are kept in `item_cache` between fetches and
+    only the ones HN reports as changed (or that are new to us) are fetched
+    again, so a poll with little change costs a couple of requests.
     """
 
-    def __init__(self, metric: str = 'top', limit: int = 10):
+    def __init__(self, metric: str = 'top', limit: int = 10,
+                 max_concurrency: int = 20,
+                 item_timeout: float = 5.0,
+                 incremental: bool = False):
         """
         Initiate valid metrics, base URL for API and an empty results list.
         """
         self.metric = metric
         self.limit = limit
+        self.max_concurrency = max_concurrency
+        self.item_timeout = item_timeout
+        self.incremental = incremental
         self.valid_metrics = ['top', 'best', 'new']
         self.base_url = 'https://hacker-news.firebaseio.com/v0'
         self.results: List[Result] = []
@@ -36,12 +95,12 @@ class HackerNewsSource(Source):
         """
         pass
 
-    def fetch(self) -> None:
+    async def fetch_async(self) -> List[Result]:
         """
-        Asynchronous Wrapper for the actual fetch mechanism `do_fetch`.
+        Asynchronous wrapper for the actual fetch mechanism `do_fetch`.
         """
-        results = asyncio.run(self.do_fetch())
-        self.results = results
+        self.results = await self.do_fetch()
+        return self.results
 
     async def do_fetch(self) -> List[Result]:
         """
@@ -51,12 +110,30 @@ class HackerNewsSource(Source):
         if self.limit < 0 or self.metric.lower() not in self.valid_metrics:
             return []
 
-        request_url = f"{self.base_url}/{self.metric}stories.json"
+        if self.incremental:
+            return await self.do_incremental_fetch()
 
-        response = requests.get(request_url)
+        stories_ids = await self.fetch_stories_ids()
+        return await self.fetch_stories(stories_ids)
+
+    async def fetch_stories_ids(self) -> List[int]:
+        """
+        Ids of the stories of the metric, in ranking order
+        """
+        request_url = f"{self.base_url}/{self.metric.lower()}stories.json"
+
+        response = await upstreams.get(request_url)
         response.raise_for_status()
 
-        stories_ids = response.content[:self.limit]
+        return response.json()[:self.limit]
+
+    async def fetch_stories(self, stories_ids: List[int]) -> List[Result]:
+        """
+        Fetches the details of every story concurrently. Stories that fail
+        to fetch are left empty, unless they all fail: that is an outage,
+        and the first error is raised.
+        """
+        semaphore = asyncio.Semaphore(max(1, self.max_concurrency))
 
         if os.getenv("PYCHARM_HOSTED") == "1":
             # PYCHARM_HOSTED env variable equals 1 when running via Pycharm.
@@ -64,31 +141,104 @@ class HackerNewsSource(Source):
             # multiprocessing via Pycharm's debug-mode
             results = []
             for story_id in stories_ids:
-                results.append(await self.fetch_story_by_id(story_id))
+                try:
+                    results.append(
+                        await self.fetch_story_by_id(story_id, semaphore))
+                except httpx.HTTPError as e:
+                    results.append(e)
         else:
-            results = await asyncio.gather(*[self.fetch_story_by_id(i)
-                                             for i in stories_ids])
-        return results
-
-    async def fetch_story_by_id(self, story_id: str) -> Result:
+            results = await asyncio.gather(
+                *[self.fetch_story_by_id(i, semaphore) for i in stories_ids],
+                return_exceptions=True)
+
+        errors = [result for result in results
+                  if isinstance(result, BaseException)]
+        for error in errors:
+            if not isinstance(error, httpx.HTTPError):
+                raise error
+        if errors and len(errors) == len(results):
+            raise errors[0]
+        for story_id, error in zip(stories_ids, results):
+            if isinstance(error, BaseException):
+                logging.info("failed to retrieve %s: %r", story_id, error)
+        return [Result(title="", url="")
+                if isinstance(result, BaseException) else result
+                for result in results]
+
+    async def do_incremental_fetch(self) -> List[Result]:
+        """
+        Fetches only the stories that are new to `item_cache` or that HN's
+        updates feed reports as changed. For the `new` metric the stories
+        list itself is reused while `maxitem` hasn't moved.
         """
-        Fetching a single story details by the story_id
+        metric = self.metric.lower()
+
+        stories_ids = None
+        max_item = None
+        if metric == 'new':
+            response = await upstreams.get(
+                f"{self.base_url}/maxitem.json")
+            response.raise_for_status()
+            max_item = response.json()
+            known = item_cache.story_lists.get(metric)
+            if known is not None and known[0] == max_item and \
+                    len(known[1]) >= self.limit:
+                stories_ids = known[1][:self.limit]
+
+        if stories_ids is None:
+            stories_ids = await self.fetch_stories_ids()
+            if max_item is not None:
+                item_cache.story_lists[metric] = (max_item, stories_ids)
+
+        try:
+            response = await upstreams.get(
+                f"{self.base_url}/updates.json")
+            response.raise_for_status()
+            item_cache.invalidate(set(response.json().get('items', [])))
+        except httpx.HTTPError as e:
+            # Without the updates feed we can't trust the cache, but the
+            # ttl bounds how stale it can get
+            logging.info("failed to retrieve HN updates: %r", e)
+
+        cached = {story_id: item_cache.get(story_id)
+                  for story_id in stories_ids}
+        missing = [story_id for story_id, result in cached.items()
+                   if result is None]
+        for story_id, result in zip(missing,
+                                    await self.fetch_stories(missing)):
+            if result.title or result.url:
+                item_cache.put(story_id, result)
+            cached[story_id] = result
+
+        return [cached[story_id] for story_id in stories_ids]
+
+    async def fetch_story_by_id(self, story_id: int,
+                                semaphore: asyncio.Semaphore = None) -> Result:
+        """
+        Fetching a single story details by the story_id, upstream errors are
+        raised (httpx.HTTPError)
         """
         request_url = f"{self.base_url}/item/{story_id}.json"
 
-        response = requests.get(request_url)
-        if not response.ok:
-            logging.info("failed to retrieve %".format(story_id))
-            return Result(
-                title="",
-                url=""
-            )
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(1)
+
+        async with semaphore:
+            response = await upstreams.get(request_url,
+                                           timeout=self.item_timeout)
+        response.raise_for_status()
 
-        response_json = response.json()
+        response_json = response.json() or {}
 
         return Result(
             title=response_json.get("title"),
-            url=response_json.get("url")
+            url=response_json.get("url"),
+            source='hackernews',
+            id=str(story_id),
+            published=response_json.get("time"),
+            author=response_json.get("by"),
+            score=response_json.get("score"),
+            comments=response_json.get("descendants")
         )
 
     def __repr__(self) -> str:
@@ -97,6 +247,4 @@ class HackerNewsSource(Source):
         """
         output = f"{Fore.GREEN}HackerNews Source Results " \
                  f"[Metric: {self.metric}]{Style.RESET_ALL} \n"
-        for result in self.results:
-            output += f"{result} \n"
-        return output
+        return output + ''.join(f"{result} \n" for result in self.results)
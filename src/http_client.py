@@ -0,0 +1,49 @@
+import asyncio
+import weakref
+from typing import Any, Dict, Optional
+
+import httpx
+
+"""
+HTTP client module, holds the pooled keep-alive clients shared by the sources.
+"""
+
+DEFAULT_TIMEOUT = httpx.Timeout(10.0, connect=5.0)
+DEFAULT_LIMITS = httpx.Limits(max_connections=100,
+                              max_keepalive_connections=20)
+
+# Extra keyword arguments of the clients created from now on, e.g. a custom
+# `transport` to point the sources at a fake upstream in benchmarks.
+client_options: Dict[str, Any] = {}
+
+# httpx.AsyncClient is bound to the event loop it was first used on, so we
+# keep a single client per running loop. The API runs one loop per worker,
+# which makes this a single client per process.
+_async_clients: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """
+    Returns the pooled AsyncClient of the running event loop, creating it on
+    first use.
+    """
+    loop = asyncio.get_running_loop()
+    client: Optional[httpx.AsyncClient] = _async_clients.get(loop)
+    if client is None or client.is_closed:
+        options = {'timeout': DEFAULT_TIMEOUT, 'limits': DEFAULT_LIMITS}
+        options.update(client_options)
+        client = httpx.AsyncClient(**options)
+        _async_clients[loop] = client
+    return client
+
+
+async def close_async_client() -> None:
+    """
+    Closes the pooled AsyncClient of the running event loop, if there is one.
+    Short-lived loops (e.g. `asyncio.run` in the CLI) should call this before
+    they exit.
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.pop(loop, None)
+    if client is not None:
+        await client.aclose()
@@ -0,0 +1,280 @@
+import asyncio
+import heapq
+import itertools
+import json
+import logging
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from src.http_client import close_async_client
+from src.metrics import track_fetch
+from src.models import Source, SourceManager
+from src.specs import create_source_from_spec
+
+"""
+Jobs module, runs the feeds listed in a YAML, TOML or JSON job file from a
+single process.
+"""
+
+JOB_KEYS = {'feeds', 'defaults', 'concurrency', 'watch'}
+FEED_KEYS = {'source', 'limit', 'ttl', 'priority', 'timeout'}
+
+DEFAULT_CONCURRENCY = 8
+
+# Modules reading job files -> the package providing them
+FORMAT_PACKAGES = {'yaml': 'PyYAML', 'tomli': 'tomli'}
+FEED_DEFAULTS = {'limit': 10, 'ttl': 300.0, 'priority': 0, 'timeout': None}
+
+
+class JobError(ValueError):
+    """
+    Raised for job files that can't be read or don't validate
+    """
+
+
+class JobFeed:
+    """
+    A feed of a job: its source spec, how many results to fetch, how long
+    they stay fresh (`ttl`, after which watching jobs fetch it again), its
+    `priority` over the other feeds due at the same time and the seconds it
+    is given to fetch (`timeout`, None for no limit).
+    """
+    __slots__ = ('spec', 'limit', 'ttl', 'priority', 'timeout',
+                 'create_source')
+
+    def __init__(self, spec: str, limit: int, ttl: float, priority: int,
+                 timeout: Optional[float],
+                 create_source: Callable[[], Source]) -> None:
+        self.spec = spec
+        self.limit = limit
+        self.ttl = ttl
+        self.priority = priority
+        self.timeout = timeout
+        self.create_source = create_source
+
+
+class Job:
+    """
+    The feeds of a job file, fetched `concurrency` at a time, once or again
+    and again when `watch` is set.
+    """
+    __slots__ = ('feeds', 'concurrency', 'watch')
+
+    def __init__(self, feeds: List[JobFeed],
+                 concurrency: int = DEFAULT_CONCURRENCY,
+                 watch: bool = False) -> None:
+        self.feeds = feeds
+        self.concurrency = concurrency
+        self.watch = watch
+
+
+def read_job_file(path: str) -> Dict[str, Any]:
+    """
+    Reads a job file, its format is told by its extension
+    """
+    extension = os.path.splitext(path)[1].lower()
+    try:
+        if extension == '.json':
+            with open(path) as job_file:
+                return json.load(job_file)
+        if extension in ('.yaml', '.yml'):
+            import yaml
+            with open(path) as job_file:
+                return yaml.safe_load(job_file)
+        if extension == '.toml':
+            try:
+                import tomllib
+            except ImportError:
+                import tomli as tomllib
+            with open(path, 'rb') as job_file:
+                return tomllib.load(job_file)
+    except ImportError as e:
+        package = FORMAT_PACKAGES.get(e.name, e.name)
+        raise JobError(f"{path}: reading {extension} files requires "
+                       f"{package}, install it with `pip install {package}`")
+    except Exception as e:
+        # OSError, or the parse error of whichever format
+        raise JobError(f"{path}: {e}")
+
+    raise JobError(f"{path}: unknown job file format, use .json, .yaml, "
+                   f".yml or .toml")
+
+
+def check_number(value: Any, where: str, integer: bool = False,
+                 minimum: float = 0, allow_none: bool = False) -> Any:
+    if value is None and allow_none:
+        return None
+    types = (int,) if integer else (int, float)
+    if isinstance(value, bool) or not isinstance(value, types):
+        kind = 'an integer' if integer else 'a number'
+        raise JobError(f"{where} should be {kind}, got {value!r}")
+    if value < minimum:
+        raise JobError(f"{where} should be at least {minimum}, "
+                       f"got {value!r}")
+    return value
+
+
+def parse_feed(data: Any, defaults: Dict[str, Any], where: str) -> JobFeed:
+    if isinstance(data, str):
+        data = {'source': data}
+    if not isinstance(data, dict):
+        raise JobError(f"{where} should be a source spec or a table")
+    unknown = set(data) - FEED_KEYS
+    if unknown:
+        raise JobError(f"{where}: unknown keys {sorted(unknown)}")
+    if 'source' not in data:
+        raise JobError(f"{where}: missing source")
+
+    values = dict(defaults, **data)
+    limit = check_number(values['limit'], f"{where}.limit", integer=True)
+    ttl = check_number(values['ttl'], f"{where}.ttl", minimum=1)
+    priority = check_number(values['priority'], f"{where}.priority",
+                            integer=True, minimum=float('-inf'))
+    timeout = check_number(values['timeout'], f"{where}.timeout",
+                           minimum=0, allow_none=True)
+
+    spec = values['source']
+    try:
+        _, _, factory = create_source_from_spec(str(spec), limit)
+    except ValueError as e:
+        raise JobError(f"{where}: {e}")
+    return JobFeed(spec, limit, float(ttl), priority,
+                   None if timeout is None else float(timeout), factory)
+
+
+def parse_job(data: Any, path: str = 'job') -> Job:
+    """
+    Validates the content of a job file, raising JobError on the first
+    mistake found
+    """
+    if not isinstance(data, dict):
+        raise JobError(f"{path}: expected a table with a `feeds` list")
+    unknown = set(data) - JOB_KEYS
+    if unknown:
+        raise JobError(f"{path}: unknown keys {sorted(unknown)}")
+
+    defaults = data.get('defaults') or {}
+    if not isinstance(defaults, dict) or \
+            set(defaults) - (FEED_KEYS - {'source'}):
+        raise JobError(f"{path}: defaults may only set "
+                       f"{sorted(FEED_KEYS - {'source'})}")
+    defaults = dict(FEED_DEFAULTS, **defaults)
+
+    concurrency = check_number(data.get('concurrency', DEFAULT_CONCURRENCY),
+                               f"{path}: concurrency", integer=True,
+                               minimum=1)
+    watch = data.get('watch', False)
+    if not isinstance(watch, bool):
+        raise JobError(f"{path}: watch should be true or false")
+
+    feeds_data = data.get('feeds')
+    if not isinstance(feeds_data, list) or not feeds_data:
+        raise JobError(f"{path}: `feeds` should be a non-empty list")
+
+    feeds = []
+    seen = set()
+    for index, feed_data in enumerate(feeds_data):
+        feed = parse_feed(feed_data, defaults, f"{path}: feeds[{index}]")
+        key = (feed.spec, feed.limit)
+        if key in seen:
+            raise JobError(f"{path}: feeds[{index}]: {feed.spec} is listed "
+                           f"twice")
+        seen.add(key)
+        feeds.append(feed)
+
+    return Job(feeds, concurrency, watch)
+
+
+def load_job(path: str) -> Job:
+    """
+    Reads and validates a job file
+    """
+    return parse_job(read_job_file(path), path)
+
+
+class JobRunner:
+    """
+    Fetches the feeds of a job on a single event loop, so that they share
+    the pooled HTTP client and Reddit clients. Up to `job.concurrency` feeds
+    are fetched at once; among the feeds due, higher priorities go first.
+    Each feed is printed through `manager` (which handles the output format,
+    deduplication and the article store) as soon as it is fetched.
+    When watching, a feed is fetched again once its `ttl` has passed since
+    its last fetch started; otherwise the run ends once every feed was
+    fetched.
+    """
+
+    def __init__(self, job: Job, manager: SourceManager) -> None:
+        self.job = job
+        self.manager = manager
+        self.fetches = 0
+        self.failures = 0
+
+    async def fetch(self, feed: JobFeed) -> None:
+        source = feed.create_source()
+        self.fetches += 1
+        try:
+            with track_fetch(source):
+                await asyncio.wait_for(source.fetch_async(), feed.timeout)
+        except asyncio.TimeoutError:
+            self.failures += 1
+            self.manager.report_failure(source, "timed out")
+        except Exception as e:
+            self.failures += 1
+            logging.error("%s failed to fetch: %r", feed.spec, e)
+            self.manager.report_failure(source, repr(e))
+        else:
+            self.manager.present(source)
+
+    async def run(self, watch: Optional[bool] = None) -> None:
+        watch = self.job.watch if watch is None else watch
+        semaphore = asyncio.Semaphore(self.job.concurrency)
+        wake_up = asyncio.Event()
+        # (due time, sequence, feed) and (-priority, sequence, feed), the
+        # sequence keeps feeds of equal keys in order
+        sequence = itertools.count()
+        waiting: List[Tuple[float, int, JobFeed]] = []
+        ready: List[Tuple[int, int, JobFeed]] = [
+            (-feed.priority, next(sequence), feed) for feed in self.job.feeds]
+        heapq.heapify(ready)
+        running = set()
+
+        async def fetch_and_reschedule(feed: JobFeed) -> None:
+            started = time.monotonic()
+            try:
+                await self.fetch(feed)
+            finally:
+                semaphore.release()
+                running.discard(asyncio.current_task())
+                if watch:
+                    heapq.heappush(waiting, (started + feed.ttl,
+                                             next(sequence), feed))
+                wake_up.set()
+
+        try:
+            while waiting or ready or running:
+                now = time.monotonic()
+                while waiting and waiting[0][0] <= now:
+                    _, _, feed = heapq.heappop(waiting)
+                    heapq.heappush(ready,
+                                   (-feed.priority, next(sequence), feed))
+
+                if not ready:
+                    wake_up.clear()
+                    timeout = waiting[0][0] - now if waiting else None
+                    try:
+                        await asyncio.wait_for(wake_up.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+
+                await semaphore.acquire()
+                _, _, feed = heapq.heappop(ready)
+                running.add(asyncio.ensure_future(fetch_and_reschedule(feed)))
+        finally:
+            tasks = list(running)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await close_async_client()
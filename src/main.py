@@ -1,24 +1,36 @@
 import argparse
+import asyncio
 import logging
-from typing import List
+from typing import TYPE_CHECKING, List, Optional
 import sys
 import os
 
-from src.aws_blog_source import AwsBlogSource
-from src.hn_source import HackerNewsSource
-from src.models import Source, SourceManager
-from src.reddit_source import RedditSource
-from src.medium_source import MediumSource
+from src.metrics import timings_summary
+from src.models import Source, SourceManager, results_to_ndjson
 from util.banner import BANNER as FUSE_BANNER
 
+if TYPE_CHECKING:
+    # Imported when their flags are used, see below
+    from src.dedup import Deduplicator
+    from src.store import ArticleStore
+
+# Source modules and the optional features are imported when their flags are
+# used: praw, feedparser and their dependencies take longer to import than a
+# single-source run takes otherwise.
+
 
 def run(banner: str = FUSE_BANNER, argv: List[str] = sys.argv[1:]) -> None:
     """
     Fuse entry point.
-    Creates the sources from the arguments passed and executes them.
+    Creates the sources from the arguments passed and executes them, or
+    runs a job file with `run JOBFILE`.
     @param banner: Fuse banner
     @param argv: arguments configuration
     """
+    if argv and argv[0] == 'run':
+        run_job_file(banner, argv[1:])
+        return
+
     config = create_config(argv)
 
     try:
@@ -28,11 +40,161 @@ def run(banner: str = FUSE_BANNER, argv: List[str] = sys.argv[1:]) -> None:
                      "detailed error log")
         sys.exit(1)
 
-    print(banner)
+    if config.search is not None:
+        search(banner, config)
+        return
+
+    if config.format == 'text':
+        print(banner)
     parsed_sources = create_sources_from_args(config)
-    source_manager = SourceManager(parsed_sources)
+
+    deduplicator = create_deduplicator(config)
+    store = create_store(config)
+
+    source_manager = SourceManager(
+        parsed_sources,
+        concurrent=config.concurrent,
+        max_workers=config.max_workers,
+        source_timeout=config.source_timeout,
+        deadline=config.deadline,
+        deduplicator=deduplicator,
+        output_format=config.format,
+        store=store,
+        new_only=config.new_only,
+        timeline_size=config.timeline,
+        ranking=config.rank
+    )
     source_manager()
 
+    finish(config, deduplicator, store)
+
+
+def run_job_file(banner: str, argv: List[str]) -> None:
+    """
+    Runs the feeds of a job file (see src.jobs) in this process, once or,
+    with --watch, until interrupted
+    @param banner: Fuse banner
+    @param argv: arguments following `run`
+    """
+    from src.jobs import JobError, JobRunner, load_job
+
+    parser = argparse.ArgumentParser(prog='fuse run',
+                                     description="Runs a job file")
+    parser.add_argument('jobfile', help="YAML, TOML or JSON job file")
+    parser.add_argument('--watch', action='store_true',
+                        help="keep fetching every feed once its ttl passed")
+    parser.add_argument('--check', action='store_true',
+                        help="only validate the job file")
+    add_output_args(parser)
+    config = parser.parse_args(argv)
+
+    try:
+        job = load_job(config.jobfile)
+    except JobError as e:
+        logging.error("%s", e)
+        sys.exit(1)
+
+    if config.check:
+        print(f"{config.jobfile}: {len(job.feeds)} feeds")
+        return
+
+    if config.timeline is not None and (config.watch or job.watch):
+        parser.error("--timeline is printed once every feed is fetched, "
+                     "which never happens with --watch")
+
+    if config.format == 'text':
+        print(banner)
+
+    deduplicator = create_deduplicator(config)
+    store = create_store(config)
+    manager = SourceManager(deduplicator=deduplicator,
+                            output_format=config.format, store=store,
+                            new_only=config.new_only,
+                            timeline_size=config.timeline,
+                            ranking=config.rank)
+    try:
+        asyncio.run(JobRunner(job, manager).run(
+            watch=config.watch or job.watch))
+        if config.timeline is not None:
+            manager.present_timeline()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        finish(config, deduplicator, store)
+
+
+def search(banner: str, config: argparse.Namespace) -> None:
+    """
+    Prints the stored articles matching --search, best first, without
+    fetching anything
+    @param banner: Fuse banner
+    @param config: configuration of the search
+    """
+    from src.store import ArticleStore, search_repr
+
+    store = ArticleStore(store_path(config))
+    try:
+        results = store.search(config.search, config.limit,
+                               order=config.search_order)
+    finally:
+        store.close()
+
+    if config.format == 'ndjson':
+        sys.stdout.write(''.join(results_to_ndjson(results)))
+    else:
+        print(banner)
+        print(search_repr(results, config.search))
+
+
+def create_deduplicator(config: argparse.Namespace) -> \
+        Optional["Deduplicator"]:
+    """
+    Deduplicator of the run, restored from --dedup_state if given
+    """
+    if not config.dedup and not config.dedup_state:
+        return None
+
+    from src.dedup import Deduplicator
+    deduplicator = Deduplicator()
+    if config.dedup_state:
+        deduplicator.load(config.dedup_state)
+    return deduplicator
+
+
+def create_store(config: argparse.Namespace) -> Optional["ArticleStore"]:
+    """
+    Article store of the run, if --store or --new_only were given
+    """
+    if not config.store and not config.new_only:
+        return None
+
+    from src.store import ArticleStore
+    return ArticleStore(store_path(config))
+
+
+def store_path(config: argparse.Namespace) -> str:
+    """
+    Path of the article store: --store, FUSE_STORE_PATH or the default one
+    """
+    from src.store import DEFAULT_STORE_PATH
+    return config.store or os.environ.get('FUSE_STORE_PATH',
+                                          DEFAULT_STORE_PATH)
+
+
+def finish(config: argparse.Namespace, deduplicator: Optional["Deduplicator"],
+           store: Optional["ArticleStore"]) -> None:
+    """
+    Prints the timings if asked to and saves the state of the run
+    """
+    if config.timings:
+        sys.stderr.write(timings_summary())
+
+    if store is not None:
+        store.close()
+
+    if config.dedup_state:
+        deduplicator.save(config.dedup_state)
+
 
 def create_config(argv: List[str]) -> argparse.Namespace:
     """
@@ -92,6 +254,8 @@ def create_sources_from_args(config: argparse.Namespace) -> List[Source]:
     sources = []
 
     if config.reddit:
+        from src.reddit_source import RedditSource, SubredditBatch
+        reddit_sources = []
         for subreddit, metric in zip(config.sub, config.metric):
             reddit_source = RedditSource(
                 subreddit=subreddit,
@@ -100,9 +264,13 @@ def create_sources_from_args(config: argparse.Namespace) -> List[Source]:
                 reddit_id=config.reddit_id,
                 reddit_secret=config.reddit_secret
             )
-            sources.append(reddit_source)
+            reddit_sources.append(reddit_source)
+        if len(reddit_sources) > 1:
+            SubredditBatch(reddit_sources)
+        sources.extend(reddit_sources)
 
     if config.medium:
+        from src.medium_source import MediumSource
         for tag in config.tag:
             medium_source = MediumSource(
                 tag=tag,
@@ -111,6 +279,7 @@ def create_sources_from_args(config: argparse.Namespace) -> List[Source]:
             sources.append(medium_source)
 
     if config.hn:
+        from src.hn_source import HackerNewsSource
         for metric in config.hn_metric:
             hn_source = HackerNewsSource(
                 metric=metric,
@@ -119,6 +288,7 @@ def create_sources_from_args(config: argparse.Namespace) -> List[Source]:
             sources.append(hn_source)
 
     if config.aws:
+        from src.aws_blog_source import AwsBlogSource
         for category in config.aws_category:
             aws_source = AwsBlogSource(
                 category=category,
@@ -150,6 +320,38 @@ def add_parser_args(parser: argparse.ArgumentParser) -> None:
 
     parser.add_argument('--limit', action='store', type=int, default=10)
 
+    parser.add_argument('--concurrent', action='store_true')
+    parser.add_argument('--max_workers', action='store', type=int, default=8)
+    parser.add_argument('--source_timeout', action='store', type=float)
+    parser.add_argument('--deadline', action='store', type=float)
+
+    parser.add_argument('--search', action='store', type=str)
+    parser.add_argument('--search_order', action='store',
+                        default='relevance', choices=['relevance', 'recent'])
+
+    add_output_args(parser)
+
+
+def add_output_args(parser: argparse.ArgumentParser) -> None:
+    """
+    Adding the arguments shared with `run`, on what is done with the results
+    """
+    parser.add_argument('--format', action='store', default='text',
+                        choices=['text', 'ndjson'])
+
+    parser.add_argument('--store', action='store', type=str)
+    parser.add_argument('--new_only', '--since_last_run', action='store_true')
+
+    parser.add_argument('--dedup', action='store_true')
+    parser.add_argument('--dedup_state', action='store', type=str)
+
+    parser.add_argument('--timeline', action='store', type=int, nargs='?',
+                        const=50)
+    parser.add_argument('--rank', action='store', default='decayed',
+                        choices=['decayed', 'recent', 'score'])
+
+    parser.add_argument('--timings', action='store_true')
+
 
 if __name__ == '__main__':
     sys.exit(run())
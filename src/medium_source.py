@@ -1,6 +1,6 @@
 from typing import List
-import feedparser
 from colorama import Fore, Style
+from src.feeds import entry_published, fetch_feed_entries
 from src.models import Source, Result
 
 
@@ -18,7 +18,11 @@ def reformat_results(raw_results) -> List[Result]:
         results.append(
             Result(
                 title=result.title,
-                url=result.link
+                url=result.link,
+                source='medium',
+                id=result.get('id'),
+                published=entry_published(result),
+                author=result.get('author')
             )
         )
 
@@ -46,15 +50,16 @@ class MediumSource(Source):
         """
         pass
 
-    def fetch(self) -> List[Result]:
+    async def fetch_async(self) -> List[Result]:
         """
         Retrieves posts from Medium feed based on the tag specified.
         """
         if not self.tag or self.limit < 0:
             return []
 
-        raw_results = feedparser.parse(f"https://medium.com/feed/tag/"
-                                       f"{self.tag}").entries[:self.limit]
+        entries = await fetch_feed_entries(f"https://medium.com/feed/tag/"
+                                           f"{self.tag}", self.limit)
+        raw_results = entries[:self.limit]
 
         self.results = reformat_results(raw_results)
         return self.results
@@ -65,6 +70,4 @@ class MediumSource(Source):
         """
         output = f"{Fore.GREEN}Medium Source Results" \
                  f" [Tag: {self.tag}]{Style.RESET_ALL} \n"
-        for result in self.results:
-            output += f"{result} \n"
-        return output
+        return output + ''.join(f"{result} \n" for result in self.results)
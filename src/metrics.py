@@ -0,0 +1,322 @@
+import bisect
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple
+
+"""
+Metrics module, counters, gauges and histograms of the sources and upstream
+calls, rendered in the Prometheus text format.
+"""
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0, 30.0)
+
+# Label sets past this many per metric are folded into a single `_other`
+# series, source parameters come from API callers and are unbounded.
+MAX_SERIES = 1000
+OTHER = '_other'
+
+# Source class name -> (source type, attributes that parametrize it)
+SOURCE_TYPES = {
+    'HackerNewsSource': ('hackernews', ('metric',)),
+    'RedditSource': ('reddit', ('subreddit', 'metric')),
+    'MediumSource': ('medium', ('tag',)),
+    'AwsBlogSource': ('aws', ('category',)),
+}
+
+Labels = Tuple[str, ...]
+
+
+def escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"') \
+        .replace('\n', '\\n')
+
+
+def format_labels(names: Sequence[str], values: Labels,
+                  extra: str = '') -> str:
+    pairs = [f'{name}="{escape(value)}"'
+             for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Metric(ABC):
+    """
+    Base of the metric types, values are kept per tuple of label values
+    """
+    type = 'untyped'
+
+    def __init__(self, name: str, documentation: str,
+                 labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, values: Dict, labels: Labels) -> Labels:
+        if labels in values or len(values) < MAX_SERIES:
+            return labels
+        return (OTHER,) * len(self.labelnames)
+
+    @abstractmethod
+    def samples(self) -> Iterator[Tuple[str, str, float]]:
+        """
+        (name suffix, formatted labels, value) of every series
+        """
+        pass
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}",
+                 f"# TYPE {self.name} {self.type}"]
+        for suffix, labels, value in self.samples():
+            lines.append(f"{self.name}{suffix}{labels} {format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def __init__(self, name: str, documentation: str,
+                 labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.values: Dict[Labels, float] = {}
+
+    def inc(self, labels: Labels = (), amount: float = 1) -> None:
+        with self._lock:
+            key = self._key(self.values, labels)
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, labels: Labels = ()) -> float:
+        return self.values.get(labels, 0)
+
+    def samples(self) -> Iterator[Tuple[str, str, float]]:
+        with self._lock:
+            items = list(self.values.items())
+        for labels, value in sorted(items):
+            yield '', format_labels(self.labelnames, labels), value
+
+
+class Gauge(Counter):
+    type = 'gauge'
+
+    def dec(self, labels: Labels = (), amount: float = 1) -> None:
+        self.inc(labels, -amount)
+
+    def set(self, labels: Labels, value: float) -> None:
+        with self._lock:
+            self.values[self._key(self.values, labels)] = value
+
+
+class Histogram(Metric):
+    """
+    Cumulative buckets of observed values, with their count and sum
+    """
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str,
+                 labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [count per bucket (+Inf last), sum]
+        self.values: Dict[Labels, List] = {}
+
+    def observe(self, labels: Labels, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            key = self._key(self.values, labels)
+            series = self.values.get(key)
+            if series is None:
+                series = [[0] * (len(self.buckets) + 1), 0.0]
+                self.values[key] = series
+            series[0][index] += 1
+            series[1] += value
+
+    def count(self, labels: Labels = ()) -> int:
+        series = self.values.get(labels)
+        return sum(series[0]) if series else 0
+
+    def sum(self, labels: Labels = ()) -> float:
+        series = self.values.get(labels)
+        return series[1] if series else 0.0
+
+    def samples(self) -> Iterator[Tuple[str, str, float]]:
+        with self._lock:
+            items = [(labels, list(counts), total)
+                     for labels, (counts, total) in self.values.items()]
+        for labels, counts, total in sorted(items):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = f'le="{format_value(bound)}"'
+                yield '_bucket', \
+                    format_labels(self.labelnames, labels, le), cumulative
+            yield '_sum', format_labels(self.labelnames, labels), total
+            yield '_count', format_labels(self.labelnames, labels), \
+                cumulative
+
+
+class CallbackMetric(Metric):
+    """
+    Metric whose values are read from elsewhere (e.g. a cache's own
+    counters) when rendered
+    """
+
+    def __init__(self, name: str, documentation: str,
+                 labelnames: Sequence[str],
+                 read: Callable[[], Dict[Labels, float]],
+                 type: str = 'gauge') -> None:
+        super().__init__(name, documentation, labelnames)
+        self.read = read
+        self.type = type
+
+    def samples(self) -> Iterator[Tuple[str, str, float]]:
+        for labels, value in sorted(self.read().items()):
+            yield '', format_labels(self.labelnames, labels), value
+
+
+class Registry:
+    """
+    Metrics exposed together, by name
+    """
+
+    def __init__(self) -> None:
+        self.metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str,
+                labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str,
+              labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str,
+                  labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames,
+                                       buckets))
+
+    def render(self) -> str:
+        """
+        Every metric in the Prometheus text exposition format
+        """
+        return ''.join(metric.render() for metric in self.metrics.values())
+
+
+registry = Registry()
+
+source_fetch_seconds = registry.histogram(
+    'fuse_source_fetch_seconds', "Duration of source fetches",
+    ('source', 'params'))
+source_items = registry.counter(
+    'fuse_source_items_total', "Items returned by source fetches",
+    ('source', 'params'))
+source_errors = registry.counter(
+    'fuse_source_errors_total', "Source fetches that raised",
+    ('source', 'params'))
+sources_in_flight = registry.gauge(
+    'fuse_source_fetches_in_flight', "Source fetches in progress",
+    ('source',))
+
+upstream_request_seconds = registry.histogram(
+    'fuse_upstream_request_seconds',
+    "Duration of single upstream requests, retries counted separately",
+    ('host',))
+upstream_requests = registry.counter(
+    'fuse_upstream_requests_total',
+    "Upstream requests by HTTP status, `error` when the host wasn't reached "
+    "and `ok` for successful calls through client libraries",
+    ('host', 'status'))
+upstreams_in_flight = registry.gauge(
+    'fuse_upstream_requests_in_flight', "Upstream requests in progress",
+    ('host',))
+
+
+def source_labels(source) -> Labels:
+    """
+    Source type and its parameters joined by `:` as in the API source specs,
+    e.g. ('reddit', 'python:hot')
+    """
+    source_type, attributes = SOURCE_TYPES.get(
+        type(source).__name__, (type(source).__name__, ()))
+    return source_type, ':'.join(str(getattr(source, attribute, ''))
+                                 for attribute in attributes)
+
+
+@contextmanager
+def track_fetch(source) -> Iterator[None]:
+    """
+    Measures the fetch of `source` made within the block: duration, items
+    left in `source.results`, errors and fetches in flight
+    """
+    labels = source_labels(source)
+    in_flight_labels = labels[:1]
+    sources_in_flight.inc(in_flight_labels)
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        source_errors.inc(labels)
+        raise
+    else:
+        source_items.inc(labels, len(getattr(source, 'results', None) or ()))
+    finally:
+        source_fetch_seconds.observe(labels, time.perf_counter() - start)
+        sources_in_flight.dec(in_flight_labels)
+
+
+@contextmanager
+def track_upstream(host: str) -> Iterator[None]:
+    """
+    Measures a single upstream request made within the block, its status is
+    counted by the caller with `upstream_requests`
+    """
+    labels = (host,)
+    upstreams_in_flight.inc(labels)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        upstream_request_seconds.observe(labels, time.perf_counter() - start)
+        upstreams_in_flight.dec(labels)
+
+
+def timings_summary() -> str:
+    """
+    Human readable summary of the source fetches and upstream requests made
+    so far, for the CLI
+    """
+    lines = ["timings:"]
+    for labels in sorted(source_fetch_seconds.values):
+        count = source_fetch_seconds.count(labels)
+        total = source_fetch_seconds.sum(labels)
+        name = f"{labels[0]}[{labels[1]}]" if labels[1] else labels[0]
+        lines.append(f"  {name:<40} {count:>4} fetch(es) {total:8.3f}s "
+                     f"{int(source_items.get(labels)):>6} items "
+                     f"{int(source_errors.get(labels)):>3} errors")
+
+    for labels in sorted(upstream_request_seconds.values):
+        count = upstream_request_seconds.count(labels)
+        total = upstream_request_seconds.sum(labels)
+        statuses = ', '.join(
+            f"{status}: {int(value)}"
+            for (host, status), value in sorted(
+                upstream_requests.values.items())
+            if host == labels[0])
+        lines.append(f"  {labels[0]:<40} {count:>4} request(s) "
+                     f"mean {total / count * 1000:7.1f}ms [{statuses}]")
+    return '\n'.join(lines) + '\n'
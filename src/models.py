@@ -1,7 +1,20 @@
-from typing import List
+import asyncio
+import json
+import logging
+import sys
+import time
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Iterator, List, \
+    Optional
 from abc import ABC, abstractmethod
 from colorama import Fore, Style
 
+from src.metrics import track_fetch
+
+if TYPE_CHECKING:
+    # Both import this module, so they are only imported for type checkers
+    from src.dedup import Deduplicator
+    from src.store import ArticleStore
+
 """
 Models module, defines the central classes of the package.
 """
@@ -17,33 +30,205 @@ class Source(ABC):
         pass
 
     @abstractmethod
-    def fetch(self):
+    async def fetch_async(self) -> List["Result"]:
+        """
+        Retrieves the results without blocking the event loop, stores them in
+        `self.results` and returns them.
+        """
         pass
 
+    def fetch(self) -> List["Result"]:
+        """
+        Synchronous wrapper around `fetch_async`, for callers without a
+        running event loop such as the CLI.
+        """
+        # Imported here rather than on import, the CLI only needs httpx for
+        # the sources using it
+        from src.http_client import close_async_client
+
+        async def fetch_and_close():
+            try:
+                return await self.fetch_async()
+            finally:
+                await close_async_client()
+
+        return asyncio.run(fetch_and_close())
+
 
 class SourceManager:
     """
     SourceManger gets a list of sources.
     By calling this object, it will execute `fetch` on all sources it has,
     and print the results.
+    When `concurrent` is set, up to `max_workers` sources are fetched at the
+    same time on a single event loop. Each source gets `source_timeout`
+    seconds and the whole run gets `deadline` seconds; results are still
+    printed in the order the sources were given, as soon as each one is
+    ready.
+    An optional `deduplicator` (see src.dedup) drops results already printed
+    by an earlier source.
+    An optional `store` (see src.store) records every fetched result; with
+    `new_only` only the results it had never seen are printed.
+    With `output_format='ndjson'` results are written as one JSON object per
+    line without colors, and in concurrent mode each source is written as
+    soon as it is done rather than in order.
+    With `timeline_size`, nothing is printed per source: once every source
+    is done, the best `timeline_size` results across them by `ranking` (a
+    name of src.timeline.RANKINGS) are printed as a single timeline.
     """
-    def __init__(self, sources: List[Source] = None) -> None:
+    def __init__(self, sources: List[Source] = None,
+                 concurrent: bool = False,
+                 max_workers: int = 8,
+                 source_timeout: Optional[float] = None,
+                 deadline: Optional[float] = None,
+                 deduplicator: "Deduplicator" = None,
+                 output_format: str = 'text',
+                 store: "ArticleStore" = None,
+                 new_only: bool = False,
+                 timeline_size: Optional[int] = None,
+                 ranking: str = 'decayed') -> None:
         """
-        Initialize sources
+        Initialize sources and execution settings
         """
         if not sources:
             self.sources = []
         else:
             self.sources = sources
+        self.concurrent = concurrent
+        self.max_workers = max_workers
+        self.source_timeout = source_timeout
+        self.deadline = deadline
+        self.deduplicator = deduplicator
+        self.output_format = output_format
+        self.store = store
+        self.new_only = new_only
+        self.timeline_size = timeline_size
+        self.ranking = ranking
+        self.fetched: List[Source] = []
 
     def __call__(self) -> None:
         """
         Iterate through the given sources and print their results.
         """
-        for source in self.sources:
-            source.fetch()
+        if self.concurrent:
+            asyncio.run(self.run_concurrently())
+        else:
+            for source in self.sources:
+                try:
+                    with track_fetch(source):
+                        source.fetch()
+                except Exception as e:
+                    logging.error("%s failed to fetch: %r",
+                                  type(source).__name__, e)
+                    self.report_failure(source, repr(e))
+                    continue
+                self.present(source)
+
+        if self.timeline_size is not None:
+            self.present_timeline()
+
+    async def run_concurrently(self) -> None:
+        """
+        Fetch all sources in parallel and print each source once it and every
+        source before it are done. A failing or timed out source is reported
+        and skipped without affecting the others.
+        """
+        if not self.sources:
+            return
+
+        semaphore = asyncio.Semaphore(max(1, self.max_workers))
+        streaming = self.output_format == 'ndjson'
+
+        async def fetch_source(source: Source) -> None:
+            async with semaphore:
+                with track_fetch(source):
+                    await asyncio.wait_for(source.fetch_async(),
+                                           self.source_timeout)
+            if streaming:
+                self.present(source)
+
+        tasks = [asyncio.ensure_future(fetch_source(source))
+                 for source in self.sources]
+        end_time = None if self.deadline is None \
+            else time.monotonic() + self.deadline
+
+        try:
+            for source, task in zip(self.sources, tasks):
+                remaining = None if end_time is None \
+                    else max(0.0, end_time - time.monotonic())
+                try:
+                    await asyncio.wait_for(asyncio.shield(task), remaining)
+                except asyncio.TimeoutError:
+                    if task.done():
+                        reason = "timed out"
+                    else:
+                        reason = "deadline exceeded"
+                    self.report_failure(source, reason)
+                except Exception as e:
+                    logging.error("%s failed to fetch: %r",
+                                  type(source).__name__, e)
+                    self.report_failure(source, repr(e))
+                else:
+                    if not streaming:
+                        self.present(source)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            from src.http_client import close_async_client
+            await close_async_client()
+
+    def present(self, source: Source) -> None:
+        """
+        Print the results of a fetched source, or keep them for the timeline
+        """
+        timeline = self.timeline_size is not None
+        if self.deduplicator is not None and not timeline:
+            source.results = list(self.deduplicator.filter(source.results))
+
+        if self.store is not None:
+            new_results = self.store.record(source.results)
+            if self.new_only:
+                source.results = new_results
+
+        if timeline:
+            self.fetched.append(source)
+            return
+
+        if self.output_format == 'ndjson':
+            sys.stdout.write(''.join(results_to_ndjson(
+                result for result in source.results
+                if result.title or result.url)))
+            sys.stdout.flush()
+        else:
             print(source)
 
+    def present_timeline(self) -> None:
+        """
+        Print the best results across the fetched sources, deduplicated in
+        timeline order
+        """
+        from src.timeline import RANKINGS, timeline_repr, top_k
+
+        results = top_k([source.results for source in self.fetched],
+                        self.timeline_size, RANKINGS[self.ranking],
+                        self.deduplicator)
+        if self.output_format == 'ndjson':
+            sys.stdout.write(''.join(results_to_ndjson(results)))
+            sys.stdout.flush()
+        else:
+            print(timeline_repr(results, self.ranking))
+
+    def report_failure(self, source: Source, reason: str) -> None:
+        """
+        Report a source that failed to fetch, on stderr in NDJSON mode to
+        keep stdout parseable
+        """
+        if self.output_format == 'ndjson':
+            sys.stderr.write(f"{type(source).__name__} failed [{reason}]\n")
+        else:
+            print(failure_repr(source, reason))
+
     def add(self, source: Source) -> None:
         """
         Add a single source to the sources list
@@ -51,16 +236,67 @@ class SourceManager:
         self.sources.append(source)
 
 
+def failure_repr(source: Source, reason: str) -> str:
+    """
+    String representation of a source that failed to fetch
+    """
+    return f"{Fore.RED}{type(source).__name__} failed " \
+           f"[{reason}]{Style.RESET_ALL} \n"
+
+
+def results_repr(results: List["Result"], header: str) -> str:
+    """
+    String representation of a list of results from several sources, under
+    `header`, with the source of each result
+    """
+    output = f"{Fore.GREEN}{header}{Style.RESET_ALL} \n"
+    return output + ''.join(
+        f"* \t {Fore.YELLOW}[{result.source or '?'}]{Style.RESET_ALL} "
+        f"{Fore.CYAN}{result.title}{Style.RESET_ALL}: "
+        f"{Fore.MAGENTA}{result.url} {Style.RESET_ALL} \n"
+        for result in results)
+
+
 class Result:
     """
     Unified class of results.
+    Only the title and url are required, the rest is metadata the source may
+    know about: the source name, the item id in that source, publication
+    time (epoch seconds), author, score and comment count.
     """
-    def __init__(self, title: str, url: str) -> None:
+    __slots__ = ('title', 'url', 'source', 'id', 'published', 'author',
+                 'score', 'comments')
+
+    def __init__(self, title: str, url: str, source: str = None,
+                 id: str = None, published: float = None, author: str = None,
+                 score: int = None, comments: int = None) -> None:
         """
-        Save the title and url of a post
+        Save the title and url of a post, and whatever metadata is known
         """
         self.title = title
         self.url = url
+        self.source = source
+        self.id = id
+        self.published = published
+        self.author = author
+        self.score = score
+        self.comments = comments
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Dict of the known fields of the result
+        """
+        return {
+            field: getattr(self, field) for field in self.__slots__
+            if getattr(self, field) is not None
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Result":
+        """
+        Builds a result back from `to_dict`
+        """
+        return cls(**data)
 
     def __repr__(self) -> str:
         """
@@ -70,3 +306,22 @@ class Result:
             return ""
         return f"* \t {Fore.CYAN}{self.title}{Style.RESET_ALL}:" \
                f" {Fore.MAGENTA}{self.url} {Style.RESET_ALL} \n"
+
+
+_json_encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+
+def results_to_json(results: Iterable[Result]) -> str:
+    """
+    Serializes results to a JSON array
+    """
+    return _json_encoder.encode([result.to_dict() for result in results])
+
+
+def results_to_ndjson(results: Iterable[Result]) -> Iterator[str]:
+    """
+    Serializes results to NDJSON, one line per result
+    """
+    encode = _json_encoder.encode
+    for result in results:
+        yield encode(result.to_dict()) + '\n'
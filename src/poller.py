@@ -0,0 +1,376 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from src.metrics import track_fetch
+from src.models import Result, Source, results_to_json
+
+"""
+Poller module, keeps a configured set of feeds fresh in the background.
+"""
+
+DEFAULT_JITTER = 0.1
+DEFAULT_MAX_BACKOFF = 600
+
+# How long a worker may take to refresh a feed it leased before the others
+# take over, and how soon they look again for the snapshot of a feed another
+# worker is refreshing
+LEASE_SECONDS = 60
+SHARED_RETRY_DELAY = 1.0
+
+FeedKey = Tuple[str, Tuple[str, ...]]
+
+
+class PolledFeed:
+    """
+    A feed refreshed every `interval` seconds with up to `limit` results.
+    """
+    __slots__ = ('source_type', 'params', 'limit', 'interval',
+                 'create_source')
+
+    def __init__(self, source_type: str, params: Tuple[str, ...], limit: int,
+                 interval: float,
+                 create_source: Callable[[], Source]) -> None:
+        self.source_type = source_type
+        self.params = tuple(params)
+        self.limit = limit
+        self.interval = interval
+        self.create_source = create_source
+
+    @property
+    def key(self) -> FeedKey:
+        return self.source_type, self.params
+
+
+class Snapshot:
+    """
+    The latest results of a polled feed and how fresh they are.
+    """
+    __slots__ = ('results', 'limit', 'fetched_at', 'failures', 'error')
+
+    def __init__(self, results: List[Result], limit: int,
+                 fetched_at: float) -> None:
+        self.results = results
+        self.limit = limit
+        self.fetched_at = fetched_at
+        self.failures = 0
+        self.error: Optional[str] = None
+
+    @property
+    def age(self) -> float:
+        return max(0.0, time.time() - self.fetched_at)
+
+
+class SharedSnapshots:
+    """
+    Snapshots of the polled feeds in a SQLite file shared by the processes
+    (e.g. the gunicorn workers) pointing at the same path; on tmpfs such as
+    /dev/shm, that is shared memory. A process leases a feed before
+    refreshing it, the others pick up its snapshot instead of fetching the
+    same feed again.
+    Connections are opened on first use in each process and thread, none
+    should be inherited across a fork. Calls may wait on other processes'
+    locks, the poller makes them on executor threads.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._local = threading.local()
+
+    @property
+    def owner(self) -> str:
+        """
+        Lease holder: this instance in this process, forked workers inherit
+        the instance but not the process id
+        """
+        return f"{os.getpid()}:{id(self)}"
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5,
+                                         isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=OFF")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS snapshots ("
+                "  key TEXT PRIMARY KEY,"
+                "  item_limit INTEGER,"
+                "  fetched_at REAL NOT NULL DEFAULT 0,"
+                "  payload TEXT,"
+                "  lease_owner TEXT,"
+                "  lease_until REAL NOT NULL DEFAULT 0"
+                ")"
+            )
+            self._local.connection = connection
+        return connection
+
+    @staticmethod
+    def _encode_key(key: FeedKey) -> str:
+        return json.dumps(key)
+
+    def get(self, key: FeedKey, newer_than: float = 0.0) -> \
+            Optional["Snapshot"]:
+        """
+        The shared snapshot of a feed, if fetched after `newer_than`
+        """
+        row = self._connection().execute(
+            "SELECT item_limit, fetched_at, payload FROM snapshots "
+            "WHERE key = ? AND payload IS NOT NULL AND fetched_at > ?",
+            (self._encode_key(key), newer_than)
+        ).fetchone()
+        if row is None:
+            return None
+        limit, fetched_at, payload = row
+        return Snapshot([Result.from_dict(item)
+                         for item in json.loads(payload)], limit, fetched_at)
+
+    def claim(self, key: FeedKey, seconds: float = LEASE_SECONDS) -> bool:
+        """
+        Leases the refresh of a feed to this process for `seconds`, unless
+        another one holds a lease on it
+        """
+        now = time.time()
+        cursor = self._connection().execute(
+            "INSERT INTO snapshots (key, lease_owner, lease_until) "
+            "VALUES (?, ?, ?) ON CONFLICT (key) DO UPDATE SET "
+            "lease_owner = excluded.lease_owner, "
+            "lease_until = excluded.lease_until "
+            "WHERE lease_until < ? OR lease_owner = excluded.lease_owner",
+            (self._encode_key(key), self.owner, now + seconds, now)
+        )
+        return cursor.rowcount == 1
+
+    def publish(self, key: FeedKey, snapshot: "Snapshot") -> None:
+        """
+        Shares the snapshot of a feed and ends this process' lease on it
+        """
+        self._connection().execute(
+            "UPDATE snapshots SET item_limit = ?, fetched_at = ?, "
+            "payload = ?, lease_until = 0 WHERE key = ?",
+            (snapshot.limit, snapshot.fetched_at,
+             results_to_json(snapshot.results), self._encode_key(key))
+        )
+
+    def release(self, key: FeedKey) -> None:
+        """
+        Ends this process' lease on a feed, after failing to refresh it
+        """
+        self._connection().execute(
+            "UPDATE snapshots SET lease_until = 0 "
+            "WHERE key = ? AND lease_owner = ?",
+            (self._encode_key(key), self.owner)
+        )
+
+
+class FeedPoller:
+    """
+    Refreshes every feed on its own interval, with jitter so that feeds
+    don't line up, and exponential backoff while a feed keeps failing.
+    The last good snapshot of a feed is kept, and served, no matter how old
+    it gets while its upstream is down. `on_refresh` is given the results of
+    every successful refresh.
+    With `shared` snapshots, processes polling the same feeds take turns:
+    a feed is refreshed by whichever process leases it first once its
+    snapshot is due, the others adopt that snapshot.
+    """
+
+    def __init__(self, feeds: List[PolledFeed] = None,
+                 jitter: float = DEFAULT_JITTER,
+                 max_backoff: float = DEFAULT_MAX_BACKOFF,
+                 on_refresh: Callable[[List[Result]], None] = None,
+                 shared: SharedSnapshots = None) -> None:
+        self.feeds = feeds if feeds else []
+        self.jitter = jitter
+        self.max_backoff = max_backoff
+        self.on_refresh = on_refresh
+        self.shared = shared
+        self.polled = {feed.key for feed in self.feeds}
+        self.adopted = 0
+        self.snapshots: Dict[FeedKey, Snapshot] = {}
+        self.failures: Dict[FeedKey, int] = {}
+        self._tasks: List[asyncio.Task] = []
+
+    def get(self, source_type: str, params: Tuple[str, ...],
+            limit: int) -> Optional[Snapshot]:
+        """
+        The latest snapshot of a feed, if it holds at least `limit` results.
+        Until this process has a snapshot of a polled feed, the one another
+        process shared is used.
+        """
+        key = (source_type, tuple(params))
+        snapshot = self.snapshots.get(key)
+        if snapshot is None and self.shared is not None and \
+                key in self.polled:
+            snapshot = self._adopt(key, self._shared_get(key))
+        return self._serves(snapshot, limit)
+
+    async def get_async(self, source_type: str, params: Tuple[str, ...],
+                        limit: int) -> Optional[Snapshot]:
+        """
+        Like `get`, reading the shared snapshots on an executor thread
+        """
+        key = (source_type, tuple(params))
+        snapshot = self.snapshots.get(key)
+        if snapshot is None and self.shared is not None and \
+                key in self.polled:
+            snapshot = self._adopt(key, await asyncio.get_running_loop()
+                                   .run_in_executor(None, self._shared_get,
+                                                    key))
+        return self._serves(snapshot, limit)
+
+    def _shared_get(self, key: FeedKey) -> Optional[Snapshot]:
+        try:
+            return self.shared.get(key)
+        except sqlite3.Error as e:
+            logging.error("shared snapshots unavailable: %r", e)
+            return None
+
+    def _adopt(self, key: FeedKey,
+               snapshot: Optional[Snapshot]) -> Optional[Snapshot]:
+        if snapshot is not None and key not in self.snapshots:
+            self.snapshots[key] = snapshot
+            self.adopted += 1
+        return self.snapshots.get(key)
+
+    @staticmethod
+    def _serves(snapshot: Optional[Snapshot],
+                limit: int) -> Optional[Snapshot]:
+        if snapshot is None or (limit > snapshot.limit and
+                                len(snapshot.results) >= snapshot.limit):
+            return None
+        return snapshot
+
+    def next_delay(self, feed: PolledFeed) -> float:
+        """
+        Seconds until the next refresh of `feed`
+        """
+        failures = self.failures.get(feed.key, 0)
+        delay = min(feed.interval * (2 ** failures),
+                    max(self.max_backoff, feed.interval))
+        if self.shared is not None and not failures:
+            # The snapshot may come from another process, refresh it when
+            # it is due rather than `interval` after adopting it
+            snapshot = self.snapshots.get(feed.key)
+            age = feed.interval if snapshot is None else snapshot.age
+            delay = max(delay - age, SHARED_RETRY_DELAY)
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    async def adopt_shared(self, feed: PolledFeed) -> bool:
+        """
+        Whether `feed` needs no fetch from this process: its shared snapshot
+        is fresh, or another process is refreshing it. Otherwise this
+        process holds the lease on it.
+        """
+        loop = asyncio.get_running_loop()
+        snapshot = self.snapshots.get(feed.key)
+        shared = await loop.run_in_executor(
+            None, self.shared.get, feed.key,
+            snapshot.fetched_at if snapshot is not None else 0.0)
+        # Another request may have adopted a snapshot meanwhile
+        snapshot = self.snapshots.get(feed.key)
+        if shared is not None and (snapshot is None or
+                                   shared.fetched_at > snapshot.fetched_at):
+            self.snapshots[feed.key] = snapshot = shared
+            self.adopted += 1
+        if snapshot is not None and \
+                snapshot.age < feed.interval * (1 - self.jitter):
+            return True
+        return not await loop.run_in_executor(None, self.shared.claim,
+                                              feed.key)
+
+    async def refresh(self, feed: PolledFeed) -> None:
+        """
+        Fetches `feed` once and updates its snapshot. On failure the previous
+        snapshot is kept and the feed backs off.
+        """
+        if self.shared is not None:
+            try:
+                if await self.adopt_shared(feed):
+                    return
+            except sqlite3.Error as e:
+                logging.error("shared snapshots unavailable: %r", e)
+
+        source = feed.create_source()
+        try:
+            with track_fetch(source):
+                results = await source.fetch_async()
+        except asyncio.CancelledError:
+            await self.release_shared(feed)
+            raise
+        except Exception as e:
+            await self.release_shared(feed)
+            failures = self.failures.get(feed.key, 0) + 1
+            self.failures[feed.key] = failures
+            logging.error("refreshing %s %s failed (%d in a row): %r",
+                          feed.source_type, feed.params, failures, e)
+            snapshot = self.snapshots.get(feed.key)
+            if snapshot is not None:
+                snapshot.failures = failures
+                snapshot.error = repr(e)
+            return
+
+        self.failures.pop(feed.key, None)
+        snapshot = Snapshot(results or [], feed.limit, time.time())
+        self.snapshots[feed.key] = snapshot
+        if self.shared is not None:
+            try:
+                await asyncio.get_running_loop().run_in_executor(
+                    None, self.shared.publish, feed.key, snapshot)
+            except sqlite3.Error as e:
+                logging.error("sharing the snapshot of %s %s failed: %r",
+                              feed.source_type, feed.params, e)
+        if self.on_refresh is not None:
+            self.on_refresh(results or [])
+
+    async def release_shared(self, feed: PolledFeed) -> None:
+        if self.shared is None:
+            return
+        try:
+            await asyncio.get_running_loop().run_in_executor(
+                None, self.shared.release, feed.key)
+        except sqlite3.Error as e:
+            logging.error("shared snapshots unavailable: %r", e)
+
+    async def poll(self, feed: PolledFeed) -> None:
+        """
+        Refreshes `feed` forever
+        """
+        while True:
+            await self.refresh(feed)
+            await asyncio.sleep(self.next_delay(feed))
+
+    def start(self) -> None:
+        """
+        Starts polling every feed on the running event loop
+        """
+        self._tasks = [asyncio.ensure_future(self.poll(feed))
+                       for feed in self.feeds]
+
+    async def stop(self) -> None:
+        """
+        Stops polling and waits for the pollers to exit
+        """
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stats(self) -> Dict[str, Dict]:
+        """
+        Age and failure count of every polled feed
+        """
+        return {
+            f"{source_type}:{':'.join(params)}": {
+                'age': round(snapshot.age, 1),
+                'failures': snapshot.failures,
+                'error': snapshot.error,
+            }
+            for (source_type, params), snapshot in self.snapshots.items()
+        }
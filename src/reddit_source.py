@@ -1,36 +1,229 @@
+import asyncio
 import os
-from typing import List
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 import praw
 from praw.reddit import Reddit
+from prawcore.exceptions import RequestException, ResponseException
 from colorama import Fore, Style
 
 from src.models import Source, Result
-
-CLIENT_ID = os.environ.get('REDDIT_CLIENT_ID')
-CLIENT_SECRET = os.environ.get('REDDIT_CLIENT_SECRET')
+from src.upstream import RETRY_STATUSES, upstreams
 
 REDDIT_VALID_METRICS = ['hot', 'top']
+REDDIT_HOST = 'oauth.reddit.com'
 
 """
 RedditSource module, responsible for querying Reddit's API.
 """
 
 
+class RedditClients:
+    """
+    Reddit clients of one set of credentials. praw's sessions aren't
+    thread-safe, so a client is used by one thread at a time: a thread takes
+    an idle client, or creates one, and gives it back once done. Clients
+    keep their OAuth token and refresh it when it expires, so the threads
+    after them only pay for their listing calls.
+    """
+
+    def __init__(self, create_client: Callable[[], Reddit]) -> None:
+        self.create_client = create_client
+        self.idle: List[Reddit] = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def use(self) -> Iterator[Reddit]:
+        """
+        A client no other thread uses until the block exits
+        """
+        with self._lock:
+            client = self.idle.pop() if self.idle else None
+        if client is None:
+            client = self.create_client()
+        try:
+            yield client
+        finally:
+            with self._lock:
+                self.idle.append(client)
+
+
+_clients: Dict[Tuple[str, str], RedditClients] = {}
+_clients_lock = threading.Lock()
+
+
+def get_reddit_client(reddit_id: str, reddit_secret: str) -> RedditClients:
+    """
+    Returns the process-wide Reddit clients of the given credentials,
+    creating them on first use
+    """
+    key = (reddit_id, reddit_secret)
+    with _clients_lock:
+        clients = _clients.get(key)
+        if clients is None:
+            clients = RedditClients(
+                lambda: praw.Reddit(client_id=reddit_id,
+                                    client_secret=reddit_secret,
+                                    grant_type_access='client_credentials',
+                                    user_agent='script/1.0'))
+            _clients[key] = clients
+    return clients
+
+
 def reformat_results(raw_results) -> List[Result]:
     """
     Transforming Reddit's API raw results into the Result class
     """
     reformatted_results = []
     for result in raw_results:
+        attributes = vars(result)
+        author = attributes.get('author')
         reformatted_results.append(
             Result(
-                title=vars(result)['title'],
-                url=vars(result)['url']
+                title=attributes['title'],
+                url=attributes['url'],
+                source='reddit',
+                id=attributes.get('id'),
+                published=attributes.get('created_utc'),
+                author=str(author) if author is not None else None,
+                score=attributes.get('score'),
+                comments=attributes.get('num_comments')
             )
         )
     return reformatted_results
 
 
+def reddit_retry_info(error: Exception) -> \
+        Optional[Tuple[int, Optional[str]]]:
+    """
+    Tells `upstreams.call_sync` which praw errors are worth retrying
+    """
+    if isinstance(error, ResponseException) and \
+            error.response.status_code in RETRY_STATUSES:
+        return error.response.status_code, \
+            error.response.headers.get('Retry-After')
+    if isinstance(error, RequestException):
+        return 0, None
+    return None
+
+
+def read_listing(reddit_con: RedditClients, subreddit: str, metric: str,
+                 limit: int) -> List[Result]:
+    """
+    Reads a listing to the end within Reddit's rate limit, with retries
+    """
+    def read() -> List[Result]:
+        with reddit_con.use() as client:
+            return reformat_results(get_listing(client, subreddit, metric,
+                                                limit))
+
+    return upstreams.call_sync(REDDIT_HOST, read, reddit_retry_info)
+
+
+def get_listing(reddit_con: Reddit, subreddit: str, metric: str, limit: int):
+    """
+    Lazy listing of `subreddit` (which may combine subreddits as `a+b+c`)
+    by metric
+    """
+    if metric.lower() == 'hot':
+        return reddit_con.subreddit(subreddit).hot(limit=limit)
+    return reddit_con.subreddit(subreddit).top(limit=limit)
+
+
+def fetch_subreddits(reddit_con: RedditClients, subreddits: List[str],
+                     metric: str, limit: int, max_workers: int = 4) -> \
+        Dict[str, List[Result]]:
+    """
+    Fetches up to `limit` posts of every subreddit in as few round-trips as
+    possible. One combined `a+b+c` listing is read first and split back out
+    per subreddit; subreddits it didn't fill up (quieter ones get crowded
+    out) are then listed on their own, concurrently unless Reddit's rate
+    limit headers say we are about to run out of requests.
+    Returns the results keyed by the lowercased subreddit name.
+    """
+    wanted = {subreddit.lower(): [] for subreddit in subreddits}
+    if not wanted or limit <= 0:
+        return wanted
+
+    def read_combined() -> list:
+        with reddit_con.use() as client:
+            return list(get_listing(client, '+'.join(wanted), metric,
+                                    limit * len(wanted))), \
+                client.auth.limits.get('remaining')
+
+    combined, remaining = upstreams.call_sync(REDDIT_HOST, read_combined,
+                                              reddit_retry_info)
+    for submission in combined:
+        name = vars(submission)['subreddit'].display_name.lower()
+        posts = wanted.get(name)
+        if posts is not None and len(posts) < limit:
+            posts.append(reformat_results([submission])[0])
+
+    missing = [name for name, posts in wanted.items() if len(posts) < limit]
+    if not missing:
+        return wanted
+
+    if remaining is not None and remaining < len(missing):
+        # prawcore spaces requests out once we run low, no point in
+        # queueing them up concurrently
+        max_workers = 1
+
+    def fetch_one(name: str) -> List[Result]:
+        return read_listing(reddit_con, name, metric, limit)
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        for name, posts in zip(missing, executor.map(fetch_one, missing)):
+            wanted[name] = posts
+
+    return wanted
+
+
+class SubredditBatch:
+    """
+    Groups RedditSources so that the first one to be fetched fetches all of
+    them with `fetch_subreddits`, the others then just pick up their share.
+    """
+
+    def __init__(self, sources: List["RedditSource"],
+                 max_workers: int = 4) -> None:
+        self.sources = sources
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        self._fetched = False
+        for source in sources:
+            source.batch = self
+
+    def fetch(self) -> None:
+        """
+        Fetches every source of the batch, only once
+        """
+        with self._lock:
+            if self._fetched:
+                return
+
+            groups: Dict[Tuple[int, str, int], List[RedditSource]] = {}
+            for source in self.sources:
+                if source.is_valid():
+                    key = (id(source.reddit_con), source.metric.lower(),
+                           source.limit)
+                    groups.setdefault(key, []).append(source)
+
+            for sources in groups.values():
+                results = fetch_subreddits(
+                    sources[0].reddit_con,
+                    [source.subreddit for source in sources],
+                    sources[0].metric,
+                    sources[0].limit,
+                    self.max_workers
+                )
+                for source in sources:
+                    source.results = results[source.subreddit.lower()]
+
+            self._fetched = True
+
+
 class RedditSource(Source):
     """
     RedditSource class accepts a subreddit, metric, limit and credentials
@@ -49,47 +242,59 @@ class RedditSource(Source):
         self.metric = metric
         self.reddit_id = reddit_id
         self.reddit_secret = reddit_secret
+        self.batch: Optional[SubredditBatch] = None
         self.reddit_con = self.connect()
 
-    def connect(self) -> Reddit:
+    def connect(self) -> RedditClients:
         """
-        Connects to Reddit's API with the credentials given.
+        Connects to Reddit's API with the credentials given, or the ones in
+        REDDIT_CLIENT_ID / REDDIT_CLIENT_SECRET, reusing the clients of
+        previous sources with the same credentials.
         """
-        reddit_id = self.reddit_id if self.reddit_id else CLIENT_ID
-        reddit_secret = self.reddit_secret if \
-            self.reddit_secret else CLIENT_SECRET
+        reddit_id = self.reddit_id if self.reddit_id else \
+            os.environ.get('REDDIT_CLIENT_ID')
+        reddit_secret = self.reddit_secret if self.reddit_secret else \
+            os.environ.get('REDDIT_CLIENT_SECRET')
 
-        self.reddit_con = praw.Reddit(client_id=reddit_id,
-                                      client_secret=reddit_secret,
-                                      grant_type_access='client_credentials',
-                                      user_agent='script/1.0')
+        self.reddit_con = get_reddit_client(reddit_id, reddit_secret)
         return self.reddit_con
 
+    def is_valid(self) -> bool:
+        """
+        Whether the subreddit, metric and limit can be queried
+        """
+        return bool(self.subreddit) and self.limit >= 0 and \
+            self.metric.lower() in REDDIT_VALID_METRICS
+
     def fetch(self) -> List[Result]:
         """
         Retrieves posts from Reddit's API based on the subreddit and metric.
+        Sources in a SubredditBatch are fetched together with the batch.
         """
-        if not self.subreddit or self.limit < 0 or \
-                self.metric.lower() not in REDDIT_VALID_METRICS:
+        if not self.is_valid():
             return []
 
-        if self.metric == 'hot':
-            raw_results = self.reddit_con.subreddit(self.subreddit).hot(
-                limit=self.limit)
-        else:
-            raw_results = self.reddit_con.subreddit(self.subreddit).top(
-                limit=self.limit)
+        if self.batch is not None:
+            self.batch.fetch()
+            return self.results
 
-        self.results = reformat_results(raw_results)
+        self.results = read_listing(self.reddit_con, self.subreddit,
+                                    self.metric, self.limit)
 
         return self.results
 
+    async def fetch_async(self) -> List[Result]:
+        """
+        praw is synchronous, so the fetch runs on the default executor to
+        keep the event loop free.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.fetch)
+
     def __repr__(self) -> str:
         """
         RedditSource string representation
         """
         output = f"{Fore.GREEN}Reddit Source Results [Sub: {self.subreddit}," \
                  f" Metric: {self.metric}]{Style.RESET_ALL} \n"
-        for result in self.results:
-            output += f"{result} \n"
-        return output
+        return output + ''.join(f"{result} \n" for result in self.results)
@@ -0,0 +1,67 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+"""
+Single-flight module, collapses concurrent identical calls into one.
+"""
+
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time. Callers arriving while a call
+    for their key is in progress await it and share its result (or error)
+    instead of making their own.
+    """
+
+    def __init__(self) -> None:
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+        self.calls = 0
+        self.executions = 0
+        self.collapsed = 0
+
+    async def do(self, key: Hashable,
+                 fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Returns the result of awaiting `fn()`, sharing it with concurrent
+        calls of `key`
+        """
+        self.calls += 1
+        call = self._calls.get(key)
+        if call is not None:
+            self.collapsed += 1
+            # Shielded so that a cancelled follower doesn't cancel the call
+            # the other callers are waiting on.
+            return await asyncio.shield(call)
+
+        self.executions += 1
+        call = asyncio.ensure_future(fn())
+        self._calls[key] = call
+        call.add_done_callback(lambda _: self._finish(key, call))
+        return await asyncio.shield(call)
+
+    def _finish(self, key: Hashable, call: asyncio.Future) -> None:
+        """
+        Forgets a finished call. Its error is marked as retrieved, callers
+        that stopped waiting on it shouldn't make asyncio log it.
+        """
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        if not call.cancelled():
+            call.exception()
+
+    def in_flight(self) -> int:
+        """
+        Number of keys with a call in progress
+        """
+        return len(self._calls)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Counters of calls made, upstream executions and collapsed calls
+        """
+        return {
+            'calls': self.calls,
+            'executions': self.executions,
+            'collapsed': self.collapsed,
+            'in_flight': len(self._calls),
+        }
@@ -0,0 +1,59 @@
+from typing import Callable, Tuple
+
+from src.models import Source
+
+"""
+Specs module, parses the `kind:param[:param]` source specs shared by the API
+and job files.
+"""
+
+# Source spec prefix -> (cache source type, number of parameters), prefixes
+# follow the CLI flags
+SOURCE_SPECS = {
+    'reddit': ('reddit', 2),
+    'medium': ('medium', 1),
+    'hn': ('hackernews', 1),
+    'aws': ('aws', 1),
+}
+
+
+def create_source_from_spec(spec: str, limit: int,
+                            incremental: bool = True) -> \
+        Tuple[str, Tuple[str, ...], Callable[[], Source]]:
+    """
+    Parses a source spec such as `reddit:python:hot`, `medium:python`,
+    `hn:top` or `aws:security` into its cache source type, parameters and a
+    factory of the source. HackerNews sources poll `incremental`ly.
+    Source modules are imported by the factory, on first use.
+    """
+    kind, *params = spec.split(':')
+    if kind not in SOURCE_SPECS or len(params) != SOURCE_SPECS[kind][1] or \
+            not all(params):
+        raise ValueError(f"bad source spec {spec!r}")
+
+    def create_reddit_source() -> Source:
+        from src.reddit_source import RedditSource
+        return RedditSource(subreddit=params[0], metric=params[1],
+                            limit=limit)
+
+    def create_medium_source() -> Source:
+        from src.medium_source import MediumSource
+        return MediumSource(tag=params[0], limit=limit)
+
+    def create_hn_source() -> Source:
+        from src.hn_source import HackerNewsSource
+        return HackerNewsSource(metric=params[0], limit=limit,
+                                incremental=incremental)
+
+    def create_aws_source() -> Source:
+        from src.aws_blog_source import AwsBlogSource
+        return AwsBlogSource(category=params[0], limit=limit)
+
+    factories = {
+        'reddit': create_reddit_source,
+        'medium': create_medium_source,
+        'hn': create_hn_source,
+        'aws': create_aws_source,
+    }
+
+    return SOURCE_SPECS[kind][0], tuple(params), factories[kind]
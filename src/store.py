@@ -0,0 +1,330 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+from typing import Iterable, List, Optional
+
+from src.dedup import canonicalize_url
+from src.models import Result, results_repr
+
+"""
+Store module, keeps every fetched article on disk with when it was first seen,
+and a full-text index of them.
+"""
+
+DEFAULT_STORE_PATH = os.path.join(os.path.expanduser('~'), '.fuse',
+                                  'articles.sqlite')
+
+# SQLite's default cap on the number of bound parameters in a statement
+MAX_VARIABLES = 900
+
+SEARCH_ORDERS = ('relevance', 'recent')
+RELEVANCE_WINDOW = 10000
+# Most common words the last word of a query is completed to
+MAX_COMPLETIONS = 50
+
+_WORD = re.compile(r'\w+')
+# Words as the unicode61 tokenizer splits them, underscores separate words
+_TOKEN = re.compile(r'[^\W_]+')
+
+
+def item_key(result: Result) -> str:
+    """
+    Identity of an article within its source: the source's item id when it
+    has one, the canonical URL otherwise
+    """
+    if result.id:
+        return f"id:{result.id}"
+    return f"url:{canonicalize_url(result.url or '')}"
+
+
+def article_words(result: Result) -> set:
+    """
+    Distinct words of the indexed fields of `result`, unstemmed
+    """
+    return set(_TOKEN.findall(' '.join(
+        field for field in (result.title, result.url, result.author)
+        if field).lower()))
+
+
+def match_expression(query: str, completions: Iterable[str] = ()) -> str:
+    """
+    FTS5 query matching articles containing every word of `query`, the last
+    one either as typed or as one of its `completions`. Words are quoted, so
+    that user input can't use (or break on) the FTS5 query syntax.
+    """
+    words = _WORD.findall(query)
+    if not words:
+        return ''
+    last = [words[-1]] + [word for word in completions
+                          if word != words[-1].lower()]
+    alternatives = ' OR '.join(f'"{word}"' for word in last)
+    return ' AND '.join([f'"{word}"' for word in words[:-1]] +
+                        [f'({alternatives})'])
+
+
+class ArticleStore:
+    """
+    SQLite backed store of articles keyed by source and item.
+    `record` writes a batch of results in a single transaction and tells
+    which of them were never seen before, and indexes the new ones for
+    `search`. The store may be shared between threads.
+    """
+
+    def __init__(self, path: str = DEFAULT_STORE_PATH) -> None:
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)),
+                        exist_ok=True)
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, isolation_level=None,
+                                          check_same_thread=False,
+                                          timeout=30)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS articles ("
+            "  source TEXT NOT NULL,"
+            "  item_key TEXT NOT NULL,"
+            "  title TEXT,"
+            "  url TEXT,"
+            "  first_seen REAL NOT NULL,"
+            "  last_seen REAL NOT NULL,"
+            "  data TEXT NOT NULL,"
+            "  PRIMARY KEY (source, item_key)"
+            ") WITHOUT ROWID"
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS articles_first_seen "
+            "ON articles (first_seen)"
+        )
+        self._create_search_index()
+        self._create_vocabulary()
+
+    def _create_search_index(self) -> None:
+        """
+        Full-text index of the titles, URLs and authors. Its rowids follow
+        insertion, so the newest matches are found without ranking them all.
+        Stores created before the index existed are indexed once.
+        """
+        exists = self.connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'articles_search'"
+        ).fetchone()
+        if exists:
+            return
+        self.connection.execute(
+            "CREATE VIRTUAL TABLE articles_search USING fts5("
+            "  source UNINDEXED, item_key UNINDEXED, title, url, author,"
+            "  tokenize = 'porter unicode61'"
+            ")"
+        )
+        # Relevance weighs a match in the title over one in the author or
+        # the URL, whose host and path words match much more often
+        self.connection.execute(
+            "INSERT INTO articles_search (articles_search, rank) "
+            "VALUES ('rank', 'bm25(0.0, 0.0, 10.0, 1.0, 2.0)')"
+        )
+        self.connection.execute(
+            "INSERT INTO articles_search (source, item_key, title, url, "
+            "author) SELECT source, item_key, title, url, "
+            "json_extract(data, '$.author') FROM articles "
+            "ORDER BY first_seen"
+        )
+
+    def _create_vocabulary(self) -> None:
+        """
+        Unstemmed words of the indexed articles, with the number of articles
+        containing each. The porter stemmer of the index would also stem a
+        prefix ("asy" to "asi"), so the last word of a query is completed
+        from these words instead of matched as an FTS5 prefix.
+        Stores created before the vocabulary existed are read once.
+        """
+        exists = self.connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'articles_words'"
+        ).fetchone()
+        if exists:
+            return
+        self.connection.execute(
+            "CREATE TABLE articles_words ("
+            "  word TEXT PRIMARY KEY,"
+            "  articles INTEGER NOT NULL"
+            ") WITHOUT ROWID"
+        )
+        rows = self.connection.execute("SELECT data FROM articles")
+        self._count_words(self.connection.cursor(),
+                          (Result.from_dict(json.loads(row[0]))
+                           for row in rows))
+
+    @staticmethod
+    def _count_words(cursor: sqlite3.Cursor,
+                     results: Iterable[Result]) -> None:
+        counts = Counter()
+        for result in results:
+            counts.update(article_words(result))
+        cursor.executemany(
+            "INSERT INTO articles_words (word, articles) VALUES (?, ?) "
+            "ON CONFLICT (word) DO UPDATE "
+            "SET articles = articles + excluded.articles",
+            counts.items()
+        )
+
+    def record(self, results: Iterable[Result]) -> List[Result]:
+        """
+        Saves the results, updating when already known ones were last seen,
+        and returns the ones seen for the first time, in their original order
+        """
+        now = time.time()
+        keyed = {}
+        for result in results:
+            if not result.title and not result.url:
+                continue
+            keyed.setdefault((result.source or '', item_key(result)), result)
+        if not keyed:
+            return []
+
+        with self.lock:
+            return self._record(keyed, now)
+
+    def _record(self, keyed: dict, now: float) -> List[Result]:
+        cursor = self.connection.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            known = self._known_keys(cursor, list(keyed))
+            new = [(key, result) for key, result in keyed.items()
+                   if key not in known]
+            cursor.executemany(
+                "UPDATE articles SET last_seen = ? "
+                "WHERE source = ? AND item_key = ?",
+                [(now, source, key) for source, key in known]
+            )
+            cursor.executemany(
+                "INSERT INTO articles (source, item_key, title, url, "
+                "first_seen, last_seen, data) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(source, key, result.title, result.url, now, now,
+                  json.dumps(result.to_dict()))
+                 for (source, key), result in new]
+            )
+            cursor.executemany(
+                "INSERT INTO articles_search (source, item_key, title, url, "
+                "author) VALUES (?, ?, ?, ?, ?)",
+                [(source, key, result.title, result.url, result.author)
+                 for (source, key), result in new]
+            )
+            self._count_words(cursor, (result for _, result in new))
+            cursor.execute("COMMIT")
+        except BaseException:
+            cursor.execute("ROLLBACK")
+            raise
+
+        return [result for _, result in new]
+
+    @staticmethod
+    def _known_keys(cursor: sqlite3.Cursor, keys: List[tuple]) -> set:
+        known = set()
+        by_source = {}
+        for source, key in keys:
+            by_source.setdefault(source, []).append(key)
+
+        for source, source_keys in by_source.items():
+            for start in range(0, len(source_keys), MAX_VARIABLES):
+                chunk = source_keys[start:start + MAX_VARIABLES]
+                placeholders = ','.join('?' * len(chunk))
+                rows = cursor.execute(
+                    f"SELECT item_key FROM articles WHERE source = ? "
+                    f"AND item_key IN ({placeholders})",
+                    [source] + chunk
+                )
+                known.update((source, row[0]) for row in rows)
+        return known
+
+    def since(self, timestamp: float, limit: int = 1000) -> List[Result]:
+        """
+        Articles first seen after `timestamp`, newest first
+        """
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT data FROM articles WHERE first_seen > ? "
+                "ORDER BY first_seen DESC LIMIT ?",
+                (timestamp, limit)
+            ).fetchall()
+        return [Result.from_dict(json.loads(row[0])) for row in rows]
+
+    def search(self, query: str, limit: int = 20,
+               source: Optional[str] = None,
+               order: str = 'relevance') -> List[Result]:
+        """
+        Stored articles whose title, URL or author contain every word of
+        `query` (the last word may be cut short, it is completed to the
+        MAX_COMPLETIONS most common words it starts), optionally only those
+        of `source`. Ordered by `relevance` (BM25, among the newest
+        RELEVANCE_WINDOW matches) or most `recent` first, which stops at the
+        first `limit` matches.
+        """
+        if order not in SEARCH_ORDERS:
+            raise ValueError(f"order should be one of {SEARCH_ORDERS}")
+        words = _WORD.findall(query)
+        if not words or limit <= 0:
+            return []
+        with self.lock:
+            completions = self._completions(words[-1].lower())
+
+        condition = "articles_search MATCH ?"
+        parameters = [match_expression(query, completions)]
+        if source is not None:
+            condition += " AND articles_search.source = ?"
+            parameters.append(source)
+        if order == 'relevance':
+            # Scoring is linear in the number of matches, a word found in
+            # a good part of millions of articles would take long to rank:
+            # only the newest RELEVANCE_WINDOW matches are ranked.
+            condition += (
+                f" AND articles_search.rowid >= COALESCE(("
+                f"SELECT rowid FROM articles_search WHERE {condition} "
+                f"ORDER BY rowid DESC LIMIT 1 OFFSET ?), 0)")
+            parameters = parameters * 2 + [RELEVANCE_WINDOW - 1]
+            ordering = 'rank'
+        else:
+            ordering = 'articles_search.rowid DESC'
+        with self.lock:
+            rows = self.connection.execute(
+                f"SELECT articles.data FROM articles_search "
+                f"JOIN articles ON articles.source = articles_search.source "
+                f"AND articles.item_key = articles_search.item_key "
+                f"WHERE {condition} ORDER BY {ordering} LIMIT ?",
+                parameters + [limit]
+            ).fetchall()
+        return [Result.from_dict(json.loads(row[0])) for row in rows]
+
+    def _completions(self, prefix: str) -> List[str]:
+        """
+        Most common indexed words starting with `prefix`
+        """
+        rows = self.connection.execute(
+            "SELECT word FROM articles_words WHERE word >= ? AND word < ? "
+            "ORDER BY articles DESC LIMIT ?",
+            (prefix, prefix + '\U0010ffff', MAX_COMPLETIONS)
+        )
+        return [row[0] for row in rows]
+
+    def count(self) -> int:
+        """
+        Number of stored articles
+        """
+        with self.lock:
+            return self.connection.execute(
+                "SELECT COUNT(*) FROM articles").fetchone()[0]
+
+    def close(self) -> None:
+        with self.lock:
+            self.connection.close()
+
+
+def search_repr(results: List[Result], query: str) -> str:
+    """
+    String representation of search results, with the source of each result
+    """
+    return results_repr(results, f"Search [Query: {query}, "
+                                 f"{len(results)} results]")
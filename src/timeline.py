@@ -0,0 +1,130 @@
+import heapq
+import itertools
+import math
+import time
+from operator import itemgetter
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from src.models import Result, results_repr
+
+"""
+Timeline module, merges the results of several sources into a single ranked
+front page.
+"""
+
+DEFAULT_HALF_LIFE = 12 * 60 * 60
+DEFAULT_TIMELINE_SIZE = 50
+
+# A ranking gives the keys of a source's results, in their order, higher
+# keys first. It sees a whole source at once to normalize within it.
+Ranking = Callable[[List[Result], float], List[float]]
+
+
+def normalized_scores(results: List[Result]) -> List[float]:
+    """
+    Scores of a source's results scaled to 0..1 against its best one, so
+    that sources with different audiences compare. Sources without scores
+    are already in their ranking order, which is used instead.
+    """
+    scores = [result.score for result in results]
+    best = max((score for score in scores if score is not None),
+               default=None)
+    if best:
+        return [max(score or 0, 0) / best for score in scores]
+
+    count = len(results)
+    return [1 - index / count for index in range(count)]
+
+
+def rank_decayed(results: List[Result], now: float,
+                 half_life: float = DEFAULT_HALF_LIFE) -> List[float]:
+    """
+    Normalized score halved every `half_life` seconds since publication,
+    results of unknown age count as `half_life` old
+    """
+    rate = -math.log(2) / half_life
+    unknown = 0.5
+    exp = math.exp
+    return [score * (unknown if result.published is None
+                     else exp(rate * max(0.0, now - result.published)))
+            for result, score in zip(results, normalized_scores(results))]
+
+
+def rank_recent(results: List[Result], now: float) -> List[float]:
+    """
+    Newest first, results of unknown age last
+    """
+    return [result.published if result.published is not None
+            else float('-inf') for result in results]
+
+
+def rank_score(results: List[Result], now: float) -> List[float]:
+    """
+    Normalized score, regardless of age
+    """
+    return normalized_scores(results)
+
+
+_first = itemgetter(0)
+
+RANKINGS: Dict[str, Ranking] = {
+    'decayed': rank_decayed,
+    'recent': rank_recent,
+    'score': rank_score,
+}
+
+
+def ranked_stream(results: List[Result], ranking: Ranking, now: float,
+                  k: Optional[int] = None) -> List[tuple]:
+    """
+    (key, result) pairs of a source, best first, only the best `k` of them
+    when given: no source contributes more than k results to a top k.
+    Sources usually come (nearly) sorted already, which timsort handles in
+    linear time.
+    """
+    keyed = [(key, result) for key, result in zip(ranking(results, now),
+                                                  results)
+             if result.title or result.url]
+    if k is not None and len(keyed) > 4 * k:
+        return heapq.nlargest(k, keyed, key=_first)
+    keyed.sort(key=_first, reverse=True)
+    return keyed if k is None else keyed[:k]
+
+
+def merge_ranked(streams: Iterable[List[Result]], ranking: Ranking,
+                 now: float = None, k: Optional[int] = None) -> \
+        Iterator[Result]:
+    """
+    Lazily merges the results of every source, best first. Only the heads
+    of the per-source streams are compared, so taking the first k results
+    costs O(k log sources) once the streams are keyed. With `k`, each
+    stream is cut to its best k results first.
+    """
+    now = time.time() if now is None else now
+    ranked = [ranked_stream(results, ranking, now, k) for results in streams]
+    for _, result in heapq.merge(*ranked, key=_first, reverse=True):
+        yield result
+
+
+def top_k(streams: Iterable[List[Result]], k: int = DEFAULT_TIMELINE_SIZE,
+          ranking: Ranking = rank_decayed, deduplicator=None,
+          now: float = None) -> List[Result]:
+    """
+    The `k` best results across sources. With a `deduplicator` (see
+    src.dedup), results seen earlier in the timeline are skipped and the
+    merge goes on until `k` distinct results are found.
+    """
+    if deduplicator is None:
+        merged = merge_ranked(streams, ranking, now, k)
+    else:
+        # Duplicates may push results past the first k of their source
+        merged = deduplicator.filter(merge_ranked(streams, ranking, now))
+    return list(itertools.islice(merged, max(k, 0)))
+
+
+def timeline_repr(results: List[Result], ranking_name: str) -> str:
+    """
+    String representation of a timeline, with the source of each result
+    """
+    return results_repr(results, f"Timeline [Top {len(results)}, "
+                                 f"Rank: {ranking_name}]")
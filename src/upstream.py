@@ -0,0 +1,402 @@
+import asyncio
+import email.utils
+import logging
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+
+from src.http_client import get_async_client
+from src.metrics import track_upstream, upstream_requests
+
+"""
+Upstream module, shared rate limiting and retries for every call the
+sources make to upstream services.
+"""
+
+# host -> (requests per second, burst)
+DEFAULT_RATES: Dict[str, Tuple[float, float]] = {
+    'hacker-news.firebaseio.com': (50, 100),
+    'medium.com': (2, 5),
+    'aws.amazon.com': (5, 10),
+    'oauth.reddit.com': (1, 10),
+}
+DEFAULT_RATE = (10, 20)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+CIRCUIT_CLOSED = 'closed'
+CIRCUIT_OPEN = 'open'
+CIRCUIT_HALF_OPEN = 'half-open'
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling an upstream host whose circuit is open
+    """
+    def __init__(self, host: str) -> None:
+        super().__init__(f"circuit open for {host}")
+        self.host = host
+
+
+class TokenBucket:
+    """
+    Allows `rate` calls per second on average and bursts of up to `burst`.
+    Thread safe, `reserve` returns how long the caller has to wait for its
+    token so that both sync and async callers can do the waiting.
+    """
+
+    def __init__(self, rate: float, burst: float) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """
+        Takes a token, returns the seconds to wait before using it
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst,
+                              self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+
+class RetryPolicy:
+    """
+    Exponential backoff with jitter between attempts. A Retry-After header
+    sent by the server replaces the computed delay, unless it asks us to
+    wait longer than `max_retry_after`, in which case we give up.
+    """
+
+    def __init__(self, max_attempts: int = 3, base_delay: float = 0.5,
+                 max_delay: float = 10.0,
+                 max_retry_after: float = 60.0) -> None:
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retry_after = max_retry_after
+
+    def delay(self, attempt: int, retry_after: Optional[str] = None) -> \
+            Optional[float]:
+        """
+        Seconds to wait before retry number `attempt` (starting at 1), None
+        when we shouldn't retry anymore
+        """
+        if attempt >= self.max_attempts:
+            return None
+
+        if retry_after:
+            seconds = parse_retry_after(retry_after)
+            if seconds is not None:
+                return seconds if seconds <= self.max_retry_after else None
+
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return random.uniform(delay / 2, delay)
+
+
+def parse_retry_after(value: str) -> Optional[float]:
+    """
+    Seconds from a Retry-After header, given either as seconds or a date
+    """
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+class CircuitBreaker:
+    """
+    Stops calling a host after `failure_threshold` failed calls in a row.
+    Calls are then rejected right away until `reset_timeout` seconds have
+    passed, after which a single probe call is let through: its success
+    closes the circuit again, its failure keeps it open for another
+    `reset_timeout`.
+    """
+
+    def __init__(self, failure_threshold: int = 5,
+                 reset_timeout: float = 30.0) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CIRCUIT_CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def before_call(self, host: str) -> None:
+        """
+        Raises CircuitOpenError if the call shouldn't be made
+        """
+        with self._lock:
+            if self.state == CIRCUIT_OPEN and \
+                    time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = CIRCUIT_HALF_OPEN
+                self.probing = False
+
+            if self.state == CIRCUIT_OPEN or \
+                    (self.state == CIRCUIT_HALF_OPEN and self.probing):
+                self.rejected += 1
+                raise CircuitOpenError(host)
+
+            if self.state == CIRCUIT_HALF_OPEN:
+                self.probing = True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = CIRCUIT_CLOSED
+            self.failures = 0
+            self.probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == CIRCUIT_HALF_OPEN or \
+                    self.failures >= self.failure_threshold:
+                self.state = CIRCUIT_OPEN
+                self.opened_at = time.monotonic()
+            self.probing = False
+
+    def release(self) -> None:
+        """
+        The call ended without telling whether the host is healthy (e.g. it
+        was cancelled), let another call probe it
+        """
+        with self._lock:
+            self.probing = False
+
+
+class UpstreamStats:
+    """
+    Counters of a single upstream host
+    """
+    __slots__ = ('requests', 'throttled', 'retries', 'failures', 'waited')
+
+    def __init__(self) -> None:
+        self.requests = 0
+        self.throttled = 0
+        self.retries = 0
+        self.failures = 0
+        self.waited = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'requests': self.requests,
+            'throttled': self.throttled,
+            'retries': self.retries,
+            'failures': self.failures,
+            'waited': round(self.waited, 3),
+        }
+
+
+class Upstreams:
+    """
+    Rate limiters, circuit breakers, retry policy and counters per upstream
+    host
+    """
+
+    def __init__(self, rates: Dict[str, Tuple[float, float]] = None,
+                 retry_policy: RetryPolicy = None,
+                 failure_threshold: int = 5,
+                 reset_timeout: float = 30.0) -> None:
+        self.rates = dict(DEFAULT_RATES if rates is None else rates)
+        self.retry_policy = retry_policy if retry_policy else RetryPolicy()
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.buckets: Dict[str, TokenBucket] = {}
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.stats: Dict[str, UpstreamStats] = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, host: str) -> TokenBucket:
+        with self._lock:
+            bucket = self.buckets.get(host)
+            if bucket is None:
+                bucket = TokenBucket(*self.rates.get(host, DEFAULT_RATE))
+                self.buckets[host] = bucket
+                self.breakers[host] = CircuitBreaker(self.failure_threshold,
+                                                     self.reset_timeout)
+                self.stats[host] = UpstreamStats()
+            return bucket
+
+    async def get(self, url: str, stream: bool = False,
+                  **kwargs) -> httpx.Response:
+        """
+        GET `url` over the pooled client, within the host's rate limit and
+        retrying throttled, failed and unreachable attempts. Returns the last
+        response, or raises the last transport error. Raises
+        CircuitOpenError without calling the host while it is unhealthy.
+        With `stream` the body isn't read yet, the caller reads it (e.g. with
+        `aiter_bytes`) and has to `aclose` the response.
+        """
+        host = urlsplit(url).hostname or ''
+        self.bucket(host)
+        breaker = self.breakers[host]
+        breaker.before_call(host)
+
+        try:
+            response = await self._get_with_retries(host, url, stream,
+                                                    **kwargs)
+        except httpx.TransportError:
+            breaker.record_failure()
+            raise
+        except BaseException:
+            breaker.release()
+            raise
+
+        if response.status_code in RETRY_STATUSES:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        return response
+
+    async def _get_with_retries(self, host: str, url: str, stream: bool,
+                                **kwargs) -> httpx.Response:
+        bucket = self.bucket(host)
+        stats = self.stats[host]
+        attempt = 0
+
+        while True:
+            attempt += 1
+            wait = bucket.reserve()
+            if wait:
+                stats.waited += wait
+                await asyncio.sleep(wait)
+
+            stats.requests += 1
+            try:
+                with track_upstream(host):
+                    response = await self._send(url, stream, **kwargs)
+            except httpx.TransportError as e:
+                upstream_requests.inc((host, 'error'))
+                delay = self.retry_policy.delay(attempt)
+                if delay is None:
+                    stats.failures += 1
+                    raise
+                logging.info("retrying %s in %.2fs: %r", url, delay, e)
+            else:
+                upstream_requests.inc((host, str(response.status_code)))
+                if response.status_code not in RETRY_STATUSES:
+                    return response
+                if response.status_code == 429:
+                    stats.throttled += 1
+                retry_after = response.headers.get('Retry-After')
+                delay = self.retry_policy.delay(attempt, retry_after)
+                if delay is None:
+                    stats.failures += 1
+                    return response
+                if stream:
+                    await response.aclose()
+                logging.info("retrying %s in %.2fs: HTTP %d", url, delay,
+                             response.status_code)
+
+            stats.retries += 1
+            await asyncio.sleep(delay)
+
+    @staticmethod
+    async def _send(url: str, stream: bool, **kwargs) -> httpx.Response:
+        client = get_async_client()
+        if not stream:
+            return await client.get(url, **kwargs)
+
+        follow_redirects = kwargs.pop('follow_redirects', False)
+        request = client.build_request('GET', url, **kwargs)
+        return await client.send(request, stream=True,
+                                 follow_redirects=follow_redirects)
+
+    def call_sync(self, host: str, fn: Callable[[], Any],
+                  retry_info: Callable[[Exception],
+                                       Optional[Tuple[int, Optional[str]]]]
+                  ) -> Any:
+        """
+        Runs the blocking `fn` (e.g. a praw call) within the host's rate
+        limit, retrying the errors it raises that `retry_info` recognizes.
+        `retry_info` returns None for errors not worth retrying, otherwise
+        the HTTP status of the error (0 when the host wasn't reached) and its
+        Retry-After header, if any.
+        Raises CircuitOpenError without calling `fn` while the host is
+        unhealthy.
+        """
+        bucket = self.bucket(host)
+        breaker = self.breakers[host]
+        breaker.before_call(host)
+        stats = self.stats[host]
+        attempt = 0
+
+        while True:
+            attempt += 1
+            wait = bucket.reserve()
+            if wait:
+                stats.waited += wait
+                time.sleep(wait)
+
+            stats.requests += 1
+            try:
+                with track_upstream(host):
+                    result = fn()
+            except Exception as e:
+                info = retry_info(e)
+                upstream_requests.inc(
+                    (host, str(info[0]) if info and info[0] else 'error'))
+                if info is None:
+                    # The host answered, it just didn't like the request
+                    breaker.record_success()
+                    stats.failures += 1
+                    raise
+                status, retry_after = info
+                if status == 429:
+                    stats.throttled += 1
+                delay = self.retry_policy.delay(attempt, retry_after)
+                if delay is None:
+                    breaker.record_failure()
+                    stats.failures += 1
+                    raise
+                logging.info("retrying %s call in %.2fs: %r", host, delay, e)
+            except BaseException:
+                breaker.release()
+                raise
+            else:
+                upstream_requests.inc((host, 'ok'))
+                breaker.record_success()
+                return result
+
+            stats.retries += 1
+            time.sleep(delay)
+
+    def reset(self) -> None:
+        """
+        Forgets the rate limiters, circuits and counters of every host
+        """
+        with self._lock:
+            self.buckets.clear()
+            self.breakers.clear()
+            self.stats.clear()
+
+    def to_dict(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Counters of every upstream host
+        """
+        with self._lock:
+            return {host: dict(stats.to_dict(),
+                               circuit=self.breakers[host].state,
+                               rejected=self.breakers[host].rejected)
+                    for host, stats in self.stats.items()}
+
+
+upstreams = Upstreams()
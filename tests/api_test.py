@@ -0,0 +1,210 @@
+import asyncio
+import json
+import time
+
+import httpx
+from fastapi.testclient import TestClient
+from prawcore.exceptions import RequestException
+from pytest_mock import MockerFixture
+
+import api
+from src.hn_source import HackerNewsItemCache
+from src.models import Result
+from src.poller import Snapshot
+from src.store import ArticleStore
+from src.upstream import CircuitOpenError
+
+"""
+Testing module that verifies the API endpoints against a fake upstream
+"""
+
+
+def test_hackernews_endpoint_is_cached(mocker: MockerFixture) -> None:
+    """
+    Test that a second identical request is served without calling upstream.
+    """
+    requests_made = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests_made.append(request.url.path)
+        if request.url.path.endswith('stories.json'):
+            return httpx.Response(200, json=[1, 2])
+        if request.url.path.endswith('updates.json'):
+            return httpx.Response(200, json={'items': []})
+        story_id = request.url.path.split('/')[-1].split('.')[0]
+        return httpx.Response(200, json={
+            'title': f'story {story_id}',
+            'url': f'https://example.com/{story_id}'
+        })
+
+    upstream = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    mocker.patch('src.upstream.get_async_client', return_value=upstream)
+    mocker.patch('src.hn_source.item_cache', HackerNewsItemCache())
+    api.cache.clear()
+
+    client = TestClient(api.app)
+    first = client.get('/hackernews/top', params={'limit': 2})
+    second = client.get('/hackernews/top', params={'limit': 1})
+
+    assert first.json() == {'posts': {
+        'story 1': 'https://example.com/1',
+        'story 2': 'https://example.com/2',
+    }}
+    assert second.json() == {'posts': {'story 1': 'https://example.com/1'}}
+    assert len(requests_made) == 4
+
+
+def test_aggregate_returns_partial_results(mocker: MockerFixture) -> None:
+    """
+    Test that sources exceeding the budget are reported without failing the
+    others.
+    """
+    async def slow_fetch(self):
+        await asyncio.sleep(5)
+
+    async def fast_fetch(self):
+        self.results = [Result(title='post', url='https://example.com')]
+        return self.results
+
+    mocker.patch('src.medium_source.MediumSource.fetch_async', slow_fetch)
+    mocker.patch('src.hn_source.HackerNewsSource.fetch_async', fast_fetch)
+    api.cache.clear()
+
+    client = TestClient(api.app)
+    response = client.get('/aggregate', params={
+        'sources': ['hn:new', 'medium:slow'], 'budget': 0.2
+    })
+
+    statuses = [source['status'] for source in response.json()['sources']]
+    assert statuses == ['ok', 'timeout']
+    assert response.json()['sources'][0]['posts'] == {
+        'post': 'https://example.com'
+    }
+    assert response.json()['elapsed_ms'] < 1000
+
+
+def test_aggregate_rejects_bad_specs() -> None:
+    """
+    Test that malformed source specs are rejected up front.
+    """
+    client = TestClient(api.app)
+    response = client.get('/aggregate', params={'sources': ['reddit:python']})
+
+    assert response.status_code == 400
+
+
+def test_polled_feed_is_served_with_age(mocker: MockerFixture) -> None:
+    """
+    Test that polled feeds are served from their snapshot with an Age header.
+    """
+    snapshot = Snapshot([Result(title='post', url='https://example.com')],
+                        10, time.time() - 42)
+    mocker.patch.dict(api.poller.snapshots,
+                      {('medium', ('python',)): snapshot})
+
+    response = TestClient(api.app).get('/medium/python')
+
+    assert response.json() == {'posts': {'post': 'https://example.com'}}
+    assert 42 <= int(response.headers['Age']) <= 43
+
+
+def test_stream_writes_ndjson_per_source(mocker: MockerFixture) -> None:
+    """
+    Test that the stream endpoint writes one line per post, and a status line
+    for sources that miss the budget.
+    """
+    async def slow_fetch(self):
+        await asyncio.sleep(5)
+
+    async def fast_fetch(self):
+        self.results = [Result(title=f'post {i}', url=f'https://e.com/{i}',
+                               source='aws') for i in range(2)]
+        return self.results
+
+    mocker.patch('src.medium_source.MediumSource.fetch_async', slow_fetch)
+    mocker.patch('src.aws_blog_source.AwsBlogSource.fetch_async', fast_fetch)
+    api.cache.clear()
+
+    response = TestClient(api.app).get('/stream', params={
+        'sources': ['medium:slow', 'aws:security'], 'budget': 0.2
+    })
+
+    assert response.headers['content-type'] == 'application/x-ndjson'
+    assert [json.loads(line) for line in response.text.splitlines()] == [
+        {'title': 'post 0', 'url': 'https://e.com/0', 'source': 'aws'},
+        {'title': 'post 1', 'url': 'https://e.com/1', 'source': 'aws'},
+        {'source': 'medium:slow', 'status': 'timeout'},
+    ]
+
+
+def test_open_circuit_serves_expired_cache(mocker: MockerFixture) -> None:
+    """
+    Test that an expired cache entry is served while the upstream's circuit
+    is open, and that we fail fast without one.
+    """
+    async def rejected_fetch(self):
+        raise CircuitOpenError('aws.amazon.com')
+
+    mocker.patch('src.aws_blog_source.AwsBlogSource.fetch_async',
+                 rejected_fetch)
+    api.cache.clear()
+    api.cache.set('aws', ('security',), 10,
+                  [Result(title='post', url='https://example.com')])
+    mocker.patch('src.cache.time.time', return_value=time.time() + 3600)
+
+    client = TestClient(api.app)
+
+    assert client.get('/aws/security').json() == {
+        'posts': {'post': 'https://example.com'}
+    }
+    assert client.get('/aws/compute').status_code == 503
+
+
+def test_reddit_failure_serves_expired_cache(mocker: MockerFixture) -> None:
+    """
+    Test that Reddit's errors fall back to an expired cache entry like the
+    other upstreams' do, and are answered with a 502 without one.
+    """
+    async def failed_fetch(self):
+        raise RequestException(ConnectionError('reset'), (), {})
+
+    mocker.patch('src.reddit_source.RedditSource.fetch_async', failed_fetch)
+    api.cache.clear()
+    api.cache.set('reddit', ('python', 'hot'), 10,
+                  [Result(title='post', url='https://example.com')])
+    mocker.patch('src.cache.time.time', return_value=time.time() + 3600)
+
+    client = TestClient(api.app)
+
+    assert client.get('/reddit/python/hot').json() == {
+        'posts': {'post': 'https://example.com'}
+    }
+    assert client.get('/reddit/golang/hot').status_code == 502
+
+
+def test_search_serves_fetched_posts(mocker: MockerFixture, tmp_path) -> None:
+    """
+    Test that fetched posts are indexed and found by the search endpoint.
+    """
+    async def fetch(self):
+        self.results = [Result(title='Searchable post', url='https://e.com/1',
+                               source='aws')]
+        return self.results
+
+    mocker.patch('src.aws_blog_source.AwsBlogSource.fetch_async', fetch)
+    mocker.patch('api.store', ArticleStore(str(tmp_path / 'store.sqlite')))
+    api.cache.clear()
+    client = TestClient(api.app)
+
+    client.get('/aws/search')
+    for _ in range(50):
+        response = client.get('/search', params={'q': 'searchable'})
+        if response.json()['posts']:
+            break
+        time.sleep(0.01)
+
+    assert response.json()['posts'] == [
+        {'title': 'Searchable post', 'url': 'https://e.com/1',
+         'source': 'aws'}]
+    assert client.get('/search', params={'q': 'x', 'order': 'best'}) \
+        .status_code == 400
@@ -0,0 +1,109 @@
+import asyncio
+
+import httpx
+import pytest
+from pytest_mock import MockerFixture
+
+from benchmarks.fake_upstream import FakeUpstream, RedirectTransport, \
+    synthetic_fixtures
+from benchmarks.harness import percentile, redirected_upstreams, \
+    run_scenario, source_operation
+from src import http_client, reddit_source
+from src.hn_source import HackerNewsItemCache
+from src.upstream import RetryPolicy, Upstreams, upstreams
+
+"""
+Testing module that verifies the benchmark harness and its fake upstream
+"""
+
+
+def test_sources_run_against_fake_upstream(mocker: MockerFixture) -> None:
+    """
+    Test that the sources are redirected to the fake upstream and that the
+    scenario report counts what they fetched.
+    """
+    mocker.patch('src.hn_source.item_cache', HackerNewsItemCache())
+    mocker.patch('src.hn_source.upstreams', Upstreams())
+    mocker.patch.dict(http_client.client_options)
+
+    with FakeUpstream(synthetic_fixtures(stories=20)) as upstream:
+        http_client.client_options['transport'] = \
+            RedirectTransport(upstream.url)
+
+        async def run():
+            try:
+                return await run_scenario(source_operation('hn:top', 5),
+                                          iterations=3, concurrency=2,
+                                          warm=False)
+            finally:
+                await http_client.close_async_client()
+
+        report = asyncio.run(run())
+
+    assert report['errors'] == 0
+    assert report['items'] == 15
+    assert report['p50_ms'] <= report['p95_ms'] <= report['p99_ms']
+    assert upstream.requests == 4 * 6
+
+
+def test_fake_upstream_injects_errors(mocker: MockerFixture) -> None:
+    """
+    Test that injected errors reach the sources as 503 answers.
+    """
+    mocker.patch('src.hn_source.upstreams',
+                 Upstreams(retry_policy=RetryPolicy(max_attempts=1)))
+    mocker.patch.dict(http_client.client_options)
+
+    with FakeUpstream(synthetic_fixtures(stories=5),
+                      error_rate=1.0) as upstream:
+        http_client.client_options['transport'] = \
+            RedirectTransport(upstream.url)
+
+        async def run():
+            try:
+                return await source_operation('hn:top', 5)()
+            finally:
+                await http_client.close_async_client()
+
+        with pytest.raises(httpx.HTTPStatusError, match='503'):
+            asyncio.run(run())
+
+    assert upstream.errors == upstream.requests == 1
+
+
+def test_redirection_is_undone_after_the_benchmark() -> None:
+    """
+    Test that the client options, Reddit clients, rate limits and circuits
+    changed to reach the fake upstream are restored afterwards.
+    """
+    options = dict(http_client.client_options)
+    clients = dict(reddit_source._clients)
+    rates = upstreams.rates
+    upstreams.bucket('example.com')
+    breakers = dict(upstreams.breakers)
+
+    with redirected_upstreams('http://127.0.0.1:1'):
+        assert isinstance(http_client.client_options['transport'],
+                          RedirectTransport)
+        assert upstreams.rates != rates
+        assert reddit_source._clients != clients
+        for _ in range(upstreams.failure_threshold):
+            upstreams.bucket('news.ycombinator.com')
+            upstreams.breakers['news.ycombinator.com'].record_failure()
+
+    assert http_client.client_options == options
+    assert reddit_source._clients == clients
+    assert upstreams.rates is rates
+    assert upstreams.breakers == breakers
+
+
+def test_percentile() -> None:
+    """
+    Test nearest-rank percentiles.
+    """
+    values = [float(value) for value in range(1, 101)]
+
+    assert percentile(values, 0.50) == 50.0
+    assert percentile(values, 0.95) == 95.0
+    assert percentile(values, 0.99) == 99.0
+    assert percentile([], 0.5) == 0.0
@@ -0,0 +1,97 @@
+import asyncio
+import threading
+import time
+
+from src.cache import ResultCache, SqliteCacheBackend
+from src.models import Result
+
+"""
+Testing module that verifies the behaviour of the results cache
+"""
+
+
+def make_results(count: int):
+    return [Result(title=f"post {i}", url=f"https://example.com/{i}")
+            for i in range(count)]
+
+
+def test_larger_limit_serves_smaller() -> None:
+    """
+    Test that an entry fetched with a large limit serves smaller limits only.
+    """
+    cache = ResultCache()
+    cache.set('hackernews', ('top',), 10, make_results(10))
+
+    assert [r.title for r in cache.get('hackernews', ('top',), 3)] == \
+           ['post 0', 'post 1', 'post 2']
+    assert cache.get('hackernews', ('top',), 20) is None
+
+
+def test_entries_expire(mocker) -> None:
+    """
+    Test that entries are not served after the TTL of their source type.
+    """
+    cache = ResultCache(ttls={'medium': 10})
+    cache.set('medium', ('python',), 5, make_results(5))
+
+    mocker.patch('src.cache.time.time', return_value=time.time() + 11)
+    assert cache.get('medium', ('python',), 5) is None
+
+
+def test_lru_eviction_by_size() -> None:
+    """
+    Test that the least recently used entries are evicted to stay in bound.
+    """
+    one = ResultCache()
+    one.set('aws', ('a',), 5, make_results(5))
+    cache = ResultCache(max_bytes=int(one.size * 2.5))
+    cache.set('aws', ('a',), 5, make_results(5))
+    cache.set('aws', ('b',), 5, make_results(5))
+    cache.get('aws', ('a',), 5)
+    cache.set('aws', ('c',), 5, make_results(5))
+
+    assert cache.get('aws', ('a',), 5) is not None
+    assert cache.get('aws', ('b',), 5) is None
+    assert cache.get('aws', ('c',), 5) is not None
+
+
+def test_shared_backend_between_caches(tmp_path) -> None:
+    """
+    Test that two caches sharing a SQLite file see each other's entries.
+    """
+    path = str(tmp_path / 'cache.sqlite')
+    writer = ResultCache(backend=SqliteCacheBackend(path))
+    reader = ResultCache(backend=SqliteCacheBackend(path))
+
+    writer.set('reddit', ('python', 'hot'), 5, make_results(5))
+
+    results = reader.get('reddit', ('python', 'hot'), 5)
+    assert [r.url for r in results] == [r.url for r in make_results(5)]
+
+
+def test_async_access_reads_and_writes_backend_off_the_loop(
+        tmp_path) -> None:
+    """
+    Test that the async variants share entries through the backend, making
+    its SQLite calls on threads other than the event loop's.
+    """
+    path = str(tmp_path / 'cache.sqlite')
+    writer = ResultCache(backend=SqliteCacheBackend(path))
+    reader = ResultCache(backend=SqliteCacheBackend(path))
+    threads = []
+    backend_get = reader.backend.get
+
+    def get(key):
+        threads.append(threading.get_ident())
+        return backend_get(key)
+
+    reader.backend.get = get
+
+    async def run():
+        await writer.set_async('medium', ('python',), 5, make_results(5))
+        return await reader.get_async('medium', ('python',), 5)
+
+    results = asyncio.run(run())
+
+    assert [r.url for r in results] == [r.url for r in make_results(5)]
+    assert threads and threading.get_ident() not in threads
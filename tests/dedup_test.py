@@ -0,0 +1,113 @@
+import time
+
+from src.dedup import Deduplicator, canonicalize_url
+from src.models import Result
+
+"""
+Testing module that verifies the deduplication of results
+"""
+
+
+def test_canonicalize_url() -> None:
+    """
+    Test that copies of the same URL with tracking noise compare equal.
+    """
+    assert canonicalize_url(
+        'http://WWW.Example.com:80/post/?utm_source=hn&id=2&a=1#comments'
+    ) == 'https://example.com/post?a=1&id=2'
+    assert canonicalize_url('https://example.com/post') == \
+           canonicalize_url('https://example.com/post/?fbclid=abc')
+
+
+def test_filter_drops_url_and_near_title_duplicates() -> None:
+    """
+    Test that the same article from another source is dropped, whether it
+    shares the URL or an almost identical title.
+    """
+    deduplicator = Deduplicator()
+    results = [
+        Result('Rust 1.80 released with lazy cell and exclusive ranges',
+               'https://blog.rust-lang.org/2024/07/25/Rust-1.80.0.html'),
+        Result('Show HN: something else entirely',
+               'http://blog.rust-lang.org/2024/07/25/Rust-1.80.0.html/'),
+        Result('Rust 1.80 released, with lazy cell and exclusive ranges!',
+               'https://medium.com/some-copy?source=rss'),
+        Result('An unrelated article about Python packaging',
+               'https://example.com/python'),
+    ]
+
+    kept = list(deduplicator.filter(results))
+
+    assert [result.url for result in kept] == [results[0].url, results[3].url]
+    assert deduplicator.duplicates == 2
+
+
+def test_memory_is_bounded_and_persisted(tmp_path) -> None:
+    """
+    Test that only the most recent items are remembered, across runs.
+    """
+    deduplicator = Deduplicator(max_items=2)
+    list(deduplicator.filter([Result(f'title {i}', f'https://e.com/{i}')
+                              for i in range(3)]))
+    path = str(tmp_path / 'seen.json')
+    deduplicator.save(path)
+
+    restored = Deduplicator()
+    restored.load(path)
+    kept = list(restored.filter([Result('title 0', 'https://e.com/0'),
+                                 Result('title 2', 'https://e.com/2')]))
+
+    assert [result.url for result in kept] == ['https://e.com/0']
+
+
+def test_filter_keeps_up_with_thousands_of_items() -> None:
+    """
+    Test that filtering thousands of items stays well under a second.
+    """
+    results = [Result(f'Article number {i} about topic {i * 7} today',
+                      f'https://example.com/articles/{i}?utm_medium=x')
+               for i in range(5000)]
+
+    start = time.perf_counter()
+    list(Deduplicator().filter(results))
+
+    assert time.perf_counter() - start < 2
+
+
+def test_content_parameters_and_title_only_results() -> None:
+    """
+    Test that parameters which aren't known trackers are kept, and that
+    results without a URL are deduplicated by their title.
+    """
+    assert canonicalize_url('https://example.com/view?ref=main&sk=2') == \
+        'https://example.com/view?ref=main&sk=2'
+    assert canonicalize_url('https://example.com/?source=feed') == \
+        'https://example.com?source=feed'
+
+    deduplicator = Deduplicator()
+    kept = list(deduplicator.filter([Result('Weekly thread', ''),
+                                     Result('Weekly thread', ''),
+                                     Result('Other thread', '')]))
+
+    assert [result.title for result in kept] == ['Weekly thread',
+                                                 'Other thread']
+    assert deduplicator.duplicates == 1
+
+
+def test_malformed_urls_are_kept_as_they_are() -> None:
+    """
+    Test that URLs that can't be split are compared as given rather than
+    failing the whole batch.
+    """
+    assert canonicalize_url(' http://example.com:abc/x ') == \
+        'http://example.com:abc/x'
+    assert canonicalize_url('http://[::1/x') == 'http://[::1/x'
+
+    kept = list(Deduplicator().filter([
+        Result('bad port', 'http://example.com:abc/x'),
+        Result('bad port again', 'http://example.com:abc/x'),
+        Result('unclosed bracket', 'http://[::1/x'),
+    ]))
+
+    assert [result.title for result in kept] == ['bad port',
+                                                 'unclosed bracket']
@@ -0,0 +1,188 @@
+import asyncio
+from typing import List, Optional
+
+import httpx
+from pytest_mock import MockerFixture
+
+from src.feeds import MAX_FEED_BYTES, ConditionalFeedCache, \
+    entry_published, fetch_feed_entries, read_feed_entries
+
+"""
+Testing module that verifies the fetching and parsing of RSS feeds
+"""
+
+FEED = b'''<?xml version="1.0"?>
+<rss version="2.0"><channel><title>feed</title>
+<item><title>first</title><link>https://example.com/1</link></item>
+<item><title>second</title><link>https://example.com/2</link></item>
+</channel></rss>'''
+
+
+def read_entries(body: bytes, limit: Optional[int] = None,
+                 read: List[int] = None) -> list:
+    """
+    Entries read out of a response streaming `body` in 16 byte chunks, the
+    start of every chunk read is appended to `read`
+    """
+    async def chunks():
+        for start in range(0, len(body), 16):
+            if read is not None:
+                read.append(start)
+            yield body[start:start + 16]
+
+    response = httpx.Response(
+        200, content=chunks(),
+        request=httpx.Request('GET', 'https://example.com/feed'))
+    entries, _ = asyncio.run(read_feed_entries(response, limit,
+                                               MAX_FEED_BYTES))
+    return entries
+
+
+def test_not_modified_feed_reuses_entries(mocker: MockerFixture) -> None:
+    """
+    Test that validators are sent back and a 304 serves the previous entries.
+    """
+    seen_headers = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen_headers.append(request.headers.get('If-None-Match'))
+        if request.headers.get('If-None-Match') == '"v1"':
+            return httpx.Response(304)
+        return httpx.Response(200, content=FEED, headers={'ETag': '"v1"'})
+
+    feed_cache = ConditionalFeedCache()
+    mocker.patch('src.feeds.feed_cache', feed_cache)
+    mocker.patch('src.upstream.get_async_client',
+                 return_value=httpx.AsyncClient(
+                     transport=httpx.MockTransport(handler)))
+
+    url = 'https://example.com/feed'
+    first = asyncio.run(fetch_feed_entries(url))
+    second = asyncio.run(fetch_feed_entries(url))
+
+    assert [entry.title for entry in first] == ['first', 'second']
+    assert second is first
+    assert seen_headers == [None, '"v1"']
+    assert feed_cache.stats() == {'hits': 1, 'misses': 1, 'feeds': 1}
+
+
+def test_limit_stops_parsing_and_larger_limit_refetches(
+        mocker: MockerFixture) -> None:
+    """
+    Test that a limited fetch keeps only `limit` entries and that a later
+    fetch asking for more isn't served from the partial entries.
+    """
+    seen_headers = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen_headers.append(request.headers.get('If-None-Match'))
+        if request.headers.get('If-None-Match') == '"v1"':
+            return httpx.Response(304)
+        return httpx.Response(200, content=FEED, headers={'ETag': '"v1"'})
+
+    mocker.patch('src.feeds.feed_cache', ConditionalFeedCache())
+    mocker.patch('src.upstream.get_async_client',
+                 return_value=httpx.AsyncClient(
+                     transport=httpx.MockTransport(handler)))
+
+    url = 'https://example.com/feed'
+    first = asyncio.run(fetch_feed_entries(url, limit=1))
+    again = asyncio.run(fetch_feed_entries(url, limit=1))
+    more = asyncio.run(fetch_feed_entries(url, limit=5))
+
+    assert [entry.title for entry in first] == ['first']
+    assert [entry.title for entry in again] == ['first']
+    assert [entry.title for entry in more] == ['first', 'second']
+    assert seen_headers == [None, '"v1"', None]
+
+
+def test_stream_parser_stops_reading_chunks() -> None:
+    """
+    Test that the chunks after the last needed entry are never read.
+    """
+    read = []
+
+    entries = read_entries(FEED, limit=1, read=read)
+
+    assert [entry.link for entry in entries] == ['https://example.com/1']
+    assert len(read) < len(range(0, len(FEED), 16))
+
+
+def test_atom_entries_have_feedparser_fields() -> None:
+    """
+    Test that Atom entries get the fields the sources read.
+    """
+    atom = b'''<?xml version="1.0" encoding="utf-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom"><title>feed</title>
+<entry><title>atom post</title><id>urn:1</id>
+<link rel="alternate" href="https://example.com/a"/>
+<author><name>someone</name></author>
+<published>2021-03-04T05:06:07Z</published></entry>
+</feed>'''
+
+    entry, = read_entries(atom)
+
+    assert entry.title == 'atom post'
+    assert entry.link == 'https://example.com/a'
+    assert entry.links[0].href == 'https://example.com/a'
+    assert entry.id == 'urn:1'
+    assert entry.author == 'someone'
+    assert entry_published(entry) == 1614834367.0
+
+
+def test_rss1_items_are_parsed() -> None:
+    """
+    Test that RSS 1.0 (RDF) items are read like RSS 2.0 ones.
+    """
+    rdf = b'''<?xml version="1.0"?>
+<rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#"
+ xmlns="http://purl.org/rss/1.0/" xmlns:dc="http://purl.org/dc/elements/1.1/">
+<channel rdf:about="https://example.com"><title>feed</title></channel>
+<item rdf:about="https://example.com/1"><title>rdf post</title>
+<link>https://example.com/1</link><dc:creator>someone</dc:creator>
+<dc:date>2021-03-04T05:06:07Z</dc:date></item>
+</rdf:RDF>'''
+
+    entry, = read_entries(rdf)
+
+    assert entry.title == 'rdf post'
+    assert entry.link == 'https://example.com/1'
+    assert entry.id == 'https://example.com/1'
+    assert entry.author == 'someone'
+    assert entry_published(entry) == 1614834367.0
+
+
+def test_unknown_formats_fall_back_to_feedparser() -> None:
+    """
+    Test that documents of another format, or where no entry was found, are
+    left to feedparser rather than read as empty feeds.
+    """
+    other = b'''<?xml version="1.0"?>
+<feed><item><title>other post</title></item></feed>'''
+    empty = b'''<?xml version="1.0"?>
+<rss version="2.0"><channel><title>feed</title></channel></rss>'''
+
+    assert [entry.title for entry in read_entries(other)] == ['other post']
+    assert read_entries(empty) == []
+    assert read_entries(b'') == []
+
+
+def test_malformed_feed_falls_back_to_feedparser(
+        mocker: MockerFixture) -> None:
+    """
+    Test that feeds the XML parser rejects are still parsed by feedparser.
+    """
+    broken = FEED.replace(b'<title>first</title>',
+                          b'<title>first &nbsp;</title>')
+
+    mocker.patch('src.feeds.feed_cache', ConditionalFeedCache())
+    mocker.patch('src.upstream.get_async_client',
+                 return_value=httpx.AsyncClient(
+                     transport=httpx.MockTransport(
+                         lambda request: httpx.Response(200,
+                                                        content=broken))))
+
+    entries = asyncio.run(fetch_feed_entries('https://example.com/feed'))
+
+    assert [entry.link for entry in entries] == ['https://example.com/1',
+                                                 'https://example.com/2']
@@ -0,0 +1,124 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+from pytest_mock import MockerFixture
+
+from src.hn_source import HackerNewsItemCache, HackerNewsSource
+
+"""
+Testing module that verifies the HackerNews fetching mechanism
+"""
+
+
+def build_client(delay: float = 0.0) -> httpx.AsyncClient:
+    """
+    Builds an AsyncClient that serves fake HackerNews responses
+    """
+    async def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path.endswith('stories.json'):
+            return httpx.Response(200, json=list(range(1, 51)))
+
+        await asyncio.sleep(delay)
+        story_id = request.url.path.split('/')[-1].split('.')[0]
+        return httpx.Response(200, json={
+            'title': f'story {story_id}',
+            'url': f'https://example.com/{story_id}'
+        })
+
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+def test_fetch_respects_limit(mocker: MockerFixture) -> None:
+    """
+    Test that only `limit` stories are fetched, in the order of the ids list.
+    """
+    mocker.patch('src.upstream.get_async_client',
+                 return_value=build_client())
+
+    source = HackerNewsSource(metric='top', limit=3)
+    source.fetch()
+
+    assert [result.title for result in source.results] == \
+           ['story 1', 'story 2', 'story 3']
+
+
+def test_fetch_stories_concurrently(mocker: MockerFixture) -> None:
+    """
+    Test that fetching N stories takes about as long as the slowest one.
+    """
+    client = build_client(delay=0.2)
+    mocker.patch('src.upstream.get_async_client', return_value=client)
+
+    source = HackerNewsSource(metric='top', limit=10, max_concurrency=10)
+    start = time.perf_counter()
+    source.fetch()
+    elapsed = time.perf_counter() - start
+
+    assert len(source.results) == 10
+    assert elapsed < 1.0
+
+
+def test_incremental_fetch_only_refetches_changed(mocker: MockerFixture) -> None:
+    """
+    Test that an incremental poll reuses cached stories and only refetches
+    the ones reported by the updates feed.
+    """
+    requests_made = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        requests_made.append(path.split('/')[-1])
+        if path.endswith('maxitem.json'):
+            return httpx.Response(200, json=100)
+        if path.endswith('newstories.json'):
+            return httpx.Response(200, json=[100, 99, 98])
+        if path.endswith('updates.json'):
+            return httpx.Response(200, json={'items': [99], 'profiles': []})
+        story_id = path.split('/')[-1].split('.')[0]
+        return httpx.Response(200, json={'title': f'story {story_id}',
+                                         'url': f'https://e.com/{story_id}'})
+
+    mocker.patch('src.hn_source.item_cache', HackerNewsItemCache())
+    mocker.patch('src.upstream.get_async_client',
+                 return_value=httpx.AsyncClient(
+                     transport=httpx.MockTransport(handler)))
+
+    HackerNewsSource(metric='new', limit=3, incremental=True).fetch()
+    requests_made.clear()
+    source = HackerNewsSource(metric='new', limit=3, incremental=True)
+    source.fetch()
+
+    assert requests_made == ['maxitem.json', 'updates.json', '99.json']
+    assert [result.title for result in source.results] == \
+           ['story 100', 'story 99', 'story 98']
+
+
+def test_failed_stories_are_an_outage_only_when_all_fail(
+        mocker: MockerFixture) -> None:
+    """
+    Test that a failed story is left empty, and that an error is raised when
+    every story fails.
+    """
+    failing = {'2'}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path.endswith('stories.json'):
+            return httpx.Response(200, json=[1, 2])
+        story_id = request.url.path.split('/')[-1].split('.')[0]
+        if story_id in failing:
+            return httpx.Response(404)
+        return httpx.Response(200, json={'title': f'story {story_id}',
+                                         'url': 'https://example.com'})
+
+    mocker.patch('src.upstream.get_async_client',
+                 return_value=httpx.AsyncClient(
+                     transport=httpx.MockTransport(handler)))
+
+    source = HackerNewsSource(metric='top', limit=2)
+    assert [result.title for result in source.fetch()] == ['story 1', '']
+
+    failing.add('1')
+    with pytest.raises(httpx.HTTPStatusError):
+        HackerNewsSource(metric='top', limit=2).fetch()
@@ -0,0 +1,154 @@
+import asyncio
+import json
+
+import pytest
+from pytest_mock import MockerFixture
+
+from src.jobs import Job, JobError, JobFeed, JobRunner, load_job, parse_job
+from src.models import Source, SourceManager
+
+"""
+Testing module that verifies the parsing and running of job files
+"""
+
+
+class RecordingSource(Source):
+    """
+    Source that records when it was fetched
+    """
+    def __init__(self, name: str, log: list, delay: float = 0.0) -> None:
+        self.name = name
+        self.log = log
+        self.delay = delay
+        self.results = []
+
+    def connect(self):
+        pass
+
+    async def fetch_async(self):
+        self.log.append(self.name)
+        await asyncio.sleep(self.delay)
+        return self.results
+
+    def __repr__(self) -> str:
+        return self.name
+
+
+def make_feed(name: str, log: list, priority: int = 0, ttl: float = 300,
+              delay: float = 0.0, timeout: float = None) -> JobFeed:
+    return JobFeed(name, 10, ttl, priority, timeout,
+                   lambda: RecordingSource(name, log, delay))
+
+
+def test_job_files_of_every_format(tmp_path) -> None:
+    """
+    Test that JSON, YAML and TOML job files load to the same job, with the
+    defaults applied to every feed.
+    """
+    data = {
+        'concurrency': 4,
+        'defaults': {'limit': 20, 'ttl': 60},
+        'feeds': ['hn:top',
+                  {'source': 'reddit:python:hot', 'limit': 5,
+                   'priority': 2, 'timeout': 3}],
+    }
+    (tmp_path / 'job.json').write_text(json.dumps(data))
+    (tmp_path / 'job.yaml').write_text(
+        "concurrency: 4\n"
+        "defaults: {limit: 20, ttl: 60}\n"
+        "feeds:\n"
+        "  - hn:top\n"
+        "  - {source: 'reddit:python:hot', limit: 5, priority: 2, "
+        "timeout: 3}\n")
+    (tmp_path / 'job.toml').write_text(
+        "concurrency = 4\n"
+        "feeds = ['hn:top', {source = 'reddit:python:hot', limit = 5, "
+        "priority = 2, timeout = 3}]\n"
+        "[defaults]\nlimit = 20\nttl = 60\n")
+
+    for name in ('job.json', 'job.yaml', 'job.toml'):
+        job = load_job(str(tmp_path / name))
+        assert job.concurrency == 4
+        assert [(feed.spec, feed.limit, feed.ttl, feed.priority,
+                 feed.timeout) for feed in job.feeds] == \
+               [('hn:top', 20, 60.0, 0, None),
+                ('reddit:python:hot', 5, 60.0, 2, 3.0)]
+
+
+@pytest.mark.parametrize('data, message', [
+    ({'feeds': []}, "`feeds` should be a non-empty list"),
+    ({'feeds': ['hn']}, "feeds[0]: bad source spec 'hn'"),
+    ({'feeds': [{'source': 'hn:top', 'limit': 'ten'}]},
+     "feeds[0].limit should be an integer"),
+    ({'feeds': ['hn:top', {'source': 'aws:security', 'ttl': 0}]},
+     "feeds[1].ttl should be at least 1"),
+    ({'feeds': [{'source': 'hn:top', 'every': 5}]},
+     "feeds[0]: unknown keys ['every']"),
+    ({'feeds': ['hn:top', 'hn:top']}, "feeds[1]: hn:top is listed twice"),
+    ({'feeds': ['hn:top'], 'concurrency': 0},
+     "concurrency should be at least 1"),
+])
+def test_invalid_jobs_are_rejected(data, message) -> None:
+    """
+    Test that mistakes are reported up front with where they are.
+    """
+    with pytest.raises(JobError) as exc_info:
+        parse_job(data, 'job.yaml')
+
+    assert message in str(exc_info.value)
+
+
+def test_missing_format_package_is_named(tmp_path,
+                                         mocker: MockerFixture) -> None:
+    """
+    Test that a job file format whose package isn't installed names the
+    package to install.
+    """
+    path = tmp_path / 'job.yaml'
+    path.write_text('feeds: [hn:top]')
+    mocker.patch.dict('sys.modules', {'yaml': None})
+
+    with pytest.raises(JobError, match='requires PyYAML'):
+        load_job(str(path))
+
+
+def test_runner_fetches_by_priority_within_concurrency(capsys) -> None:
+    """
+    Test that higher priority feeds are fetched first and that every feed is
+    presented once.
+    """
+    log = []
+    feeds = [make_feed('low', log, priority=0, delay=0.01),
+             make_feed('high', log, priority=5, delay=0.01),
+             make_feed('mid', log, priority=1, delay=0.01)]
+    runner = JobRunner(Job(feeds, concurrency=1), SourceManager())
+
+    asyncio.run(runner.run())
+
+    assert log == ['high', 'mid', 'low']
+    assert capsys.readouterr().out.split() == ['high', 'mid', 'low']
+
+
+def test_runner_reports_timeouts_and_refetches_when_watching(
+        capsys) -> None:
+    """
+    Test that a feed over its timeout is reported and that watched feeds are
+    fetched again once their ttl passed.
+    """
+    log = []
+    feeds = [make_feed('slow', log, delay=1, timeout=0.05, ttl=10),
+             make_feed('fast', log, ttl=0.05)]
+    runner = JobRunner(Job(feeds, concurrency=2), SourceManager())
+
+    async def watch_for_a_while():
+        task = asyncio.ensure_future(runner.run(watch=True))
+        await asyncio.sleep(0.3)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(watch_for_a_while())
+
+    assert log.count('slow') == 1
+    assert log.count('fast') >= 3
+    assert 'RecordingSource failed [timed out]' in capsys.readouterr().out
+    assert runner.failures == 1
@@ -0,0 +1,110 @@
+import httpx
+from fastapi.testclient import TestClient
+from pytest_mock import MockerFixture
+
+import api
+from src import metrics
+from src.hn_source import HackerNewsSource
+from src.metrics import Counter, Registry, source_labels, \
+    timings_summary, track_fetch
+
+"""
+Testing module that verifies the metrics and their Prometheus rendering
+"""
+
+
+def test_histogram_renders_cumulative_buckets() -> None:
+    """
+    Test the exposition format of a labelled histogram.
+    """
+    registry = Registry()
+    histogram = registry.histogram('fetch_seconds', "Fetch duration",
+                                   ('source',), buckets=(0.1, 1.0))
+    histogram.observe(('hn',), 0.05)
+    histogram.observe(('hn',), 0.5)
+    histogram.observe(('hn',), 5)
+
+    assert registry.render().splitlines() == [
+        '# HELP fetch_seconds Fetch duration',
+        '# TYPE fetch_seconds histogram',
+        'fetch_seconds_bucket{source="hn",le="0.1"} 1',
+        'fetch_seconds_bucket{source="hn",le="1"} 2',
+        'fetch_seconds_bucket{source="hn",le="+Inf"} 3',
+        'fetch_seconds_sum{source="hn"} 5.55',
+        'fetch_seconds_count{source="hn"} 3',
+    ]
+
+
+def test_label_values_are_escaped_and_bounded(mocker: MockerFixture) -> None:
+    """
+    Test that label values are escaped and that series past MAX_SERIES are
+    folded together.
+    """
+    mocker.patch('src.metrics.MAX_SERIES', 2)
+    counter = Counter('items_total', "Items", ('tag',))
+    counter.inc(('a"b',))
+    counter.inc(('c',))
+    counter.inc(('d',))
+    counter.inc(('e',))
+
+    assert 'items_total{tag="a\\"b"} 1' in counter.render()
+    assert counter.get(('_other',)) == 2
+
+
+def test_track_fetch_counts_items_and_errors(mocker: MockerFixture) -> None:
+    """
+    Test that a tracked fetch records its duration, items and errors under
+    the source type and parameters.
+    """
+    for name in ('source_fetch_seconds', 'source_items', 'source_errors'):
+        metric = getattr(metrics, name)
+        mocker.patch.object(metric, 'values', {})
+
+    source = HackerNewsSource(metric='top')
+    source.results = [object(), object()]
+    with track_fetch(source):
+        pass
+    try:
+        with track_fetch(source):
+            raise RuntimeError("upstream is down")
+    except RuntimeError:
+        pass
+
+    labels = source_labels(source)
+    assert labels == ('hackernews', 'top')
+    assert metrics.source_fetch_seconds.count(labels) == 2
+    assert metrics.source_items.get(labels) == 2
+    assert metrics.source_errors.get(labels) == 1
+    assert 'hackernews[top]' in timings_summary()
+
+
+def test_metrics_endpoint(mocker: MockerFixture) -> None:
+    """
+    Test that /metrics exposes source, upstream and cache metrics once an
+    endpoint was called.
+    """
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path.endswith('stories.json'):
+            return httpx.Response(200, json=[1])
+        if request.url.path.endswith('updates.json'):
+            return httpx.Response(200, json={'items': []})
+        return httpx.Response(200, json={'title': 'story',
+                                         'url': 'https://example.com/1'})
+
+    mocker.patch('src.upstream.get_async_client',
+                 return_value=httpx.AsyncClient(
+                     transport=httpx.MockTransport(handler)))
+    api.cache.clear()
+
+    client = TestClient(api.app)
+    client.get('/hackernews/best?limit=1')
+    response = client.get('/metrics')
+
+    assert response.status_code == 200
+    assert response.headers['content-type'].startswith('text/plain')
+    body = response.text
+    assert 'fuse_source_fetch_seconds_count{source="hackernews",' \
+           'params="best"}' in body
+    assert 'fuse_upstream_requests_total{host="hacker-news.firebaseio.com",' \
+           'status="200"}' in body
+    assert 'fuse_cache_lookups_total{cache="results",result="miss"}' in body
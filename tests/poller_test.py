@@ -0,0 +1,130 @@
+import asyncio
+
+import httpx
+from pytest_mock import MockerFixture
+
+from src.feeds import ConditionalFeedCache
+from src.medium_source import MediumSource
+from src.models import Result, Source
+from src.poller import FeedPoller, PolledFeed, SharedSnapshots
+from src.upstream import RetryPolicy, Upstreams
+
+"""
+Testing module that verifies the background refreshing of feeds
+"""
+
+FEED = b'''<?xml version="1.0"?>
+<rss version="2.0"><channel><title>feed</title>
+<item><title>post</title><link>https://example.com/1</link></item>
+</channel></rss>'''
+
+
+class FlakySource(Source):
+    """
+    Source that fails whenever `outcomes` says so
+    """
+    def __init__(self, outcomes):
+        self.outcomes = outcomes
+        self.results = []
+
+    def connect(self):
+        pass
+
+    async def fetch_async(self):
+        if not self.outcomes.pop(0):
+            raise ConnectionError("upstream is down")
+        self.results = [Result(title='post', url='https://example.com')]
+        return self.results
+
+
+def test_failed_refresh_keeps_snapshot_and_backs_off() -> None:
+    """
+    Test that a failing upstream keeps serving the last snapshot while the
+    refresh interval grows.
+    """
+    outcomes = [True, False, False]
+    feed = PolledFeed('hackernews', ('top',), 10, 60,
+                      lambda: FlakySource(outcomes))
+    poller = FeedPoller([feed], jitter=0)
+
+    asyncio.run(poller.refresh(feed))
+    assert poller.next_delay(feed) == 60
+
+    asyncio.run(poller.refresh(feed))
+    asyncio.run(poller.refresh(feed))
+
+    snapshot = poller.get('hackernews', ('top',), 5)
+    assert [result.title for result in snapshot.results] == ['post']
+    assert snapshot.failures == 2
+    assert poller.next_delay(feed) == 240
+
+
+def test_snapshot_serves_smaller_limits_only() -> None:
+    """
+    Test that a snapshot isn't used for requests larger than it was polled
+    with, unless the feed had fewer items.
+    """
+    feed = PolledFeed('hackernews', ('top',), 1, 60,
+                      lambda: FlakySource([True]))
+    poller = FeedPoller([feed])
+    asyncio.run(poller.refresh(feed))
+
+    assert poller.get('hackernews', ('top',), 1) is not None
+    assert poller.get('hackernews', ('top',), 5) is None
+
+
+def test_shared_snapshots_are_fetched_once(tmp_path) -> None:
+    """
+    Test that pollers sharing their snapshots don't fetch a feed another
+    one fetched or is fetching.
+    """
+    path = str(tmp_path / 'snapshots.sqlite')
+    outcomes = [True]
+    feed = PolledFeed('hackernews', ('top',), 10, 60,
+                      lambda: FlakySource(outcomes))
+    first = FeedPoller([feed], jitter=0, shared=SharedSnapshots(path))
+    second = FeedPoller([feed], jitter=0, shared=SharedSnapshots(path))
+    third = FeedPoller([feed], jitter=0, shared=SharedSnapshots(path))
+
+    asyncio.run(first.refresh(feed))
+    asyncio.run(second.refresh(feed))
+
+    snapshot = second.get('hackernews', ('top',), 10)
+    assert [result.title for result in snapshot.results] == ['post']
+    assert snapshot.fetched_at == first.snapshots[feed.key].fetched_at
+    assert outcomes == []
+    assert 59 < second.next_delay(feed) <= 60
+
+    assert second.shared.claim(feed.key)
+    assert not third.shared.claim(feed.key)
+    second.shared.release(feed.key)
+    assert third.shared.claim(feed.key)
+
+
+def test_feed_outage_keeps_snapshot(mocker: MockerFixture) -> None:
+    """
+    Test that a feed answering with errors after a good fetch is a failed
+    refresh, not an empty snapshot.
+    """
+    statuses = [200, 503]
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(statuses.pop(0), content=FEED)
+
+    mocker.patch('src.feeds.feed_cache', ConditionalFeedCache())
+    mocker.patch('src.feeds.upstreams',
+                 Upstreams(retry_policy=RetryPolicy(max_attempts=1)))
+    mocker.patch('src.upstream.get_async_client',
+                 return_value=httpx.AsyncClient(
+                     transport=httpx.MockTransport(handler)))
+    feed = PolledFeed('medium', ('python',), 10, 60,
+                      lambda: MediumSource(tag='python', limit=10))
+    poller = FeedPoller([feed], jitter=0)
+
+    asyncio.run(poller.refresh(feed))
+    asyncio.run(poller.refresh(feed))
+
+    snapshot = poller.get('medium', ('python',), 10)
+    assert [result.title for result in snapshot.results] == ['post']
+    assert snapshot.failures == 1
+    assert poller.next_delay(feed) == 120
@@ -0,0 +1,75 @@
+from pytest_mock import MockerFixture
+
+from src import reddit_source
+from src.reddit_source import RedditSource
+
+"""
+Testing module that verifies the Reddit client reuse
+"""
+
+
+def test_sources_share_client_per_credentials(mocker: MockerFixture) -> None:
+    """
+    Test that sources with the same credentials share their Reddit clients,
+    and that a client is only used by one thread at a time.
+    """
+    reddit_cls = mocker.patch('src.reddit_source.praw.Reddit',
+                              side_effect=lambda **kwargs: object())
+    mocker.patch.dict(reddit_source._clients, clear=True)
+
+    first = RedditSource('python', reddit_id='id', reddit_secret='secret')
+    second = RedditSource('golang', reddit_id='id', reddit_secret='secret')
+    other = RedditSource('rust', reddit_id='other', reddit_secret='secret')
+
+    assert first.reddit_con is second.reddit_con
+    assert other.reddit_con is not first.reddit_con
+    assert reddit_cls.call_count == 0
+
+    with first.reddit_con.use() as client:
+        with second.reddit_con.use() as concurrent:
+            assert concurrent is not client
+    with second.reddit_con.use() as later:
+        assert later in (client, concurrent)
+    assert reddit_cls.call_count == 2
+
+
+class FakeSubmission:
+    """
+    Stand-in for praw's Submission
+    """
+    def __init__(self, subreddit: str, index: int):
+        self.title = f"{subreddit} {index}"
+        self.url = f"https://example.com/{subreddit}/{index}"
+        self.subreddit = type('Subreddit', (), {'display_name': subreddit})
+
+
+def test_batch_splits_combined_listing(mocker: MockerFixture) -> None:
+    """
+    Test that a batch reads one combined listing, and lists on their own
+    only the subreddits it didn't fill up.
+    """
+    listings = []
+
+    def subreddit(name):
+        def hot(limit):
+            listings.append((name, limit))
+            if '+' in name:
+                return [FakeSubmission('Python', i) for i in range(5)] + \
+                       [FakeSubmission('golang', 0)]
+            return [FakeSubmission(name, i) for i in range(limit)]
+        return mocker.Mock(hot=hot)
+
+    reddit_con = mocker.Mock(subreddit=subreddit)
+    reddit_con.auth.limits = {'remaining': 600}
+    mocker.patch('src.reddit_source.get_reddit_client',
+                 return_value=reddit_source.RedditClients(
+                     lambda: reddit_con))
+
+    sources = [RedditSource(sub, limit=2) for sub in ('python', 'golang')]
+    reddit_source.SubredditBatch(sources)
+    for source in sources:
+        source.fetch()
+
+    assert [r.title for r in sources[0].results] == ['Python 0', 'Python 1']
+    assert [r.title for r in sources[1].results] == ['golang 0', 'golang 1']
+    assert listings == [('python+golang', 4), ('golang', 2)]
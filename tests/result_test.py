@@ -0,0 +1,37 @@
+import json
+
+from src.models import Result, results_to_json, results_to_ndjson
+
+"""
+Testing module that verifies the Result model and its serialization
+"""
+
+
+def test_result_round_trip() -> None:
+    """
+    Test that a result survives to_dict / from_dict, and unknown metadata is
+    left out.
+    """
+    result = Result('title', 'https://example.com', source='hackernews',
+                    id='1', score=10)
+
+    assert result.to_dict() == {
+        'title': 'title', 'url': 'https://example.com',
+        'source': 'hackernews', 'id': '1', 'score': 10
+    }
+    assert Result.from_dict(result.to_dict()).to_dict() == result.to_dict()
+    assert not hasattr(result, '__dict__')
+
+
+def test_bulk_serialization() -> None:
+    """
+    Test that JSON and NDJSON serialization agree.
+    """
+    results = [Result(f'title {i}', f'https://example.com/{i}', score=i)
+               for i in range(3)]
+
+    lines = list(results_to_ndjson(results))
+
+    assert all(line.endswith('\n') for line in lines)
+    assert [json.loads(line) for line in lines] == \
+           json.loads(results_to_json(results))
@@ -0,0 +1,52 @@
+import asyncio
+
+import pytest
+
+from src.single_flight import SingleFlight
+
+"""
+Testing module that verifies the request coalescing of SingleFlight
+"""
+
+
+def test_concurrent_calls_are_collapsed() -> None:
+    """
+    Test that concurrent calls with the same key run the function once.
+    """
+    single_flight = SingleFlight()
+    executions = []
+
+    async def slow_fetch():
+        executions.append(1)
+        await asyncio.sleep(0.1)
+        return ['result']
+
+    async def run_all():
+        return await asyncio.gather(
+            *[single_flight.do('key', slow_fetch) for _ in range(10)])
+
+    results = asyncio.run(run_all())
+
+    assert len(executions) == 1
+    assert results == [['result']] * 10
+    assert single_flight.stats() == {
+        'calls': 10, 'executions': 1, 'collapsed': 9, 'in_flight': 0
+    }
+
+
+def test_errors_are_shared_and_not_cached() -> None:
+    """
+    Test that an error is raised to the caller and the next call runs again.
+    """
+    single_flight = SingleFlight()
+
+    async def failing_fetch():
+        raise RuntimeError("upstream is down")
+
+    async def ok_fetch():
+        return 'ok'
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(single_flight.do('key', failing_fetch))
+
+    assert asyncio.run(single_flight.do('key', ok_fetch)) == 'ok'
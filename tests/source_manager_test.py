@@ -0,0 +1,83 @@
+import asyncio
+import json
+import time
+
+from src.models import Result, Source, SourceManager
+
+"""
+Testing module that verifies the concurrent execution of SourceManager
+"""
+
+
+class FakeSource(Source):
+    """
+    Source that sleeps for `delay` seconds, optionally failing afterwards
+    """
+    def __init__(self, name: str, delay: float = 0.0, fail: bool = False):
+        self.name = name
+        self.delay = delay
+        self.fail = fail
+
+    def connect(self):
+        pass
+
+    async def fetch_async(self):
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("upstream is down")
+
+    def __repr__(self) -> str:
+        return self.name
+
+
+def test_concurrent_run_keeps_order(capsys) -> None:
+    """
+    Test that sources run in parallel and print in the order given.
+    """
+    sources = [FakeSource(f"source-{i}", delay=0.3 - i * 0.1)
+               for i in range(3)]
+    manager = SourceManager(sources, concurrent=True, max_workers=3)
+
+    start = time.perf_counter()
+    manager()
+    elapsed = time.perf_counter() - start
+
+    assert capsys.readouterr().out.split() == \
+           ['source-0', 'source-1', 'source-2']
+    assert elapsed < 0.6
+
+
+def test_concurrent_run_isolates_failures(capsys) -> None:
+    """
+    Test that failing and slow sources don't prevent the others from printing.
+    """
+    sources = [
+        FakeSource("failing", fail=True),
+        FakeSource("slow", delay=1.0),
+        FakeSource("fast"),
+    ]
+    manager = SourceManager(sources, concurrent=True, source_timeout=0.2)
+    manager()
+
+    out = capsys.readouterr().out
+    assert "FakeSource failed [RuntimeError('upstream is down')]" in out
+    assert "FakeSource failed [timed out]" in out
+    assert "fast" in out
+
+
+def test_ndjson_output_streams_in_completion_order(capsys) -> None:
+    """
+    Test that NDJSON mode writes each source as soon as it is done.
+    """
+    class ResultSource(FakeSource):
+        async def fetch_async(self):
+            await super().fetch_async()
+            self.results = [Result(title=self.name, url='https://e.com')]
+            return self.results
+
+    sources = [ResultSource("slow", delay=0.2), ResultSource("fast")]
+    manager = SourceManager(sources, concurrent=True, output_format='ndjson')
+    manager()
+
+    lines = capsys.readouterr().out.splitlines()
+    assert [json.loads(line)['title'] for line in lines] == ['fast', 'slow']
@@ -0,0 +1,35 @@
+from pytest_mock import MockerFixture
+
+from benchmarks.startup import import_times
+from src.reddit_source import RedditSource
+
+"""
+Testing module that keeps single-source CLI runs quick to start
+"""
+
+
+def test_single_source_run_imports_only_its_dependencies() -> None:
+    """
+    Test that a HackerNews run loads neither praw nor feedparser. Its import
+    time is checked by `python -m benchmarks.startup`, as it depends on the
+    machine.
+    """
+    times = import_times(['--hn', '--hn_metric', 'top'])
+
+    assert 'src.hn_source' in times
+    assert not {'praw', 'feedparser', 'src.reddit_source',
+                'src.feeds'} & set(times)
+
+
+def test_reddit_credentials_are_read_when_connecting(
+        mocker: MockerFixture) -> None:
+    """
+    Test that credentials set after the module was imported are used.
+    """
+    mocker.patch.dict('os.environ', {'REDDIT_CLIENT_ID': 'id',
+                                     'REDDIT_CLIENT_SECRET': 'secret'})
+    get_client = mocker.patch('src.reddit_source.get_reddit_client')
+
+    RedditSource(subreddit='python')
+
+    get_client.assert_called_once_with('id', 'secret')
@@ -0,0 +1,112 @@
+import time
+
+from src.models import Result
+from src.store import ArticleStore
+
+"""
+Testing module that verifies the persistent article store
+"""
+
+
+def test_record_returns_only_unseen_articles(tmp_path) -> None:
+    """
+    Test that articles are new only the first time they are recorded, also
+    after reopening the store.
+    """
+    path = str(tmp_path / 'articles.sqlite')
+    store = ArticleStore(path)
+    first_run = [Result('one', 'https://e.com/1', source='hackernews', id='1'),
+                 Result('two', 'https://e.com/2?utm_source=x',
+                        source='medium')]
+    assert store.record(first_run) == first_run
+    store.close()
+
+    store = ArticleStore(path)
+    second_run = [Result('one', 'https://e.com/1', source='hackernews', id='1'),
+                  Result('two', 'https://e.com/2/', source='medium'),
+                  Result('three', 'https://e.com/3', source='medium')]
+
+    assert [result.title for result in store.record(second_run)] == ['three']
+    assert store.count() == 3
+
+
+def test_record_large_batch(tmp_path) -> None:
+    """
+    Test that large batches are written in one go and stay fast.
+    """
+    store = ArticleStore(str(tmp_path / 'articles.sqlite'))
+    results = [Result(f'title {i}', f'https://e.com/{i}', source='reddit',
+                      id=str(i)) for i in range(20000)]
+
+    start = time.perf_counter()
+    assert len(store.record(results)) == 20000
+    assert store.record(results) == []
+
+    assert time.perf_counter() - start < 5
+    assert len(store.since(0, limit=5)) == 5
+    assert store.since(time.time()) == []
+
+
+def test_search_finds_recorded_articles(tmp_path) -> None:
+    """
+    Test that recorded articles are searchable by title, URL and author,
+    by prefix and by source, and that query syntax in the input is ignored.
+    """
+    store = ArticleStore(str(tmp_path / 'articles.sqlite'))
+    store.record([
+        Result('Python 3.13 released', 'https://python.org/news',
+               source='hackernews', id='1', author='guido'),
+        Result('Async Rust', 'https://e.com/rust', source='medium'),
+    ])
+    store.record([Result('Faster Python startup', 'https://e.com/startup',
+                         source='medium')])
+
+    assert [result.title for result in store.search('python released')] \
+        == ['Python 3.13 released']
+    assert [result.title for result in store.search('pyth',
+                                                    order='recent')] \
+        == ['Faster Python startup', 'Python 3.13 released']
+    assert [result.title for result in store.search('python',
+                                                    source='medium')] \
+        == ['Faster Python startup']
+    assert store.search('guido')[0].author == 'guido'
+    assert store.search('rust" OR "python') == []
+    assert store.search('*') == []
+
+
+def test_search_completes_a_partial_last_word(tmp_path) -> None:
+    """
+    Test that the last word matches as a prefix although the index stems
+    words, while whole words still match their other forms.
+    """
+    store = ArticleStore(str(tmp_path / 'articles.sqlite'))
+    store.record([Result(f'Story {i} about rust async runtimes',
+                         f'https://e.com/{i}', source='hackernews')
+                  for i in range(4)])
+
+    assert len(store.search('rust asy')) == 4
+    assert len(store.search('rust asy', order='recent')) == 4
+    assert len(store.search('rust async')) == 4
+    assert len(store.search('runtime')) == 4
+    assert len(store.search('runtime rust')) == 4
+    assert store.search('rust asyncio') == []
+
+
+def test_search_indexes_existing_store(tmp_path) -> None:
+    """
+    Test that articles recorded before the search index existed are indexed
+    when the store is opened.
+    """
+    path = str(tmp_path / 'articles.sqlite')
+    store = ArticleStore(path)
+    store.record([Result('Old article', 'https://e.com/old',
+                         source='aws')])
+    store.connection.execute("DROP TABLE articles_search")
+    store.connection.execute("DROP TABLE articles_words")
+    store.close()
+
+    store = ArticleStore(path)
+    assert [result.url for result in store.search('old')] == \
+        ['https://e.com/old']
+    assert [result.url for result in store.search('artic')] == \
+        ['https://e.com/old']
@@ -0,0 +1,140 @@
+import random
+
+from fastapi.testclient import TestClient
+from pytest_mock import MockerFixture
+
+import api
+from src.dedup import Deduplicator
+from src.models import Result, Source, SourceManager
+from src.timeline import RANKINGS, normalized_scores, rank_decayed, top_k
+
+"""
+Testing module that verifies the merged timeline across sources
+"""
+
+NOW = 1700000000.0
+
+
+def make_results(source: str, count: int, seed: int) -> list:
+    rng = random.Random(seed)
+    return [Result(f"{source} {i}", f"https://example.com/{source}/{i}",
+                   source=source, published=NOW - rng.uniform(0, 86400 * 3),
+                   score=rng.randint(0, 1000) if seed % 2 else None)
+            for i in range(count)]
+
+
+def test_top_k_matches_sorting_everything() -> None:
+    """
+    Test that the merge picks the same results as ranking the whole union.
+    """
+    streams = [make_results(f"source{i}", 300, i) for i in range(10)]
+
+    for ranking in RANKINGS.values():
+        keyed = [(key, result) for stream in streams
+                 for key, result in zip(ranking(stream, NOW), stream)]
+        keyed.sort(key=lambda pair: pair[0], reverse=True)
+
+        assert top_k(streams, 50, ranking, now=NOW) == \
+               [result for _, result in keyed[:50]]
+
+
+def test_scores_are_normalized_per_source() -> None:
+    """
+    Test that a source with small scores competes with a popular one, and
+    that sources without scores rank by their own order.
+    """
+    small = [Result('a', 'u', score=10), Result('b', 'u', score=5)]
+    big = [Result('c', 'u', score=1000), Result('d', 'u', score=500)]
+    unscored = [Result('e', 'u'), Result('f', 'u')]
+
+    assert normalized_scores(small) == normalized_scores(big) == [1.0, 0.5]
+    assert normalized_scores(unscored) == [1.0, 0.5]
+
+
+def test_decay_favours_recent_results() -> None:
+    """
+    Test that of two equally scored results the older one ranks lower,
+    halving every half-life.
+    """
+    results = [Result('old', 'u', score=1, published=NOW - 12 * 3600),
+               Result('new', 'u', score=1, published=NOW)]
+
+    assert rank_decayed(results, NOW) == [0.5, 1.0]
+
+
+def test_dedup_keeps_looking_past_duplicates() -> None:
+    """
+    Test that duplicates across sources are dropped and replaced by the
+    next best results.
+    """
+    first = [Result('Same story everywhere today', 'https://example.com/1',
+                    score=10, published=NOW),
+             Result('Another', 'https://example.com/2', score=5,
+                    published=NOW)]
+    second = [Result('Same story everywhere today', 'https://example.com/1',
+                     score=10, published=NOW),
+              Result('Third one', 'https://example.com/3', score=1,
+                     published=NOW)]
+
+    timeline = top_k([first, second], 3, RANKINGS['score'], Deduplicator(),
+                     now=NOW)
+
+    assert [result.url for result in timeline] == \
+           ['https://example.com/1', 'https://example.com/2',
+            'https://example.com/3']
+
+
+class StaticSource(Source):
+    """
+    Source returning fixed results
+    """
+    def __init__(self, results: list) -> None:
+        self.results = results
+
+    def connect(self):
+        pass
+
+    async def fetch_async(self):
+        return self.results
+
+
+def test_source_manager_prints_one_timeline(capsys) -> None:
+    """
+    Test that timeline mode prints the merged results once, not per source.
+    """
+    sources = [StaticSource(make_results('a', 5, 1)),
+               StaticSource(make_results('b', 5, 3))]
+    manager = SourceManager(sources, timeline_size=4, ranking='score',
+                            output_format='ndjson')
+
+    manager()
+
+    lines = capsys.readouterr().out.splitlines()
+    assert len(lines) == 4
+
+
+def test_timeline_endpoint(mocker: MockerFixture) -> None:
+    """
+    Test that /timeline merges the cached results of every source.
+    """
+    results = {
+        ('hackernews', ('top',)): make_results('hackernews', 20, 1),
+        ('medium', ('python',)): make_results('medium', 20, 2),
+    }
+
+    async def fetch_cached(source_type, params, limit, create_source):
+        return results[(source_type, params)], 0.0
+
+    mocker.patch('api.fetch_cached', fetch_cached)
+
+    response = TestClient(api.app).get(
+        '/timeline?sources=hn:top&sources=medium:python&k=10&rank=recent')
+
+    body = response.json()
+    assert response.status_code == 200
+    assert len(body['posts']) == 10
+    published = [post['published'] for post in body['posts']]
+    assert published == sorted(published, reverse=True)
+    assert body['missing'] == []
+    assert TestClient(api.app).get(
+        '/timeline?sources=hn:top&rank=best').status_code == 400
@@ -0,0 +1,109 @@
+import asyncio
+
+import httpx
+import pytest
+from pytest_mock import MockerFixture
+
+from src.upstream import CircuitOpenError, RetryPolicy, TokenBucket, \
+    Upstreams
+
+"""
+Testing module that verifies rate limiting and retries of upstream calls
+"""
+
+
+def test_retries_throttled_requests(mocker: MockerFixture) -> None:
+    """
+    Test that 429 and 5xx answers are retried, honoring Retry-After.
+    """
+    statuses = [429, 503, 200]
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(statuses.pop(0), headers={'Retry-After': '0'})
+
+    mocker.patch('src.upstream.get_async_client',
+                 return_value=httpx.AsyncClient(
+                     transport=httpx.MockTransport(handler)))
+    upstreams = Upstreams()
+
+    response = asyncio.run(upstreams.get('https://example.com/feed'))
+
+    assert response.status_code == 200
+    assert upstreams.to_dict()['example.com'] == {
+        'requests': 3, 'throttled': 1, 'retries': 2, 'failures': 0,
+        'waited': 0.0, 'circuit': 'closed', 'rejected': 0
+    }
+
+
+def test_gives_up_after_max_attempts(mocker: MockerFixture) -> None:
+    """
+    Test that the last failed response is returned once retries run out.
+    """
+    mocker.patch('src.upstream.get_async_client',
+                 return_value=httpx.AsyncClient(transport=httpx.MockTransport(
+                     lambda request: httpx.Response(500))))
+    upstreams = Upstreams(retry_policy=RetryPolicy(max_attempts=2,
+                                                   base_delay=0))
+
+    response = asyncio.run(upstreams.get('https://example.com/feed'))
+
+    assert response.status_code == 500
+    assert upstreams.to_dict()['example.com']['failures'] == 1
+
+
+def test_retry_after_beyond_limit_is_not_retried() -> None:
+    """
+    Test that we don't wait for a Retry-After longer than allowed.
+    """
+    policy = RetryPolicy(max_retry_after=10)
+
+    assert policy.delay(1, '5') == 5
+    assert policy.delay(1, '120') is None
+    assert 0.5 <= policy.delay(2) <= 1.0
+
+
+def test_token_bucket_spaces_out_bursts() -> None:
+    """
+    Test that calls beyond the burst have to wait for tokens to refill.
+    """
+    bucket = TokenBucket(rate=10, burst=2)
+
+    waits = [bucket.reserve() for _ in range(4)]
+
+    assert waits[:2] == [0, 0]
+    assert 0.05 < waits[2] <= 0.1
+    assert 0.15 < waits[3] <= 0.2
+
+
+def test_circuit_opens_and_recovers(mocker: MockerFixture) -> None:
+    """
+    Test that a failing host is rejected without being called until the
+    reset timeout, then probed once and closed again on success.
+    """
+    calls = []
+    healthy = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(1)
+        return httpx.Response(200 if healthy else 503)
+
+    mocker.patch('src.upstream.get_async_client',
+                 return_value=httpx.AsyncClient(
+                     transport=httpx.MockTransport(handler)))
+    upstreams = Upstreams(retry_policy=RetryPolicy(max_attempts=1),
+                          failure_threshold=2, reset_timeout=60)
+    url = 'https://example.com/feed'
+
+    for _ in range(2):
+        asyncio.run(upstreams.get(url))
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(upstreams.get(url))
+    assert len(calls) == 2
+
+    healthy.append(True)
+    breaker = upstreams.breakers['example.com']
+    breaker.opened_at -= 60
+
+    assert asyncio.run(upstreams.get(url)).status_code == 200
+    assert breaker.state == 'closed'
+    assert upstreams.to_dict()['example.com']['rejected'] == 1